@@ -0,0 +1,90 @@
+"""多账号配置
+
+--accounts 指定的 JSON 文件将主域名映射到服务商及凭证, 每个凭证只创建一个长期复用的 client:
+    {
+        "profiles": {
+            "ali-main": {"provider": "aliyun", "secret_id": "xxxx", "secret_key": "xxxx", "qps": 10},
+            "pod-a": {"provider": "dnspod", "secret_id_env": "POD_A_ID", "secret_key_env": "POD_A_KEY"}
+        },
+        "zones": {"example.com": "ali-main", "example.org": "pod-a"},
+        "default": "ali-main"
+    }
+凭证可以直接写在文件中, 也可以通过 secret_id_env / secret_key_env 指定从哪个环境变量读取。
+zones 中没有列出的主域名使用 default 账号, 未指定 default 时使用命令行参数中的服务商及凭证。
+"""
+import os
+import json
+import threading
+
+from collections import namedtuple
+from typing import Callable, Dict, List, Tuple
+
+Profile = namedtuple("Profile", ["name", "provider", "secret_id", "secret_key", "qps"])
+
+# 使用命令行参数中的服务商及凭证的账号名
+CLI_PROFILE = "default"
+
+
+def _secret(name: str, config: dict, field: str) -> str:
+    if config.get(f"{field}_env"):
+        value = os.environ.get(config[f"{field}_env"])
+        if not value:
+            raise ValueError(f"账号 {name} 的环境变量 {config[f'{field}_env']} 未设置")
+        return value
+    if not config.get(field):
+        raise ValueError(f"账号 {name} 缺少 {field}")
+    return config[field]
+
+
+def load_accounts(filename: str, providers: List[str]) -> Tuple[Dict[str, Profile], Dict[str, str], str]:
+    """读取多账号配置, 返回 (账号, 主域名对应的账号名, 默认账号名)"""
+    with open(filename, encoding="utf-8") as f:
+        config = json.load(f)
+    profiles = {}
+    for name, profile in (config.get("profiles") or {}).items():
+        if profile.get("provider") not in providers:
+            raise ValueError(f"账号 {name} 的服务商不正确: {profile.get('provider')}, 仅支持: {' | '.join(providers)}")
+        profiles[name] = Profile(name, profile["provider"], _secret(name, profile, "secret_id"), _secret(name, profile, "secret_key"), profile.get("qps"))
+    zones = config.get("zones") or {}
+    default = config.get("default") or CLI_PROFILE
+    for zone, name in zones.items():
+        if name not in profiles and name != CLI_PROFILE:
+            raise ValueError(f"主域名 {zone} 的账号 {name} 不存在")
+    if default not in profiles and default != CLI_PROFILE:
+        raise ValueError(f"默认账号 {default} 不存在")
+    return profiles, zones, default
+
+
+class ClientPool:
+    """按账号缓存 client, factory(profile) 在第一次使用某个账号时调用一次, 返回值在之后的同步中复用
+
+    >>> pool = ClientPool(profiles, zones, default, factory=lambda profile: get_backend(profile.provider)(profile.secret_id, profile.secret_key))
+    >>> for profile, client, domains in pool.route(all_domains): ...
+    """
+
+    def __init__(self, profiles: Dict[str, Profile], zones: Dict[str, str], default: str, factory: Callable[[Profile], object]):
+        self.profiles = profiles
+        self.zones = zones
+        self.default = default
+        self._factory = factory
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str):
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = self._factory(self.profiles[name])
+            return self._clients[name]
+
+    def profile_for(self, zone: str) -> Profile:
+        name = self.zones.get(zone, self.default)
+        if name not in self.profiles:
+            raise ValueError(f"主域名 {zone} 没有可用的账号, 请在账号配置中指定或提供命令行凭证")
+        return self.profiles[name]
+
+    def route(self, domains: dict) -> List[tuple]:
+        """按账号拆分域名信息, 返回 [(账号, client, 该账号的域名信息)]"""
+        grouped: Dict[str, dict] = {}
+        for zone, sub_domains in domains.items():
+            grouped.setdefault(self.profile_for(zone).name, {})[zone] = sub_domains
+        return [(self.profiles[name], self.get(name), zones) for name, zones in grouped.items()]
@@ -0,0 +1,160 @@
+"""cf2dns 性能基准
+
+使用内存中的 FakeDnsApi 及本地模拟的优选 IP 接口, 对不同规模的合成域名配置执行完整同步,
+输出每次同步的耗时、各类接口调用次数、错误次数及内存峰值, 不需要服务商凭证。
+
+使用示例:
+    # 10 / 100 / 1000 个子域名, 每次接口调用延迟 10ms, "--" 之后的参数原样传给 cf2dns
+    $ python bench.py --sizes 10,100,1000 --latency 0.01 -- --snapshot --workers 8
+
+    # 第二次同步为稳态(记录已存在), 对比两次的接口调用次数
+    $ python bench.py --sizes 1000 --runs 2 -- --snapshot --state /tmp/cf2dns-bench.db
+
+    # 异步接口: 通过本地模拟的 DNSPod / 阿里云 HTTP 接口(校验签名)同步, 对比线程池与单线程事件循环
+    $ python bench.py --sizes 1000 --latency 0.05 --async dnspod -- --concurrency 200
+"""
+import sys
+import json
+import time
+import asyncio
+import random
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cf2dns
+from dns import RecordStore, get_async_backend
+from dns.aio import AsyncHttpClient
+from dns.retry import RetryPolicy
+from dns.fake import FakeClient, FakeDnsApi, serve_fake_api
+from ipcache import IpCache
+
+
+def fake_ips(ip_version: str, count: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    info = {}
+    for line in cf2dns.RECORD_LINE:
+        if ip_version == "v6":
+            ips = [f"2606:4700::{rnd.randrange(1, 0xffff):x}" for _ in range(count)]
+        else:
+            ips = [f"104.{rnd.randrange(16, 32)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}" for _ in range(count)]
+        info[line] = [{"ip": ip, "colo": "Default", "latency": rnd.randrange(50, 300)} for ip in dict.fromkeys(ips)]
+    return info
+
+
+class HostmonitHandler(BaseHTTPRequestHandler):
+    """模拟 api.hostmonit.com/get_optimization_ip 接口, 每次请求的候选 IP 集合由 server.seed 决定"""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        data = {"code": 200, "total": 0, "info": fake_ips(body.get("type", "v4"), self.server.ip_count, self.server.seed)}
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_hostmonit(ip_count: int = 10, seed: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), HostmonitHandler)
+    server.ip_count = ip_count
+    server.seed = seed
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def synthetic_domains(size: int, lines: list, per_zone: int = 500) -> dict:
+    """生成 size 个子域名, 每个主域名最多 per_zone 个子域名"""
+    domains = {}
+    for i in range(size):
+        domains.setdefault(f"zone{i // per_zone}.example", {})[f"host{i}"] = lines
+    return domains
+
+
+async def sync_async(provider: str, api_server, domains: dict, cf2dns_args, cache: IpCache) -> list:
+    """每次同步使用新的事件循环及连接池, 与 cf2dns --async 相同"""
+    http = AsyncHttpClient(max_connections=cf2dns_args.concurrency)
+    cloud = get_async_backend(provider)("fake-id", "fake-key", endpoint=f"http://127.0.0.1:{api_server.server_port}/", http=http)
+    cloud.set_rate_limit(cf2dns_args.qps or 1e9)
+    cloud.set_retry(RetryPolicy(retries=cf2dns_args.retries, budget=cf2dns_args.retry_budget))
+    try:
+        await cloud.preload_metadata(list(domains))
+        return await cf2dns.sync_async(cloud, domains, cf2dns_args, cache, http)
+    finally:
+        await http.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="cf2dns 性能基准", formatter_class=argparse.RawTextHelpFormatter, epilog=__doc__)
+    parser.add_argument("--sizes", default="10,100,1000", help="子域名数量, 逗号分隔, 默认 10,100,1000")
+    parser.add_argument("--lines", default="CM,CU,CT", help="每个子域名的解析线路, 逗号分隔, 默认 CM,CU,CT")
+    parser.add_argument("--runs", type=int, default=1, help="每个规模连续同步的次数, 第二次起为稳态同步, 默认 1")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟的每次接口调用延迟秒数, 默认 0")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟的临时性错误概率, 默认 0")
+    parser.add_argument("--page-size", type=int, default=200, help="模拟的分页大小, 默认 200")
+    parser.add_argument("--server-qps", type=float, default=None, help="模拟的服务端每秒请求数限制, 默认不限制")
+    parser.add_argument("--ip-count", type=int, default=10, help="每条线路的候选 IP 数量, 默认 10")
+    parser.add_argument("--rotate", action="store_true", default=False, help="每次同步更换候选 IP 集合")
+    parser.add_argument("--async", dest="async_provider", choices=["dnspod", "aliyun"], default=None, help="使用该服务商的异步接口及本地模拟的 HTTP 接口")
+    parser.add_argument("cf2dns_args", nargs="*", help="传给 cf2dns 的参数, 放在 -- 之后")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.getLogger("cf2dns.log").setLevel(logging.WARNING)
+    server = start_hostmonit(args.ip_count)
+    cf2dns.HOSTMONIT_URL = f"http://127.0.0.1:{server.server_port}/get_optimization_ip"
+    lines = args.lines.split(",")
+
+    print(f"{'size':>8} {'run':>4} {'wall(s)':>9} {'peak(MB)':>9} {'ok':>7} {'failed':>7}  calls / errors")
+    for size in (int(size) for size in args.sizes.split(",")):
+        if args.async_provider:
+            cloud = FakeClient(latency=args.latency, error_rate=args.error_rate, qps=args.server_qps, seed=size)
+            api_server = serve_fake_api(cloud)
+        else:
+            cloud = FakeDnsApi(latency=args.latency, error_rate=args.error_rate, page_size=args.page_size, qps=args.server_qps, seed=size)
+        domains = synthetic_domains(size, lines)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cf2dns_args = cf2dns.parse_args([args.async_provider or "dnspod", "-4", "-d", "{}", "--cache-dir", cache_dir, "--cache-ttl", "0", *args.cf2dns_args])
+            if not args.async_provider:
+                cloud.set_rate_limit(cf2dns_args.qps or 1e9)
+            cache = IpCache(cache_dir, ttl=0)
+            store = None
+            if cf2dns_args.state:
+                store = RecordStore(cf2dns_args.state, cloud, namespace=f"bench-{size}")
+            for run in range(1, args.runs + 1):
+                server.seed = run if args.rotate else 0
+                cloud.calls.clear()
+                cloud.errors.clear()
+                tracemalloc.start()
+                start = time.perf_counter()
+                if args.async_provider:
+                    results = asyncio.run(sync_async(args.async_provider, api_server, domains, cf2dns_args, cache))
+                else:
+                    results = cf2dns.sync(cloud, domains, cf2dns_args, cache, store)
+                wall = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                failed = sum(1 for result in results if not result.ok)
+                calls = " ".join(f"{name}={count}" for name, count in sorted(cloud.calls.items()))
+                errors = " ".join(f"{name}={count}" for name, count in sorted(cloud.errors.items()))
+                print(f"{size:>8} {run:>4} {wall:>9.3f} {peak / 1024 / 1024:>9.1f} {len(results) - failed:>7} {failed:>7}  {calls} / {errors or '-'}")
+            if store is not None:
+                store.close()
+        if args.async_provider:
+            api_server.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
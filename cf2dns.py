@@ -1,20 +1,46 @@
+import time
+
+STARTUP = time.perf_counter()
+
 import os
 import sys
 import json
 import random
+import asyncio
+import signal
 import argparse
+import threading
 
-import requests
-
-from collections import namedtuple
-from dns import AliApi, DnsPodApi
-from log import get_logger
+from functools import partial
+from collections import namedtuple, Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dns import ZoneSnapshot, SubDomainSnapshot, AsyncSubDomainSnapshot, RecordStore, MetadataCache, available, get_async_backend, get_backend
+from dns.aio import AsyncHttpClient
+from dns.registry import LOAD_STATS
+from dns.retry import RetryPolicy, CircuitBreaker
+from dns.plan import CREATE, UPDATE, DELETE, Change, assign_values, select_values, plan_changes, apply_change, describe
+from log import Lazy, configure as configure_logger, get_logger, log_level
+from shard import Lease, build_summary, parse_shard, shard_domains
+from sources import SOURCES, parse_source, merge_sources
+from probe import HealthTracker, probe_ips, rank_ips
+from accounts import CLI_PROFILE, ClientPool, Profile, load_accounts
+from config import CompiledConfig, read_config
+from history import IpHistory
+from ipcache import IpCache, atomic_write, read_json, fingerprint, candidate_fingerprint
+from metrics import METRICS, instrument, serve as serve_metrics
 
 # 可以从 https://shop.hostmonit.com 获取
 KEY = os.environ.get("KEY","o1zrmHAF")
+HOSTMONIT_URL = os.environ.get("HOSTMONIT_URL", "https://api.hostmonit.com/get_optimization_ip")
 
 RECORD_LINE = {"CM": "移动", "CU": "联通", "CT": "电信", "AB": "境外", "DEF": "默认"}
-DNS_API = {"aliyun": AliApi, "dnspod": DnsPodApi}
+DNS_API = available()
+# 各服务商 API 默认每秒请求数限制
+API_QPS = {"aliyun": 10, "dnspod": 20}
+# 优选 IP 接口连续失败 3 次后熔断 10 分钟, 期间使用缓存
+HOSTMONIT_BREAKER = CircuitBreaker(failure_threshold=3, reset_timeout=600)
+
+Result = namedtuple("Result", ["domain", "sub_domain", "record_type", "line", "ok", "error", "changes"])
 
 logger = get_logger("cf2dns.log", level="debug")
 
@@ -26,6 +52,9 @@ epilog_info = """
     # 通过阿里云 API 为域名 shop.example.com 和 stock.example.com 添加 CM:移动 CU:联通 CT:电信 线路 AAAA 记录解析
     $ %s aliyun -6 -i xxxx -k xxxxx -d '{"example.com": {"shop": ["CM", "CU", "CT"], "stock": ["CM", "CU", "CT"]}}'
 
+    # 同时添加 A 和 AAAA 记录解析, 并发获取两组优选 IP, 每个子域名只读取一次解析记录
+    $ %s aliyun -4 -6 -i xxxx -k xxxxx -d '{"example.com": {"shop": ["CM", "CU", "CT"], "stock": ["CM", "CU", "CT"]}}'
+
     # 从文件中获取域名信息
     $ cat example.json
     {"example.com": {"shop": ["CM", "CU", "CT"], "stock": ["CM", "CU", "CT"]}}
@@ -36,14 +65,16 @@ epilog_info = """
     $ export DOMAIN_INFO='{"wglee.org": {"shop": ["CM", "CU", "CT"], "stock": ["CM", "CU", "CT"]}}'
     $ %s aliyun -4 -i xxxx -k xxxxx
 
-""" % (sys.argv[0], sys.argv[0], sys.argv[0], sys.argv[0])
+""" % (sys.argv[0], sys.argv[0], sys.argv[0], sys.argv[0], sys.argv[0])
+
+def get_optimization_ip(key=None, ip_version="v4", timeout=10):
+    import requests  # 使用缓存时不需要导入
 
-def get_optimization_ip(key=None, ip_version="v4"):
     try:
         headers = headers = {"Content-Type": "application/json"}
         data = {"key": key or KEY, "type": ip_version}
         response = requests.post(
-            "https://api.hostmonit.com/get_optimization_ip", json=data, headers=headers
+            HOSTMONIT_URL, json=data, headers=headers, timeout=timeout
         )
         if response.status_code == 200:
             return response.json()
@@ -54,44 +85,399 @@ def get_optimization_ip(key=None, ip_version="v4"):
         logger.error(f"CHANGE OPTIMIZATION IP ERROR, {str(e)}")
         return None
 
-def change_dns(cloud, domain, sub_domain, record_type, lines, cf_ips, record_num):
-    for line in lines:
-        ip_list = cf_ips.get(line)
-        record_id_list = cloud.get_record(domain=domain, sub_domain=sub_domain, record_type=record_type, line=RECORD_LINE.get(line))
-        record_ip_list = [record.value for record in record_id_list]
-        if record_id_list:
-            for record, ip in zip(record_id_list, random.sample(ip_list, record_num)):
-                if ip.get("ip") in record_ip_list:
-                    logger.info(f"跳过，记录值存在，域名: {sub_domain}.{domain} 记录: {record_type} 值: {ip.get('ip')} 线路: {RECORD_LINE.get(line)} 记录ID: {record.record_id}")
-                    continue
-                logger.info(f"更新记录: {sub_domain}.{domain} 记录: {record_type} 值: {ip.get('ip')} 线路: {RECORD_LINE.get(line)} 记录ID: {record.record_id}")
-                cloud.change_record(
-                    domain=domain, record_id=record.record_id, sub_domain=sub_domain, value=ip.get('ip'), record_type=record_type, line=RECORD_LINE.get(line)
-                )
+async def get_optimization_ip_async(http, key=None, ip_version="v4", timeout=10):
+    """get_optimization_ip 的协程版本, 通过 dns.aio.AsyncHttpClient 请求"""
+    try:
+        body = json.dumps({"key": key or KEY, "type": ip_version}).encode("utf-8")
+        response = await asyncio.wait_for(http.request("POST", HOSTMONIT_URL, {"Content-Type": "application/json"}, body), timeout)
+        if response.status == 200:
+            return json.loads(response.body)
         else:
-            for ip in random.sample(ip_list, record_num):
-                logger.info(f"创建记录: {sub_domain}.{domain} 记录: {record_type} 值: {ip.get('ip')} 线路: {RECORD_LINE.get(line)}")
-                cloud.create_record(
-                    domain=domain, sub_domain=sub_domain, value=ip.get('ip'), record_type=record_type, line=RECORD_LINE.get(line)
-                )
+            logger.error("CHANGE OPTIMIZATION IP ERROR, REQUEST STATUS CODE IS NOT 200")
+            return None
+    except Exception as e:
+        logger.error(f"CHANGE OPTIMIZATION IP ERROR, {str(e)}")
+        return None
+
+def fetch_hostmonit(cache, ip_version, breaker=HOSTMONIT_BREAKER):
+    def fetch():
+        if not breaker.allow():
+            logger.warning(f"优选 IP 接口连续失败, 已熔断, 跳过请求, 类型: {ip_version}")
+            return None
+        with METRICS.timer("cf2dns_hostmonit_request_seconds", ip_version=ip_version):
+            data = get_optimization_ip(ip_version=ip_version)
+        ok = bool(data and data.get("info"))
+        if not ok:
+            METRICS.inc("cf2dns_hostmonit_errors_total", ip_version=ip_version)
+        breaker.record(ok)
+        return data
+
+    return cache.get(KEY, ip_version, fetch)
+
+def build_sources(args, cache) -> list:
+    """根据 --ip-source 创建候选 IP 来源, 只使用优选 IP 接口且不限制数量时返回 None"""
+    if args.ip_source is None and args.max_candidates is None:
+        return None
+    hostmonit = partial(fetch_hostmonit, cache)
+    return [parse_source(spec, hostmonit, args.source_lines.split(",")) for spec in args.ip_source or ["hostmonit"]]
+
+def fetch_candidates(cache, ip_version, sources=None, cap=None, deadline=30):
+    """获取候选 IP, 提供 sources 时合并所有来源, 每条线路最多 cap 个"""
+    with METRICS.timer("cf2dns_phase_seconds", phase="fetch"):
+        if sources is None:
+            return fetch_hostmonit(cache, ip_version)
+        return merge_sources(sources, ip_version, cap, deadline)
+
+async def fetch_candidates_async(cache, ip_version, http, sources=None, cap=None, deadline=30, breaker=HOSTMONIT_BREAKER):
+    """fetch_candidates 的协程版本, 只使用优选 IP 接口时通过 http 异步请求, 有多个来源时在线程中合并"""
+    if sources is not None:
+        return await asyncio.to_thread(fetch_candidates, cache, ip_version, sources, cap, deadline)
+
+    async def fetch():
+        if not breaker.allow():
+            logger.warning(f"优选 IP 接口连续失败, 已熔断, 跳过请求, 类型: {ip_version}")
+            return None
+        with METRICS.timer("cf2dns_hostmonit_request_seconds", ip_version=ip_version):
+            data = await get_optimization_ip_async(http, ip_version=ip_version)
+        ok = bool(data and data.get("info"))
+        if not ok:
+            METRICS.inc("cf2dns_hostmonit_errors_total", ip_version=ip_version)
+        breaker.record(ok)
+        return data
+
+    with METRICS.timer("cf2dns_phase_seconds", phase="fetch"):
+        return await cache.aget(KEY, ip_version, fetch)
+
+def probe_options(args) -> dict:
+    return dict(
+        concurrency=args.probe_concurrency,
+        deadline=args.probe_deadline,
+        port=args.probe_port,
+        count=args.probe_count,
+        timeout=args.probe_timeout,
+        host=args.probe_host,
+        path=args.probe_path,
+        max_bytes=args.probe_bytes,
+    )
+
+def rank_candidates(cf_ips, args, history=None) -> dict:
+    """并发测试所有候选 IP, 按测试结果对每条线路的候选 IP 排序
 
-def validate_json(data: str) -> bool:
+    提供 history 时, 近期已多次测试过的 IP 不再测试, 排序使用历史探测结果的衰减加权得分。
+    """
+    ips = list(dict.fromkeys(ip.get("ip") for ip_list in cf_ips.values() for ip in ip_list))
+    stale = set(ips)
+    if history is not None:
+        stale = set()
+        for line, ip_list in cf_ips.items():
+            line_ips = [ip.get("ip") for ip in ip_list]
+            stale.update(set(line_ips) - set(history.confident(line, line_ips, args.history_fresh, args.history_confidence)))
+    logger.info(f"开始测试候选 IP, 共 {len(ips)} 个, 历史得分可信跳过 {len(ips) - len(stale)} 个")
+    with METRICS.timer("cf2dns_phase_seconds", phase="probe"):
+        probes = probe_ips([ip for ip in ips if ip in stale], **probe_options(args))
+    ranked = {}
+    for line, ip_list in cf_ips.items():
+        ip_map = {ip.get("ip"): ip for ip in ip_list}
+        line_probes = probes
+        if history is not None:
+            history.record_probes(line, [probes[ip] for ip in ip_map if ip in probes])
+            line_probes = {**probes, **history.scores(line, list(ip_map))}
+        order = rank_ips(list(ip_map), line_probes)
+        if not order:
+            logger.warning(f"线路: {RECORD_LINE.get(line, line)} 没有测试通过的 IP, 保持原顺序")
+            ranked[line] = ip_list
+            continue
+        ranked[line] = [ip_map[ip] for ip in order]
+        for ip in order[:5]:
+            probe = line_probes[ip]
+            logger.debug(
+                "线路: %s IP: %s 延迟: %.1fms 丢包: %.0f%% 下载速度: %.0fB/s", RECORD_LINE.get(line, line), ip, probe.latency, probe.loss * 100, probe.throughput or 0,
+                extra={"line": line, "value": ip, "latency": probe.latency},
+            )
+    return ranked
+
+def read_records(cloud, domain, sub_domain, record_type, line, snapshot=None, store=None):
+    """优先从本地状态库读取解析记录, 状态库中没有或已过期时从快照或服务商读取, 返回 (解析记录, 是否来自状态库)"""
+    with METRICS.timer("cf2dns_phase_seconds", phase="read"):
+        return _read_records(cloud, domain, sub_domain, record_type, line, snapshot, store)
+
+def exact_records(records, sub_domain) -> list:
+    """只保留子域名完全相同的记录, 阿里云按关键字模糊匹配子域名(RRKeyWord), 读取 shop 时会返回 shop2、myshop 的记录"""
+    return [record for record in records if record.sub_domain == sub_domain]
+
+def _read_records(cloud, domain, sub_domain, record_type, line, snapshot=None, store=None):
+    if store is not None:
+        records = store.get_record(domain=domain, sub_domain=sub_domain, record_type=record_type, line=line)
+        if records is not None:
+            return records, True
+    records = exact_records((snapshot or cloud).get_record(domain=domain, sub_domain=sub_domain, record_type=record_type, line=line), sub_domain)
+    if store is not None:
+        store.replace(domain, sub_domain, record_type, line, records)
+    return records, False
+
+def change_fields(change, **fields) -> dict:
+    """JSON 行日志中变更的结构化字段"""
+    return {
+        "domain": change.domain,
+        "sub_domain": change.sub_domain,
+        "record_type": change.record_type,
+        "line": change.line,
+        "action": change.action,
+        "value": change.value or change.old_value,
+        **fields,
+    }
+
+def apply_changes(cloud, changes, store=None) -> None:
+    """逐条执行变更, 写入成功的变更在最后(包括中途失败时)一次性更新到本地状态库"""
+    applied = []
     try:
-        json.loads(data)
-        return True
-    except ValueError:
-        return False
-
-def validate_file(filename: str) -> bool:
-    if not os.path.exists(filename):
-        return False
+        for change in changes:
+            start = time.perf_counter()
+            with METRICS.timer("cf2dns_phase_seconds", phase="write"):
+                result = apply_change(cloud, change)
+            logger.info("%s", Lazy(describe, change), extra=change_fields(change, latency=time.perf_counter() - start))
+            if not result:
+                raise RuntimeError(f"写入失败, {describe(change)}")
+            applied.append((change, result))
+    finally:
+        if store is not None and applied:
+            store.apply_many(applied)
+
+def plan_line(cloud, domain, sub_domain, record_type, line, cf_ips, record_num, snapshot=None, ttl=None, ranked=False, store=None, values=None):
+    """读取 (主域名, 子域名, 线路) 的现有解析记录并计算变更, 返回 (变更列表, 现有记录是否来自状态库)
+
+    values 为统一分配阶段给出的目标记录值, 为 None 时从候选 IP 中挑选。
+    """
+    ip_list = cf_ips.get(line)
+    line_name = RECORD_LINE.get(line)
+    if not ip_list:
+        raise ValueError(f"没有线路 {line_name or line} 的候选 IP")
+    records, from_store = read_records(cloud, domain, sub_domain, record_type, line_name, snapshot, store)
+    with METRICS.timer("cf2dns_phase_seconds", phase="plan"):
+        if values is None:
+            values = select_values([ip.get("ip") for ip in ip_list], [record.value for record in records], record_num, ranked)
+        changes = plan_changes(records, values, domain, sub_domain, record_type, line_name, ttl)
+    if not changes:
+        log_unchanged(domain, sub_domain, record_type, line_name, values)
+    return changes, from_store
+
+def log_unchanged(domain, sub_domain, record_type, line_name, values) -> None:
+    logger.info(
+        "跳过，记录值存在，域名: %s.%s 记录: %s 值: %s 线路: %s", sub_domain, domain, record_type, Lazy(", ".join, values), line_name,
+        extra={"domain": domain, "sub_domain": sub_domain, "record_type": record_type, "line": line_name, "action": "skip"},
+    )
+
+def log_failure(domain, sub_domain, record_type, line, error) -> None:
+    logger.error(
+        "执行失败: %s.%s 记录: %s 线路: %s 错误: %s", sub_domain, domain, record_type, RECORD_LINE.get(line), error,
+        extra={"domain": domain, "sub_domain": sub_domain, "record_type": record_type, "line": RECORD_LINE.get(line), "error": str(error)},
+    )
+
+def change_line(cloud, domain, sub_domain, record_type, line, cf_ips, record_num, snapshot=None, ttl=None, plan_only=False, ranked=False, store=None, values=None) -> list:
+    changes, from_store = plan_line(cloud, domain, sub_domain, record_type, line, cf_ips, record_num, snapshot, ttl, ranked, store, values)
+    if plan_only:
+        for change in changes:
+            logger.info("[PLAN] %s", Lazy(describe, change), extra=change_fields(change))
+        return changes
     try:
-        json.load(open(filename))
-        return True
-    except ValueError:
-        return False
+        apply_changes(cloud, changes, store)
+    except (Exception, SystemExit) as e:
+        line_name = RECORD_LINE.get(line)
+        if store is not None:
+            store.invalidate(domain, sub_domain, record_type, line_name)
+        if not from_store:
+            raise
+        # 本地状态与服务商不一致, 重新读取后再执行一次
+        logger.warning(
+            "本地状态可能已过期, 重新读取解析记录: %s.%s 记录: %s 线路: %s 错误: %s", sub_domain, domain, record_type, line_name, e,
+            extra={"domain": domain, "sub_domain": sub_domain, "record_type": record_type, "line": line_name, "error": str(e)},
+        )
+        changes, _ = plan_line(cloud, domain, sub_domain, record_type, line, cf_ips, record_num, None, ttl, ranked, store, values)
+        apply_changes(cloud, changes, store)
+    return changes
 
-def parse_args() -> namedtuple:
+def change_dns(cloud, domain, sub_domain, record_type, lines, cf_ips, record_num, snapshot=None, ttl=None, plan_only=False, ranked=False, store=None):
+    for line in lines:
+        change_line(cloud, domain, sub_domain, record_type, line, cf_ips, record_num, snapshot, ttl, plan_only, ranked, store)
+
+def assign_slots(domains, stacks, args, cache) -> dict:
+    """统一为所有 (主域名, 子域名, 记录类型, 线路) 分配记录值, 均衡各候选 IP 承担的权重, 并尽量保持上次的分配"""
+    weights = (read_json(args.weights) or {}) if args.weights else {}
+    slots = {
+        (domain, sub_domain, record_type, line): float(weights.get(f"{sub_domain}.{domain}", 1))
+        for domain, sub_domains in domains.items()
+        for sub_domain, lines in sub_domains.items()
+        for record_type in stacks
+        for line in lines
+    }
+    candidates = {(record_type, line): [ip.get("ip") for ip in ip_list] for record_type, cf_ips in stacks.items() for line, ip_list in cf_ips.items()}
+    name = fingerprint(KEY, args.dnsserver, *([args.shard] if args.shard else []))[:16]
+    previous = cache.load_assignments(name)
+    assigned = assign_values(slots, candidates, args.record_num, previous, args.assign_tolerance)
+    if not args.plan:
+        cache.save_assignments(name, {**previous, **assigned})
+    return assigned
+
+def keep_lease(leases, domain) -> None:
+    """写入 domain 前续期其租约, 租约已被其他进程接管时抛出 RuntimeError"""
+    if leases and domain in leases:
+        leases[domain].keep()
+
+def apply_in_batches(cloud, results, store=None, leases=None) -> list:
+    """按主域名分组, 通过服务商批量接口执行所有任务的变更, 返回更新执行状态后的任务结果
+
+    leases 为 {主域名: 租约}, 写入每个主域名前续期, 租约已被接管的主域名不再写入。
+    """
+    zones = defaultdict(list)
+    for result in results:
+        for change in result.changes:
+            zones[change.domain].append(change)
+    failed = {}
+    for domain, changes in zones.items():
+        logger.info(f"批量执行变更: {domain} 共 {len(changes)} 条")
+        try:
+            keep_lease(leases, domain)
+        except (RuntimeError, TimeoutError) as e:
+            outcomes = [e] * len(changes)
+        else:
+            with METRICS.timer("cf2dns_phase_seconds", phase="write"):
+                outcomes = cloud.apply_batch(changes)
+        applied, invalid = [], set()
+        for change, outcome in zip(changes, outcomes):
+            key = (change.domain, change.sub_domain, change.record_type, change.line)
+            if isinstance(outcome, BaseException) or not outcome:
+                logger.error("写入失败, %s 错误: %s", Lazy(describe, change), outcome, extra=change_fields(change, error=str(outcome)))
+                failed.setdefault(key, str(outcome or "写入失败"))
+            else:
+                logger.info("%s", Lazy(describe, change), extra=change_fields(change))
+            if key in failed or (change.action == CREATE and outcome is True):
+                # 写入失败或批量接口未返回新记录 ID, 下次从服务商重新读取
+                invalid.add(key)
+            else:
+                applied.append((change, outcome))
+        # 每个主域名的状态更新在一个事务中提交
+        if store is not None:
+            store.apply_many(applied)
+            store.invalidate_many(invalid)
+    updated = []
+    for result in results:
+        key = (result.domain, result.sub_domain, result.record_type, RECORD_LINE.get(result.line))
+        updated.append(result._replace(ok=False, error=failed[key]) if key in failed else result)
+    return updated
+
+def build_units(domains: dict, stacks: dict) -> list:
+    """按 (主域名, 子域名, 记录类型, 线路) 拆分任务"""
+    return [
+        (domain, sub_domain, record_type, line)
+        for domain, sub_domains in domains.items()
+        for sub_domain, lines in sub_domains.items()
+        for record_type in stacks
+        for line in lines
+    ]
+
+def reconcile(cloud, domains, stacks, record_num, snapshot=None, workers=1, ttl=None, plan_only=False, ranked=False, store=None, batch=False, assigned=None, leases=None) -> list:
+    """按 (主域名, 子域名, 记录类型, 线路) 拆分任务执行, workers > 1 时使用线程池并发执行, 返回每个任务的执行结果
+
+    stacks 为 {记录类型: 候选 IP}, 同时包含 A 和 AAAA 时同一子域名的两种记录在一轮中一起处理。
+    batch 为 True 时各任务只计算变更, 全部计算完成后按主域名分组批量写入。
+    assigned 为 assign_slots 的结果, 提供时各任务使用其中的目标记录值。
+    leases 为 {主域名: 租约}, 写入前续期, 租约已被其他进程接管的主域名不再写入。
+    """
+    assigned = assigned or {}
+    units = build_units(domains, stacks)
+
+    def run(unit):
+        domain, sub_domain, record_type, line = unit
+        cf_ips = stacks[record_type]
+        try:
+            if batch and not plan_only:
+                changes, _ = plan_line(cloud, domain, sub_domain, record_type, line, cf_ips, record_num, snapshot, ttl, ranked, store, assigned.get(unit))
+            else:
+                if not plan_only:
+                    keep_lease(leases, domain)
+                changes = change_line(cloud, domain, sub_domain, record_type, line, cf_ips, record_num, snapshot, ttl, plan_only, ranked, store, assigned.get(unit))
+            return Result(domain, sub_domain, record_type, line, True, None, changes)
+        except (Exception, SystemExit) as e:
+            log_failure(domain, sub_domain, record_type, line, e)
+            return Result(domain, sub_domain, record_type, line, False, str(e), [])
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run, units))
+    else:
+        results = [run(unit) for unit in units]
+    if batch and not plan_only:
+        results = apply_in_batches(cloud, results, store, leases)
+    return results
+
+async def reconcile_async(cloud, domains, stacks, record_num, concurrency=100, ttl=None, plan_only=False, ranked=False, assigned=None, leases=None) -> list:
+    """reconcile 的协程版本, cloud 为 AsyncDnsBase, 所有任务在同一个事件循环中并发执行, 同时执行的任务数不超过 concurrency
+
+    与 reconcile 相同, stacks 同时包含 A 和 AAAA 时每个子域名只读取一次解析记录, 写入前续期 leases 中对应主域名的租约。
+    """
+    assigned = assigned or {}
+    slots = asyncio.Semaphore(concurrency)
+    source = AsyncSubDomainSnapshot(cloud) if len(stacks) > 1 else cloud
+
+    async def run(unit):
+        domain, sub_domain, record_type, line = unit
+        line_name = RECORD_LINE.get(line)
+        async with slots:
+            try:
+                ip_list = stacks[record_type].get(line)
+                if not ip_list:
+                    raise ValueError(f"没有线路 {line_name or line} 的候选 IP")
+                with METRICS.timer("cf2dns_phase_seconds", phase="read"):
+                    records = exact_records(await source.get_record(domain=domain, sub_domain=sub_domain, record_type=record_type, line=line_name), sub_domain)
+                with METRICS.timer("cf2dns_phase_seconds", phase="plan"):
+                    values = assigned.get(unit)
+                    if values is None:
+                        values = select_values([ip.get("ip") for ip in ip_list], [record.value for record in records], record_num, ranked)
+                    changes = plan_changes(records, values, domain, sub_domain, record_type, line_name, ttl)
+                if not changes:
+                    log_unchanged(domain, sub_domain, record_type, line_name, values)
+                elif not plan_only and leases:
+                    # 续期可能需要等待租约文件锁, 在线程中执行避免阻塞事件循环
+                    await asyncio.to_thread(keep_lease, leases, domain)
+                for change in changes:
+                    if plan_only:
+                        logger.info("[PLAN] %s", Lazy(describe, change), extra=change_fields(change))
+                        continue
+                    start = time.perf_counter()
+                    with METRICS.timer("cf2dns_phase_seconds", phase="write"):
+                        result = await apply_change(cloud, change)
+                    logger.info("%s", Lazy(describe, change), extra=change_fields(change, latency=time.perf_counter() - start))
+                    if not result:
+                        raise RuntimeError(f"写入失败, {describe(change)}")
+                return Result(domain, sub_domain, record_type, line, True, None, changes)
+            except Exception as e:
+                log_failure(domain, sub_domain, record_type, line, e)
+                return Result(domain, sub_domain, record_type, line, False, str(e), [])
+
+    return list(await asyncio.gather(*(run(unit) for unit in build_units(domains, stacks))))
+
+def report(results: list, record_num: int) -> None:
+    failed = [result for result in results if not result.ok]
+    logger.info(f"执行完成, 共 {len(results)} 个任务, 成功 {len(results) - len(failed)} 个, 失败 {len(failed)} 个")
+    counter = Counter(change.action for result in results for change in result.changes)
+    writes = sum(counter.values())
+    saved = max(len(results) * record_num - writes, 0)
+    logger.info(f"写操作: 创建 {counter[CREATE]} 更新 {counter[UPDATE]} 删除 {counter[DELETE]}, 相比全部重写节省 {saved} 次 API 调用")
+    for result in failed:
+        logger.error("失败: %s.%s 记录: %s 线路: %s 错误: %s", result.sub_domain, result.domain, result.record_type, RECORD_LINE.get(result.line), result.error)
+
+def collect_metrics(results: list, plan_only: bool = False) -> None:
+    for result in results:
+        METRICS.inc("cf2dns_units_total", status="ok" if result.ok else "failed")
+        if plan_only or not result.ok:
+            continue
+        if not result.changes:
+            METRICS.inc("cf2dns_records_total", zone=result.domain, record_type=result.record_type, action="skip")
+        for change in result.changes:
+            METRICS.inc("cf2dns_records_total", zone=result.domain, record_type=result.record_type, action=change.action)
+    METRICS.set("cf2dns_last_sync_timestamp_seconds", time.time())
+
+def parse_args(argv=None) -> namedtuple:
     parser = argparse.ArgumentParser(
         description="Cloudflare CDN ip 优选",
         epilog=epilog_info,
@@ -100,9 +486,9 @@ def parse_args() -> namedtuple:
     parser.add_argument(
         "dnsserver",
         metavar="dnsserver",
-        choices=DNS_API.keys(),
+        choices=DNS_API,
         type=str,
-        help=f"选择域名 DNS 服务商，仅支持: {' | '.join(DNS_API.keys())}",
+        help=f"选择域名 DNS 服务商，仅支持: {' | '.join(DNS_API)}",
     )
     parser.add_argument(
         "-4",
@@ -150,6 +536,203 @@ def parse_args() -> namedtuple:
         default=os.environ.get("SECRET_KEY"),
         help="服务商 API 的凭证的 SecretKey, 默认从系统环境变量中获取，变量名: SECRET_KEY",
     )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        default=False,
+        help="快照模式: 每个主域名只拉取一次全部解析记录, 在内存索引中比对, 减少读接口调用次数",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="",
+        type=int,
+        default=1,
+        help="并发执行的线程数, 按 (主域名, 子域名, 线路) 拆分任务, 默认 1 即串行执行",
+    )
+    parser.add_argument(
+        "--page-workers",
+        metavar="",
+        type=int,
+        default=4,
+        help="分页读取解析记录时的并发请求数, 第一页之后的分页并发读取, 默认 4",
+    )
+    parser.add_argument(
+        "--qps",
+        metavar="",
+        type=float,
+        default=None,
+        help=f"服务商 API 每秒请求数限制, 所有线程共享, 默认: {', '.join(f'{k}={v}' for k, v in API_QPS.items())}",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        default=False,
+        help="常驻运行, 按 --interval 间隔定时同步, 收到 SIGHUP 信号时重新加载域名信息, 收到 SIGTERM/SIGINT 信号时在当前同步完成后退出",
+    )
+    parser.add_argument("--interval", metavar="", type=int, default=3600, help="常驻模式的同步间隔秒数, 默认 3600")
+    parser.add_argument("--jitter", metavar="", type=int, default=60, help="常驻模式每次同步间隔增加的随机秒数上限, 默认 60")
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        default=False,
+        help="输出启动阶段各部分耗时: 模块导入、服务商 SDK 导入及 client 初始化",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="",
+        default=None,
+        help="每次同步完成后将指标以 Prometheus 文本格式写入该文件, 可配合 node_exporter textfile collector 使用",
+    )
+    parser.add_argument("--metrics-port", metavar="", type=int, default=None, help="常驻模式下通过该端口的 HTTP /metrics 输出指标")
+    parser.add_argument(
+        "--cache-dir",
+        metavar="",
+        default=os.environ.get("CF2DNS_CACHE_DIR", os.path.expanduser("~/.cache/cf2dns")),
+        help="优选 IP 缓存目录, 默认从系统环境变量中获取, 变量名: CF2DNS_CACHE_DIR, 未设置时为 ~/.cache/cf2dns",
+    )
+    parser.add_argument("--cache-ttl", metavar="", type=int, default=300, help="优选 IP 缓存有效秒数, 0 为每次重新请求(请求失败时仍可使用过期缓存), 默认 300")
+    parser.add_argument("--cache-max-stale", metavar="", type=int, default=86400, help="获取优选 IP 失败时可使用的过期缓存最大秒数, 默认 86400")
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        default=False,
+        help="候选 IP 集合及域名信息与上次成功执行时相同时跳过本次执行",
+    )
+    parser.add_argument("--retries", metavar="", type=int, default=3, help="服务商接口限流或临时性错误的最大重试次数, 默认 3")
+    parser.add_argument("--retry-budget", metavar="", type=int, default=100, help="每次同步所有接口调用共享的重试次数上限, 默认 100")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        default=False,
+        help="计算完所有变更后按主域名分组, 通过服务商批量接口写入, 服务商不支持批量的变更逐条执行",
+    )
+    parser.add_argument(
+        "--state",
+        metavar="",
+        default=os.environ.get("CF2DNS_STATE"),
+        help="本地解析记录状态库文件(SQLite), 提供时优先根据状态库计算变更, 只在状态过期或写入失败时从服务商读取,\n默认从系统环境变量中获取, 变量名: CF2DNS_STATE",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        default=False,
+        help="使用 asyncio 异步服务商接口, 自行签名并复用 keep-alive 连接, 在单个线程中并发执行所有解析记录读写,\n不支持 --accounts --state --snapshot --batch --daemon --watch",
+    )
+    parser.add_argument("--concurrency", metavar="", type=int, default=100, help="--async 模式下同时执行的任务数及最大连接数, 默认 100")
+    parser.add_argument(
+        "--metadata-ttl",
+        metavar="",
+        type=int,
+        default=86400,
+        help="主域名列表、套餐及线路列表等服务商元数据在 --cache-dir 中的缓存秒数, 默认 86400",
+    )
+    parser.add_argument(
+        "--refresh-metadata",
+        action="store_true",
+        default=False,
+        help="启动时清除缓存的服务商元数据并重新读取",
+    )
+    parser.add_argument(
+        "--verify-interval",
+        metavar="",
+        type=int,
+        default=86400,
+        help="状态库中的解析记录超过该秒数未从服务商校验时重新读取, 默认 86400",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        default=False,
+        help="并发测试候选 IP 的 TCP 延迟(可选 HTTPS 下载速度), 按测试结果选取最优的 IP, 默认随机选取",
+    )
+    parser.add_argument("--probe-port", metavar="", type=int, default=443, help="测试端口, 默认 443")
+    parser.add_argument("--probe-count", metavar="", type=int, default=3, help="每个 IP 的 TCP 握手测试次数, 默认 3")
+    parser.add_argument("--probe-timeout", metavar="", type=float, default=1.0, help="TCP 握手超时秒数, 默认 1")
+    parser.add_argument("--probe-concurrency", metavar="", type=int, default=64, help="测试并发数, 默认 64")
+    parser.add_argument("--probe-deadline", metavar="", type=float, default=15.0, help="测试总时长上限秒数, 超时未完成的 IP 视为失败, 默认 15")
+    parser.add_argument("--probe-host", metavar="", default=None, help="提供时通过 HTTPS 下载测试速度, 作为 SNI 和 Host 头的域名")
+    parser.add_argument("--probe-path", metavar="", default="/", help="HTTPS 下载测试的路径, 默认 /")
+    parser.add_argument("--probe-bytes", metavar="", type=int, default=1024 * 1024, help="HTTPS 下载测试最多读取的字节数, 默认 1048576")
+    parser.add_argument(
+        "--ip-source",
+        metavar="",
+        action="append",
+        default=None,
+        help=f"候选 IP 来源, 可多次指定, 按指定顺序合并去重, 默认只使用优选 IP 接口: hostmonit | {' | '.join(f'{name}:文件路径或 URL' for name in SOURCES)}\n"
+        "list 为每行一个 IP 的列表, 可在 IP 后指定线路; csv 为 CloudflareSpeedTest 输出的 result.csv",
+    )
+    parser.add_argument("--source-lines", metavar="", default="CM,CU,CT,AB,DEF", help="未指定线路的来源(list / csv)中的 IP 用于哪些线路, 默认 CM,CU,CT,AB,DEF")
+    parser.add_argument("--max-candidates", metavar="", type=int, default=None, help="合并后每条线路最多保留的候选 IP 数量, 默认不限制")
+    parser.add_argument("--source-timeout", metavar="", type=float, default=30, help="读取所有来源的总时长上限秒数, 超时未完成的来源会被跳过, 默认 30")
+    parser.add_argument("--log-level", metavar="", choices=list(log_level), default="debug", help=f"日志级别: {' | '.join(log_level)}, 默认 debug")
+    parser.add_argument("--log-format", metavar="", choices=["text", "json"], default="text", help="日志格式: text | json, json 为每行一条 JSON, 包含主域名、子域名、线路、操作、耗时等字段, 默认 text")
+    parser.add_argument(
+        "--log-queue",
+        action="store_true",
+        default=False,
+        help="日志放入队列由后台线程格式化及写入, 并发执行时不在工作线程中等待日志 I/O",
+    )
+    parser.add_argument(
+        "--assign",
+        action="store_true",
+        default=False,
+        help="统一分配记录值: 同时考虑所有子域名及线路, 将候选 IP 均衡分配, 并保持上次的分配, 代替每个子域名单独随机挑选",
+    )
+    parser.add_argument("--weights", metavar="", default=None, help='子域名权重(JSON)文件, 例如流量估计: {"shop.example.com": 10}, 未列出的子域名权重为 1')
+    parser.add_argument("--assign-tolerance", metavar="", type=float, default=0.25, help="上次分配的 IP 负载不超过均值的 1 + 该值倍时保持不变, 默认 0.25")
+    parser.add_argument(
+        "--accounts",
+        metavar="",
+        default=None,
+        help="多账号配置(JSON)文件, 将主域名映射到服务商及凭证, 每个凭证复用一个 client, 各账号并发执行, 格式见 accounts.py",
+    )
+    parser.add_argument(
+        "--shard",
+        metavar="",
+        default=None,
+        help="只处理第 i 个分片, 格式 i/N (0 <= i < N), 按 (主域名, 子域名) 一致性哈希拆分, 合并各分片结果见 shard.py",
+    )
+    parser.add_argument("--lock-dir", metavar="", default=None, help="租约文件目录, 可位于共享存储, 重叠执行的同一分片不会同时写入同一主域名")
+    parser.add_argument("--lease-ttl", metavar="", type=float, default=600, help="租约有效期秒数, 持有者异常退出后超过该时间可被接管, 默认 600")
+    parser.add_argument("--summary", metavar="", default=None, help="执行完成后写入可跨分片合并的执行结果(JSON)文件")
+    parser.add_argument(
+        "--history",
+        metavar="",
+        default=None,
+        help="候选 IP 历史表现库(SQLite)文件, 记录每次测试结果及出现次数; 配合 --probe 使用时按衰减加权的历史得分排序, 近期测试过的 IP 不再重复测试",
+    )
+    parser.add_argument("--history-half-life", metavar="", type=float, default=86400, help="历史得分的半衰期秒数, 默认 86400")
+    parser.add_argument("--history-retention", metavar="", type=float, default=30 * 86400, help="历史记录保留秒数, 默认 2592000")
+    parser.add_argument("--history-fresh", metavar="", type=float, default=3600, help="最近一次测试在该秒数内且得分可信的 IP 不再测试, 默认 3600")
+    parser.add_argument("--history-confidence", metavar="", type=float, default=2.5, help="衰减后的测试次数不少于该值时得分可信, 默认 2.5, 即近期至少测试过 3 次")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="健康检查模式: 常驻运行, 定时探测已发布的解析记录值, 只替换持续不健康的记录, 探测参数同 --probe-*",
+    )
+    parser.add_argument("--watch-interval", metavar="", type=int, default=120, help="健康检查间隔秒数, 默认 120")
+    parser.add_argument("--max-latency", metavar="", type=float, default=None, help="TCP 握手延迟超过该值(毫秒)视为异常, 默认不限制")
+    parser.add_argument("--max-loss", metavar="", type=float, default=0.5, help="丢包率不低于该值视为异常, 默认 0.5")
+    parser.add_argument("--fail-threshold", metavar="", type=int, default=3, help="连续异常多少次后替换, 默认 3")
+    parser.add_argument("--recover-threshold", metavar="", type=int, default=3, help="不健康的 IP 连续正常多少次后恢复, 默认 3")
+    parser.add_argument("--cooldown", metavar="", type=int, default=1800, help="被替换的 IP 多少秒内不会再被选用, 默认 1800")
+    parser_mode = parser.add_mutually_exclusive_group(required=False)
+    parser_mode.add_argument(
+        "--plan",
+        dest="plan",
+        action="store_true",
+        default=False,
+        help="只计算并打印需要执行的 创建/更新/删除 操作, 不修改解析记录",
+    )
+    parser_mode.add_argument(
+        "--apply",
+        dest="plan",
+        action="store_false",
+        help="计算并执行最少的 创建/更新/删除 操作 (默认)",
+    )
     parser_domain = parser.add_mutually_exclusive_group(required=False)
     parser_domain.add_argument(
         "-d",
@@ -173,45 +756,428 @@ def parse_args() -> namedtuple:
         metavar="",
         dest="domain_file",
         default=os.environ.get("DOMAIN_INFO_FILE"),
-        help='添加解析记录的域名信息，文件格式 Json, 不提供时从系统环境变量中获取, 变量名: DOMAIN_INFO_FILE\n与 "-d" 选项互斥，文件内容参数参考 "-d" 选项说明',
+        help='添加解析记录的域名信息，文件格式 Json 或 YAML(.yaml / .yml, 需安装 PyYAML), 校验后的结果按内容缓存在 --cache-dir 中, 不提供时从系统环境变量中获取, 变量名: DOMAIN_INFO_FILE\n与 "-d" 选项互斥，文件内容参数参考 "-d" 选项说明',
     )
-    args = parser.parse_args()
-    if args.domain and not validate_json(args.domain):
-        logger.error(f"JSON 域名信息格式不正确: {args.domain}")
+    args = parser.parse_args(argv)
+    # -d 的 JSON 只在这里解析一次, load_domains 直接使用解析结果
+    args.domain_info = None
+    if args.domain:
+        try:
+            args.domain_info = json.loads(args.domain)
+        except ValueError:
+            logger.error(f"JSON 域名信息格式不正确: {args.domain}")
+            raise SystemExit()
+    # 文件内容在 load_domains 中只解析及校验一次
+    if args.domain_file and not os.path.isfile(args.domain_file):
+        logger.error(f"文件不存在：{args.domain_file}")
         raise SystemExit()
-    if args.domain_file and not validate_file(args.domain_file):
-        logger.error(f"文件不存在或 JSON 域名信息格式不正确：{args.domain_file}")
+    if args.use_async:
+        unsupported = [flag for flag, enabled in (("--accounts", args.accounts), ("--state", args.state), ("--snapshot", args.snapshot), ("--batch", args.batch), ("--daemon", args.daemon), ("--watch", args.watch)) if enabled]
+        if unsupported:
+            logger.error(f"--async 模式不支持: {' '.join(unsupported)}")
+            raise SystemExit()
+    try:
+        for spec in args.ip_source or []:
+            parse_source(spec, None, [])
+        if args.shard:
+            parse_shard(args.shard)
+    except ValueError as e:
+        logger.error(str(e))
         raise SystemExit()
     return args
 
-def main():
-    args = parse_args()
+def load_domains(args, cloud=None) -> dict:
+    """读取并编译域名信息, 提供 cloud 时按服务商校验线路名, 编译结果按内容哈希缓存在 --cache-dir 中"""
+    raw = None
     if args.domain:
-        DOMAINS = json.loads(args.domain)
+        text, filename, raw = args.domain, "", args.domain_info
     elif args.domain_file:
-        DOMAINS = json.load(open(args.domain_file))
+        text, filename = read_config(args.domain_file), args.domain_file
     else:
         raise SystemExit("请提供添加解析记录的域名信息")
+    check_line, providers = None, ""
+    if isinstance(cloud, ClientPool):
+        check_line = lambda zone, line: cloud.get(cloud.profile_for(zone).name)[0].normalize_line(line)
+        providers = json.dumps([cloud.zones, cloud.default, {name: profile.provider for name, profile in cloud.profiles.items()}], sort_keys=True)
+    elif cloud is not None:
+        check_line = lambda zone, line: cloud.normalize_line(line)
+        providers = type(cloud).__name__
+    try:
+        return CompiledConfig(args.cache_dir).load(text, filename, RECORD_LINE, providers, check_line, raw)
+    except ValueError as e:
+        raise SystemExit(str(e))
 
-    cloud = DNS_API.get(args.dnsserver)(args.secret_id, args.secret_key)
-    
-    if args.v4:
-        logger.info("优选 IPV4 地址")
-        record_type = "A"
-        cfips = get_optimization_ip(ip_version="v4")
-        cf_ips = cfips["info"]
-        for domain, sub_domains in DOMAINS.items():
-            for sub_domain, lines in sub_domains.items():
-                change_dns(cloud, domain, sub_domain, record_type, lines, cf_ips, args.record_num)
-
-    if args.v6:
-        logger.info("优选 IPV6 地址")
-        record_type = "AAAA"
-        cfips = get_optimization_ip(ip_version="v6")
+def configure_client(client, args) -> None:
+    """每轮同步前为 client 设置新的重试策略(重置重试次数预算), sync、sync_async 及 watch_once 共用
+
+    限流在创建 client 时按账号设置(make_client / main_async), 常驻及健康检查模式复用同一个令牌桶。
+    """
+    client.set_retry(RetryPolicy(retries=args.retries, budget=args.retry_budget))
+
+def select_shard(domains: dict, args) -> dict:
+    if not args.shard:
+        return domains
+    domains = shard_domains(domains, *parse_shard(args.shard))
+    logger.info(f"分片 {args.shard}: {sum(len(sub_domains) for sub_domains in domains.values())} 个子域名")
+    return domains
+
+def candidate_versions(args) -> list:
+    """返回需要同步的 [(记录类型, IP 类型)]"""
+    versions = [(record_type, ip_version) for enabled, record_type, ip_version in ((args.v4, "A", "v4"), (args.v6, "AAAA", "v6")) if enabled]
+    for _, ip_version in versions:
+        logger.info(f"优选 IP{ip_version.upper()} 地址")
+    return versions
+
+def prepare_stacks(fetched: dict, domains: dict, args, cache, history=None) -> tuple:
+    """整理各记录类型的候选 IP, 返回 (stacks, applied), applied 为各记录类型执行成功后需要记录的指纹
+
+    开启 --skip-unchanged 且候选 IP 及域名信息与上次相同的记录类型不会出现在 stacks 中。
+    """
+    stacks = {}
+    applied = {}
+    for (record_type, ip_version), cfips in fetched.items():
+        if not cfips or not cfips.get("info"):
+            logger.error(f"获取优选 IP 失败, 类型: {ip_version}")
+            continue
         cf_ips = cfips["info"]
-        for domain, sub_domains in DOMAINS.items():
-            for sub_domain, lines in sub_domains.items():
-                change_dns(cloud, domain, sub_domain, record_type, lines, cf_ips, args.record_num)
+        applied_name = fingerprint(KEY, args.dnsserver, record_type, *([args.shard] if args.shard else []))[:16]
+        applied_value = fingerprint(candidate_fingerprint(cf_ips), domains, args.record_num, args.ttl)
+        if args.skip_unchanged and cache.last_applied(applied_name) == applied_value:
+            logger.info(f"候选 IP 及域名信息与上次执行时相同, 跳过, 类型: {ip_version}")
+            continue
+        if history is not None:
+            for line, ip_list in cf_ips.items():
+                history.record_seen(line, [ip.get("ip") for ip in ip_list])
+        if args.probe:
+            cf_ips = rank_candidates(cf_ips, args, history)
+        stacks[record_type] = cf_ips
+        applied[record_type] = (applied_name, applied_value)
+    return stacks, applied
+
+def acquire_leases(domains: dict, args) -> tuple:
+    """获取各主域名的租约, 返回 (可处理的域名信息, 已获取的租约 {主域名: 租约}, 被其他进程持有而跳过的主域名)"""
+    leases, skipped = {}, []
+    for zone in domains:
+        lease = Lease(args.lock_dir, f"{zone}|{args.shard or '0/1'}", ttl=args.lease_ttl)
+        if lease.acquire():
+            leases[zone] = lease
+        else:
+            skipped.append(zone)
+            logger.warning(f"主域名 {zone} 正在被 {lease.holder()} 处理, 本次跳过")
+    return {zone: sub_domains for zone, sub_domains in domains.items() if zone not in skipped}, leases, skipped
+
+def finish_sync(results: list, applied: dict, skipped: list, started: float, phases: dict, args, cache, history=None) -> None:
+    """记录执行成功的候选 IP 指纹, 输出执行结果、指标及分片汇总"""
+    for record_type, (applied_name, applied_value) in applied.items():
+        if not args.plan and not skipped and all(result.ok for result in results if result.record_type == record_type):
+            cache.mark_applied(applied_name, applied_value)
+    if history is not None:
+        history.compact()
+
+    report(results, args.record_num)
+    collect_metrics(results, args.plan)
+    elapsed = METRICS.sums("cf2dns_phase_seconds", "phase")
+    logger.info("阶段耗时: " + " ".join(f"{phase} {elapsed.get(phase, 0) - phases.get(phase, 0):.3f}s" for phase in ("fetch", "probe", "read", "plan", "write")))
+    if args.metrics_file:
+        METRICS.write_textfile(args.metrics_file)
+    if args.summary:
+        atomic_write(args.summary, build_summary(results, args.shard, skipped, started))
+
+def sync(cloud, domains, args, cache, store=None, history=None) -> list:
+    """执行一次完整的优选及解析记录同步, 返回每个任务的执行结果
+
+    同时开启 IPv4 和 IPv6 时并发获取两组候选 IP, 每个子域名只读取一次解析记录, A 和 AAAA 记录一起计算及写入。
+    cloud 为 ClientPool 时按账号拆分域名信息, 候选 IP 只获取一次, 各账号使用各自的 client 及限流并发执行。
+    """
+    phases = METRICS.sums("cf2dns_phase_seconds", "phase")
+    started = time.time()
+    domains = select_shard(domains, args)
+    versions = candidate_versions(args)
+    sources = build_sources(args, cache)
+
+    if len(versions) > 1:
+        with ThreadPoolExecutor(max_workers=len(versions)) as executor:
+            fetched = dict(zip(versions, executor.map(lambda version: fetch_candidates(cache, version[1], sources, args.max_candidates, args.source_timeout), versions)))
+    else:
+        fetched = {version: fetch_candidates(cache, version[1], sources, args.max_candidates, args.source_timeout) for version in versions}
+    stacks, applied = prepare_stacks(fetched, domains, args, cache, history)
+
+    results = []
+    leases, skipped = {}, []
+    if stacks and args.lock_dir and not args.plan:
+        domains, leases, skipped = acquire_leases(domains, args)
+    assigned = assign_slots(domains, stacks, args, cache) if stacks and args.assign else None
+
+    def run(target):
+        client, client_store, zones = target
+        configure_client(client, args)
+        if args.snapshot:
+            snapshot = ZoneSnapshot(client)
+        elif len(stacks) > 1:
+            snapshot = SubDomainSnapshot(client)
+        else:
+            snapshot = None
+        return reconcile(client, zones, stacks, args.record_num, snapshot, args.workers, args.ttl, args.plan, args.probe, client_store, args.batch, assigned, leases)
+
+    try:
+        if stacks:
+            if isinstance(cloud, ClientPool):
+                targets = [(client, client_store, zones) for _, (client, client_store), zones in cloud.route(domains)]
+            else:
+                targets = [(cloud, store, domains)]
+            if len(targets) > 1:
+                with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+                    results = [result for target_results in executor.map(run, targets) for result in target_results]
+            else:
+                results = [result for target in targets for result in run(target)]
+    finally:
+        for lease in leases.values():
+            lease.release()
+    finish_sync(results, applied, skipped, started, phases, args, cache, history)
+    return results
+
+async def sync_async(cloud, domains, args, cache, http, history=None) -> list:
+    """sync 的协程版本, cloud 为 AsyncDnsBase, 候选 IP 获取及所有解析记录读写都在同一个事件循环中并发执行
+
+    候选 IP 测速及多来源合并仍在线程中执行。
+    """
+    phases = METRICS.sums("cf2dns_phase_seconds", "phase")
+    started = time.time()
+    domains = select_shard(domains, args)
+    versions = candidate_versions(args)
+    sources = build_sources(args, cache)
+    fetched = await asyncio.gather(
+        *(fetch_candidates_async(cache, ip_version, http, sources, args.max_candidates, args.source_timeout) for _, ip_version in versions)
+    )
+    stacks, applied = await asyncio.to_thread(prepare_stacks, dict(zip(versions, fetched)), domains, args, cache, history)
+
+    results = []
+    leases, skipped = {}, []
+    if stacks and args.lock_dir and not args.plan:
+        domains, leases, skipped = acquire_leases(domains, args)
+    assigned = assign_slots(domains, stacks, args, cache) if stacks and args.assign else None
+    configure_client(cloud, args)
+    try:
+        if stacks:
+            results = await reconcile_async(cloud, domains, stacks, args.record_num, args.concurrency, args.ttl, args.plan, args.probe, assigned, leases)
+    finally:
+        for lease in leases.values():
+            lease.release()
+    finish_sync(results, applied, skipped, started, phases, args, cache, history)
+    return results
+
+def watch_once(cloud, domains, args, cache, store=None, tracker=None) -> list:
+    """探测当前已发布的解析记录值, 只替换被 tracker 判为不健康的记录, 返回本轮的变更
+
+    替换 IP 从该线路的候选 IP 中选择, 只测试需要的数量, 健康的记录不会被修改。
+    """
+    tracker = tracker or HealthTracker()
+    if isinstance(cloud, ClientPool):
+        return [
+            change
+            for _, (client, client_store), zones in cloud.route(domains)
+            for change in watch_once(client, zones, args, cache, client_store, tracker)
+        ]
+    configure_client(cloud, args)
+    versions = [(record_type, ip_version) for enabled, record_type, ip_version in ((args.v4, "A", "v4"), (args.v6, "AAAA", "v6")) if enabled]
+    units = [
+        (domain, sub_domain, record_type, line)
+        for domain, sub_domains in domains.items()
+        for sub_domain, lines in sub_domains.items()
+        for record_type, _ in versions
+        for line in lines
+    ]
+    snapshot = SubDomainSnapshot(cloud)
+
+    def read(unit):
+        domain, sub_domain, record_type, line = unit
+        try:
+            return read_records(cloud, domain, sub_domain, record_type, RECORD_LINE.get(line), snapshot, store)[0]
+        except Exception as e:
+            logger.error(f"读取解析记录失败: {sub_domain}.{domain} 记录: {record_type} 线路: {RECORD_LINE.get(line)} 错误: {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        published = dict(zip(units, executor.map(read, units)))
+    values = {record.value for records in published.values() for record in records}
+    with METRICS.timer("cf2dns_phase_seconds", phase="probe"):
+        probes = probe_ips(values, **probe_options(args))
+    unhealthy = {ip for ip, probe in probes.items() if tracker.observe(probe)}
+    logger.info(f"健康检查: 已发布 IP {len(values)} 个, 不健康 {len(unhealthy)} 个")
+
+    candidates = {}
+    changes = []
+    for (domain, sub_domain, record_type, line), records in published.items():
+        failing = [record for record in records if record.value in unhealthy]
+        if not failing:
+            continue
+        ip_version = dict(versions)[record_type]
+        if ip_version not in candidates:
+            cfips = fetch_candidates(cache, ip_version, build_sources(args, cache), args.max_candidates, args.source_timeout)
+            candidates[ip_version] = (cfips or {}).get("info") or {}
+        current = {record.value for record in records}
+        pool = list(dict.fromkeys(ip.get("ip") for ip in candidates[ip_version].get(line, []) if ip.get("ip") not in current))
+        # 按需测试候选 IP, 每条不健康的记录最多新测试 3 个候选
+        untested = [ip for ip in pool if ip not in probes][: len(failing) * 3]
+        probes.update(probe_ips(untested, **probe_options(args)))
+        replacements = [ip for ip in rank_ips(pool, probes) if tracker.acceptable(probes[ip])]
+        for record, value in zip(failing, replacements):
+            changes.append(Change(UPDATE, domain, sub_domain, record_type, RECORD_LINE.get(line), value, record.record_id, record.value, args.ttl, record.ttl))
+            current.add(value)
+        for record in failing[len(replacements):]:
+            logger.warning(f"没有可用的替换 IP, 保留: {sub_domain}.{domain} 记录: {record_type} 值: {record.value} 线路: {RECORD_LINE.get(line)}")
+
+    for change in changes:
+        if args.plan:
+            logger.info("[PLAN] %s", Lazy(describe, change), extra=change_fields(change))
+            continue
+        try:
+            apply_changes(cloud, [change], store)
+            tracker.quarantine(change.old_value)
+        except (Exception, SystemExit) as e:
+            logger.error("替换失败: %s 错误: %s", Lazy(describe, change), e, extra=change_fields(change, error=str(e)))
+            if store is not None:
+                store.invalidate(change.domain, change.sub_domain, change.record_type, change.line)
+    return changes
+
+def run_daemon(cloud, domains, args, cache, store=None, task=None, interval=None) -> None:
+    """常驻运行, 复用服务商 client 及缓存, 每隔 interval 秒(加上随机抖动)执行一次 task, 默认为 sync
+
+    SIGTERM/SIGINT: 当前同步完成后退出; SIGHUP: 下次同步前重新加载域名信息
+    """
+    task = task or sync
+    interval = interval or args.interval
+    stop = threading.Event()
+    reload = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *_: reload.set())
+
+    logger.info(f"常驻模式启动, 同步间隔: {interval}s 随机抖动: {args.jitter}s")
+    while not stop.is_set():
+        if reload.is_set():
+            reload.clear()
+            try:
+                domains = load_domains(args, cloud)
+                logger.info("已重新加载域名信息")
+            except (ValueError, OSError, SystemExit) as e:
+                logger.error(f"重新加载域名信息失败, 继续使用原有配置: {e}")
+        try:
+            task(cloud, domains, args, cache, store)
+        except Exception as e:
+            logger.exception(f"同步失败: {e}")
+        delay = interval + random.uniform(0, args.jitter)
+        logger.info(f"下次同步将在 {delay:.0f}s 后执行")
+        stop.wait(delay)
+    logger.info("常驻模式退出")
+
+def preload_metadata(cloud, domains: dict) -> None:
+    """启动时批量读取线路列表等服务商元数据, 失败时只记录日志, 同步过程中按需读取"""
+    try:
+        targets = cloud.route(domains) if isinstance(cloud, ClientPool) else [(None, (cloud, None), domains)]
+        for _, (client, _), zones in targets:
+            client.preload_metadata(list(zones))
+    except Exception as e:
+        logger.warning(f"预加载服务商元数据失败, 同步时按需读取, 错误: {e}")
+
+def open_metadata(args, namespace: str) -> MetadataCache:
+    os.makedirs(args.cache_dir, exist_ok=True)
+    metadata = MetadataCache(os.path.join(args.cache_dir, "metadata.db"), namespace, ttl=args.metadata_ttl)
+    if args.refresh_metadata:
+        metadata.invalidate()
+    return metadata
+
+def make_client(args, profile: Profile) -> tuple:
+    """创建账号的 client 及本地状态库, 返回 (client, 状态库)"""
+    imported = time.perf_counter()
+    backend = get_backend(profile.provider)
+    loaded = time.perf_counter()
+    cloud = backend(profile.secret_id, profile.secret_key)
+    if args.startup_profile:
+        load_time, modules = LOAD_STATS.get(profile.provider, (loaded - imported, 0))
+        logger.info(
+            f"启动耗时: cf2dns 模块导入 {imported - STARTUP:.3f}s, {profile.provider} SDK 导入 {load_time:.3f}s (共 {modules} 个模块), "
+            f"client 初始化 {time.perf_counter() - loaded:.3f}s, 合计 {time.perf_counter() - STARTUP:.3f}s"
+        )
+    cloud.page_workers = args.page_workers
+    cloud.set_rate_limit(profile.qps or API_QPS.get(profile.provider, 10))
+    instrument(cloud, profile.provider)
+    namespace = f"{profile.provider}:{fingerprint(profile.secret_id)[:12]}"
+    if args.cache_dir:
+        cloud.set_metadata_cache(open_metadata(args, namespace))
+    store = None
+    if args.state:
+        store = RecordStore(args.state, cloud, namespace=namespace, verify_interval=args.verify_interval)
+    return cloud, store
+
+async def main_async(args) -> list:
+    """--async 模式: 使用异步服务商接口, 所有请求共用一个 keep-alive 连接池, 在单个线程中并发执行"""
+    http = AsyncHttpClient(max_connections=args.concurrency)
+    cloud = get_async_backend(args.dnsserver)(args.secret_id, args.secret_key, http=http)
+    cloud.set_rate_limit(args.qps or API_QPS.get(args.dnsserver, 10))
+    configure_client(cloud, args)
+    instrument(cloud, args.dnsserver)
+    if args.cache_dir:
+        cloud.set_metadata_cache(open_metadata(args, f"{args.dnsserver}:{fingerprint(args.secret_id)[:12]}"))
+    domains = load_domains(args, cloud)
+    try:
+        try:
+            await cloud.preload_metadata(list(domains))
+        except Exception as e:
+            logger.warning(f"预加载服务商元数据失败, 同步时按需读取, 错误: {e}")
+        cache = IpCache(args.cache_dir, ttl=args.cache_ttl, max_stale=args.cache_max_stale)
+        history = None
+        if args.history:
+            history = IpHistory(args.history, half_life=args.history_half_life, retention=args.history_retention)
+        return await sync_async(cloud, domains, args, cache, http, history)
+    finally:
+        await http.close()
+
+def main():
+    args = parse_args()
+    configure_logger(logger, args.log_level, args.log_format == "json", args.log_queue)
+    if args.use_async:
+        asyncio.run(main_async(args))
+        return
+
+    cli_profile = Profile(CLI_PROFILE, args.dnsserver, args.secret_id, args.secret_key, args.qps)
+    if args.accounts:
+        try:
+            profiles, zones, default = load_accounts(args.accounts, DNS_API)
+        except (OSError, ValueError, KeyError) as e:
+            raise SystemExit(f"账号配置不正确: {args.accounts} 错误: {e}")
+        if args.secret_id and args.secret_key:
+            profiles.setdefault(CLI_PROFILE, cli_profile)
+        cloud, store = ClientPool(profiles, zones, default, partial(make_client, args)), None
+        logger.info(f"多账号模式: {len(profiles)} 个账号")
+    else:
+        cloud, store = make_client(args, cli_profile)
+    cache = IpCache(args.cache_dir, ttl=args.cache_ttl, max_stale=args.cache_max_stale)
+    domains = load_domains(args, cloud)
+    preload_metadata(cloud, domains)
+
+    if args.daemon or args.watch:
+        if args.metrics_port:
+            serve_metrics(args.metrics_port)
+            logger.info(f"指标地址: http://0.0.0.0:{args.metrics_port}/metrics")
+    history = None
+    if args.history:
+        history = IpHistory(args.history, half_life=args.history_half_life, retention=args.history_retention)
+
+    if args.watch:
+        tracker = HealthTracker(
+            fail_threshold=args.fail_threshold,
+            recover_threshold=args.recover_threshold,
+            max_latency=args.max_latency,
+            max_loss=args.max_loss,
+            cooldown=args.cooldown,
+        )
+        run_daemon(cloud, domains, args, cache, store, task=partial(watch_once, tracker=tracker), interval=args.watch_interval)
+    elif args.daemon:
+        run_daemon(cloud, domains, args, cache, store, task=partial(sync, history=history))
+    else:
+        sync(cloud, domains, args, cache, store, history)
 
 if __name__ == "__main__":
     main()
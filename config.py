@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+
+from typing import Callable, Dict, List, Optional
+
+from ipcache import atomic_write, read_json
+
+# 编译结果格式变化时修改, 使旧的编译结果失效
+COMPILED_VERSION = 1
+
+
+def parse_config(text: str, filename: str = "") -> dict:
+    """解析 JSON 或 YAML(.yaml / .yml 文件) 格式的域名信息"""
+    if filename.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("读取 YAML 格式的域名信息需要安装 PyYAML: pip install pyyaml")
+        try:
+            return yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML 格式不正确: {e}")
+    return json.loads(text)
+
+
+def read_config(filename: str) -> str:
+    with open(filename, encoding="utf-8") as f:
+        return f.read()
+
+
+def compile_domains(raw, line_codes: Dict[str, str], check_line: Callable[[str, str], None] = None) -> dict:
+    """校验并规范化域名信息, 返回 {主域名: {子域名: [线路代码]}}
+
+    主域名转为小写并去掉末尾的点, 线路代码转为大写并去重, 线路可以是列表或逗号分隔的字符串,
+    重复的主域名及子域名合并。线路代码需在 line_codes 中, check_line(主域名, 线路名) 用于按服务商校验线路名。
+    所有错误一并通过 ValueError 抛出。
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("域名信息需为 {主域名: {子域名: [线路]}} 格式")
+    errors: List[str] = []
+    domains: Dict[str, Dict[str, List[str]]] = {}
+    checked = set()
+    for zone, sub_domains in raw.items():
+        domain = str(zone).strip().rstrip(".").lower()
+        if not domain or not isinstance(sub_domains, dict):
+            errors.append(f"{zone}: 主域名为空或子域名信息不是字典")
+            continue
+        for sub_domain, lines in sub_domains.items():
+            name = str(sub_domain).strip().lower() or "@"
+            if isinstance(lines, str):
+                lines = lines.split(",")
+            if not isinstance(lines, list) or not lines:
+                errors.append(f"{name}.{domain}: 线路需为非空列表")
+                continue
+            merged = domains.setdefault(domain, {}).setdefault(name, [])
+            for line in lines:
+                code = str(line).strip().upper()
+                if code not in line_codes:
+                    errors.append(f"{name}.{domain}: 未知的线路 {line}, 仅支持: {' | '.join(line_codes)}")
+                    continue
+                if check_line is not None and (domain, code) not in checked:
+                    checked.add((domain, code))
+                    try:
+                        check_line(domain, line_codes[code])
+                    except (AssertionError, ValueError, KeyError) as e:
+                        errors.append(f"{name}.{domain}: 线路 {line_codes[code]} 不可用: {e}")
+                        continue
+                if code not in merged:
+                    merged.append(code)
+    if errors:
+        more = f"\n... 共 {len(errors)} 个错误" if len(errors) > 20 else ""
+        raise ValueError("域名信息不正确:\n" + "\n".join(errors[:20]) + more)
+    return domains
+
+
+class CompiledConfig:
+    """按内容哈希缓存编译后的域名信息
+
+    内容、服务商及编译格式都不变时直接读取缓存的编译结果, 不再解析 YAML 及逐条校验。
+    >>> compiled = CompiledConfig("~/.cache/cf2dns")
+    >>> domains = compiled.load(text, "domains.yaml", RECORD_LINE, providers="aliyun", check_line=check_line)
+    """
+
+    def __init__(self, cache_dir: Optional[str]):
+        self.cache_dir = cache_dir
+
+    def _filename(self, text: str, providers: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        digest = hashlib.sha256(f"{COMPILED_VERSION}\0{providers}\0{text}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"domains-{digest}.json")
+
+    def load(self, text: str, filename: str, line_codes: Dict[str, str], providers: str = "", check_line: Callable[[str, str], None] = None, raw=None) -> dict:
+        """raw 为调用方已经解析过的 text, 提供时不再重复解析"""
+        cached = self._filename(text, providers)
+        if cached:
+            entry = read_json(cached)
+            if entry is not None:
+                return entry["domains"]
+        domains = compile_domains(parse_config(text, filename) if raw is None else raw, line_codes, check_line)
+        if cached:
+            try:
+                atomic_write(cached, {"domains": domains})
+            except OSError:
+                pass
+        return domains
@@ -1,9 +1,24 @@
 from typing import List
 
-from .aliyun import AliApi
-from .dnspod import DnsPodApi
+from .index import RecordIndex
+from .metadata import MetadataCache
+from .plan import Change, plan_changes, apply_change
+from .registry import available, get_async_backend, get_backend, register
+from .snapshot import ZoneSnapshot, SubDomainSnapshot, AsyncSubDomainSnapshot
+from .state import RecordStore
+from .utils import Domain, Record
+
+__all__ = ("AliApi", "DnsPodApi", "ZoneSnapshot", "SubDomainSnapshot", "AsyncSubDomainSnapshot", "RecordIndex", "RecordStore", "MetadataCache", "Change", "plan_changes", "apply_change", "Domain", "Record", "available", "get_backend", "get_async_backend", "register", "AsyncAliApi", "AsyncDnsPodApi")
+
+# 服务商类按需导入, 避免只使用其中一个服务商时也导入另一个服务商的 SDK
+_LAZY_BACKENDS = {"AliApi": "aliyun", "DnsPodApi": "dnspod"}
+_LAZY_ASYNC_BACKENDS = {"AsyncAliApi": "aliyun", "AsyncDnsPodApi": "dnspod"}
 # from .huawei import HuaWeiApi
 
-from .utils import Domain, Record
 
-__all__ = ("AliApi", "DnsPodApi", "Domain", "Record")
+def __getattr__(name):
+    if name in _LAZY_BACKENDS:
+        return get_backend(_LAZY_BACKENDS[name])
+    if name in _LAZY_ASYNC_BACKENDS:
+        return get_async_backend(_LAZY_ASYNC_BACKENDS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,214 @@
+import ssl
+import asyncio
+
+from abc import ABCMeta, abstractmethod
+from collections import defaultdict, namedtuple
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from .metadata import DOMAINS, MetadataCache
+from .ratelimit import TokenBucket
+from .retry import RetryPolicy
+
+HttpResponse = namedtuple("HttpResponse", ["status", "headers", "body"])
+
+
+class AsyncHttpClient:
+    """基于 asyncio 的 HTTP/1.1 客户端, 按 (主机, 端口) 复用 keep-alive 连接
+
+    max_connections 为同时打开的最大连接数, 超过时请求排队等待空闲连接。
+    >>> http = AsyncHttpClient(max_connections=100)
+    >>> response = await http.request("POST", "https://dnspod.tencentcloudapi.com/", headers, body)
+    >>> await http.close()
+    """
+
+    def __init__(self, max_connections: int = 100, timeout: float = 10.0, ssl_context: ssl.SSLContext = None):
+        self.timeout = timeout
+        self._ssl = ssl_context
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: Dict[tuple, List[tuple]] = defaultdict(list)
+
+    async def _connect(self, key: tuple) -> tuple:
+        """返回 (连接, 是否为复用的连接)"""
+        idle = self._idle[key]
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        host, port, secure = key
+        if secure and self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        connection = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=self._ssl if secure else None), self.timeout)
+        return connection, False
+
+    async def request(self, method: str, url: str, headers: dict = None, body: bytes = b"", idempotent: bool = True) -> HttpResponse:
+        """复用的连接中断时换新连接重发一次; idempotent 为 False 时只在请求写入失败时重发, 服务端可能已收到并执行的请求不再重发"""
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        key = (parts.hostname, parts.port or (443 if secure else 80), secure)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        head = {"Host": parts.netloc, "Connection": "keep-alive", "Content-Length": str(len(body)), "User-Agent": "cf2dns", **(headers or {})}
+        request = f"{method} {target} HTTP/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in head.items()) + "\r\n"
+        data = request.encode("latin-1") + body
+        async with self._slots:
+            for attempt in range(2):
+                connection, reused = await self._connect(key)
+                written = False
+
+                async def exchange():
+                    nonlocal written
+                    reader, writer = connection
+                    writer.write(data)
+                    await writer.drain()
+                    written = True
+                    return await self._read_response(reader)
+
+                try:
+                    response, keep_alive = await asyncio.wait_for(exchange(), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as error:
+                    connection[1].close()
+                    # 复用的连接可能已被服务端关闭, 换一个新连接重试一次
+                    if reused and attempt == 0 and (idempotent or not written):
+                        continue
+                    raise ConnectionError(f"{method} {url} 连接中断: {error!r}") from error
+                except BaseException:
+                    connection[1].close()
+                    raise
+                if keep_alive:
+                    self._idle[key].append(connection)
+                else:
+                    connection[1].close()
+                return response
+
+    async def _read_response(self, reader: asyncio.StreamReader) -> tuple:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("服务端关闭了连接")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body, keep_alive = await reader.read(), False
+        return HttpResponse(int(status), headers, body), keep_alive
+
+    async def close(self) -> None:
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+class AsyncDnsBase(metaclass=ABCMeta):
+    """异步服务商接口, 方法与 DnsBase 相同但均为协程, 所有请求共用一个 AsyncHttpClient 连接池
+
+    dns.plan.apply_change 对异步接口返回协程, 需要 await。
+    """
+
+    # 默认接口地址, 由子类设置
+    endpoint = ""
+    metadata = None
+
+    def __init__(self, secret_id: str, secret_key: str, endpoint: str = None, http: AsyncHttpClient = None):
+        self._secret_id = secret_id
+        self._secret_key = secret_key
+        self._owns_http = http is None
+        self._http = http or AsyncHttpClient()
+        self.url = self._url(endpoint or self.endpoint)
+        self._bucket: Optional[TokenBucket] = None
+        self._retry_policy: Optional[RetryPolicy] = None
+
+    @staticmethod
+    def _url(endpoint: str) -> str:
+        """endpoint 可以是主机名或完整地址, 例如 http://127.0.0.1:8080/"""
+        return endpoint if "://" in endpoint else f"https://{endpoint}/"
+
+    @abstractmethod
+    async def get_domain(self) -> List:
+        pass
+
+    @abstractmethod
+    async def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, **kwargs) -> List:
+        pass
+
+    @abstractmethod
+    async def create_record(self, domain: str, sub_domain: str, record_type: str, value: str, line: str, ttl: int = 600, **kwargs):
+        pass
+
+    @abstractmethod
+    async def change_record(self, domain: str, sub_domain: str, record_id, record_type: str, value: str, line: str, ttl: int = 600, **kwargs) -> bool:
+        pass
+
+    @abstractmethod
+    async def del_record(self, record_id, **kwargs) -> bool:
+        pass
+
+    def normalize_line(self, line: str) -> str:
+        """将线路名转换为服务商返回的解析记录中使用的线路标识"""
+        return line
+
+    def set_metadata_cache(self, cache: MetadataCache) -> MetadataCache:
+        self.metadata = cache
+        return cache
+
+    def _metadata(self) -> MetadataCache:
+        if self.metadata is None:
+            self.metadata = MetadataCache()
+        return self.metadata
+
+    async def domain_metadata(self) -> Dict[str, dict]:
+        """返回 {主域名: 元数据}, 使用元数据缓存"""
+        cached = self._metadata().get(DOMAINS)
+        if cached is None:
+            cached = await self._load_domain_metadata()
+            self._metadata().put(DOMAINS, "", cached)
+        return cached
+
+    async def _load_domain_metadata(self) -> Dict[str, dict]:
+        return {domain.domain_name: {"create_time": domain.create_time, "record_count": domain.record_count} for domain in await self.get_domain()}
+
+    async def preload_metadata(self, domains: Iterable[str]) -> None:
+        await self.domain_metadata()
+
+    def set_rate_limit(self, qps: float, burst: float = None) -> TokenBucket:
+        self._bucket = TokenBucket(qps, burst)
+        return self._bucket
+
+    def set_retry(self, policy: RetryPolicy) -> RetryPolicy:
+        self._retry_policy = policy
+        return policy
+
+    async def _call(self, send, idempotent: bool = True):
+        """限流后调用 send(), 限流及临时性错误按 RetryPolicy.call_async 重试, 每次重试都重新获取令牌并重新签名"""
+
+        async def attempt():
+            if self._bucket is not None:
+                await self._bucket.acquire_async()
+            return await send()
+
+        if self._retry_policy is None:
+            return await attempt()
+        on_throttle = self._bucket.slow_down if self._bucket is not None else None
+        return await self._retry_policy.call_async(attempt, on_throttle=on_throttle, idempotent=idempotent)
+
+    async def aclose(self) -> None:
+        if self._owns_http:
+            await self._http.close()
@@ -1,50 +1,33 @@
 # -*- coding: utf-8 -*-
-from math import ceil
+import time
+from collections import defaultdict
 
-from typing import List
+from typing import Dict, Iterator, List, Tuple
 
 from alibabacloud_alidns20150109.client import Client as Alidns20150109Client
 from alibabacloud_tea_openapi import models as open_api_models
 from alibabacloud_alidns20150109 import models as alidns_20150109_models
 from alibabacloud_tea_util import models as util_models
-from alibabacloud_tea_util.client import Client as UtilClient
 
 from .base import DnsBase
-from .utils import Domain, Record, date_to_timestamp
+from .lines import parse_line
+from .pagination import paginate
+from .plan import CREATE
+from .retry import DnsApiError, classify
+from .utils import Domain, Record, date_to_timestamp, chunks
 # from .dnsbase import DnsBase
 
 # 请参考 https://api.aliyun.com/product/Alidns
 aliyun_endpoint = "alidns.cn-shenzhen.aliyuncs.com"
 
-# 解析线路
-# https://help.aliyun.com/zh/dns/resolve-line-enumeration
-aliyun_lines = {
-    "default": "默认",
-    "telecom": "中国电信",
-    "unicom": "中国联通",
-    "mobile": "中国移动",
-    "oversea": "境外",
-    "edu": "中国教育网",
-    "drpeng": "中国鹏博士",
-    "btvn": "中国广电网",
-    "aliyun": "阿里云",
-    "search": "搜索引擎",
-    "internal": "中国地区",
-}
-
-def parse_line(line: str) -> str:
-    if line in ("电信", "中国电信"):
-        line = "telecom"
-    elif line in ("联通", "中国联通"):
-        line = "unicom"
-    elif line in ("移动", "中国移动"):
-        line = "mobile"
-    elif line == "境外":
-        line = "oversea"
-    elif line == "默认":
-        line = "default"
-    assert line in aliyun_lines , f"{line} 不是有效的线路名, 请参考: https://help.aliyun.com/zh/dns/resolve-line-enumeration"
-    return line
+
+def api_error(error: Exception) -> DnsApiError:
+    """将阿里云 SDK 异常转换为 DnsApiError, 保留错误码及错误分类"""
+    message = getattr(error, "message", None) or str(error)
+    data = getattr(error, "data", None)
+    if isinstance(data, dict) and data.get("Recommend"):
+        message = f"{message} 诊断地址: {data.get('Recommend')}"
+    return DnsApiError(message, getattr(error, "code", None), classify(error))
 
 
 class AliApi(DnsBase):
@@ -55,30 +38,53 @@ class AliApi(DnsBase):
             endpoint=endpoint or aliyun_endpoint,
         )
         self._client = Alidns20150109Client(config)
+        self.batch_size = 100
+        self.batch_timeout = 60
 
-    def get_domain(self) -> List[Domain]:
-        describe_domains_request = alidns_20150109_models.DescribeDomainsRequest()
+    def normalize_line(self, line: str) -> str:
+        return parse_line(line)
+
+    def _describe_domains(self, page_number: int = 1, page_size: int = 100) -> Tuple[int, List]:
+        """读取一页主域名, 返回 (主域名总数, 当前页主域名)"""
+        describe_domains_request = alidns_20150109_models.DescribeDomainsRequest(page_number=page_number, page_size=page_size)
         runtime = util_models.RuntimeOptions()
-        data = []
         try:
             result = self._client.describe_domains_with_options(
                 describe_domains_request, runtime
             )
-            for domain in result.body.domains.domain:
-                data.append(
-                    Domain(
-                        domain_name=domain.domain_name,
-                        create_time=date_to_timestamp(domain.create_time),
-                        record_count=domain.record_count
-                    )
-                )
-            return data
+            return result.body.total_count, result.body.domains.domain
         except Exception as error:
-            print(error.message)
-            print(error.data.get("Recommend"))
-            UtilClient.assert_as_string(error.message)
+            raise api_error(error) from error
+
+    def _domain_list(self) -> List:
+        # 默认每页只返回 20 个主域名, 按最大的 100 个一页分页读取全部主域名
+        return list(paginate(lambda index: self._describe_domains(page_number=index + 1), 100, self.page_workers))
+
+    def get_domain(self) -> List[Domain]:
+        data = []
+        for domain in self._domain_list():
+            data.append(
+                Domain(
+                    domain_name=domain.domain_name,
+                    create_time=date_to_timestamp(domain.create_time),
+                    record_count=domain.record_count
+                )
+            )
+        return data
+
+    def _load_domain_metadata(self) -> Dict[str, dict]:
+        return {
+            domain.domain_name: {
+                "create_time": date_to_timestamp(domain.create_time),
+                "record_count": domain.record_count,
+                "domain_id": domain.domain_id,
+                "grade": domain.version_code,
+            }
+            for domain in self._domain_list()
+        }
 
-    def _get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, page_number: int = 1, page_size: int = 200) -> List[Record]:
+    def _get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, page_number: int = 1, page_size: int = 200) -> Tuple[int, List[Record]]:
+        """读取一页解析记录, 返回 (记录总数, 当前页记录)"""
         data = []
         describe_domain_records_request = (
             alidns_20150109_models.DescribeDomainRecordsRequest(
@@ -95,9 +101,6 @@ class AliApi(DnsBase):
             result = self._client.describe_domain_records_with_options(
                 describe_domain_records_request, runtime
             )
-            max_page_number = ceil(result.body.total_count / page_size)
-            if page_number > max_page_number:
-                return
             for record in result.body.domain_records.record:
                 data.append(
                     Record(
@@ -111,27 +114,27 @@ class AliApi(DnsBase):
                         update_timestamp=record.update_timestamp / 1000 if record.update_timestamp else record.create_timestamp / 1000,
                     )
                 )
-            return data
+            return result.body.total_count, data
         except Exception as error:
-            print(error.message)
-            print(error.data.get("Recommend"))
-            UtilClient.assert_as_string(error.message)
+            raise api_error(error) from error
 
-    def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None) -> List[Record]:
+    def _paginate(self, domain: str, sub_domain: str, record_type: str, line: str, page_size: int = 200) -> Iterator[Record]:
         if line is not None:
             line = parse_line(line)
-        data = []
-        page_number = 1
-        page_size = 200
-        while True:
-            record = self._get_record(
-                domain=domain, sub_domain=sub_domain, record_type=record_type, line=line, page_number=page_number, page_size=page_size
-            )
-            if record is None:
-                break
-            data.extend(record)
-            page_number += 1
-        return data
+        return paginate(
+            lambda index: self._get_record(
+                domain=domain, sub_domain=sub_domain, record_type=record_type, line=line, page_number=index + 1, page_size=page_size
+            ),
+            page_size,
+            self.page_workers,
+        )
+
+    def iter_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, **kwargs) -> Iterator[Record]:
+        """逐条返回解析记录, 第一页之后的分页并发读取"""
+        return self._paginate(domain, sub_domain, record_type, line)
+
+    def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None) -> List[Record]:
+        return list(self._paginate(domain, sub_domain, record_type, line))
 
     def create_record(self, domain: str, sub_domain: str, record_type: str, value: str, line: str = "default", ttl: int = 600) -> str:
         add_domain_record_request = alidns_20150109_models.AddDomainRecordRequest(
@@ -149,9 +152,7 @@ class AliApi(DnsBase):
             )
             return result.body.record_id
         except Exception as error:
-            print(error.message)
-            print(error.data.get("Recommend"))
-            UtilClient.assert_as_string(error.message)
+            raise api_error(error) from error
 
     def change_record( self, domain: str, sub_domain: str, record_id: str, record_type: str, value: str, line: str = "default", ttl: int = 600) -> bool:
         update_domain_record_request = alidns_20150109_models.UpdateDomainRecordRequest(
@@ -170,9 +171,7 @@ class AliApi(DnsBase):
             )
             return result.body.record_id == record_id
         except Exception as error:
-            print(error.message)
-            print(error.data.get("Recommend"))
-            UtilClient.assert_as_string(error.message)
+            raise api_error(error) from error
 
     def del_record(self, record_id: str, **kwargs) -> bool:
         """根据解析记录ID,删除解析记录"""
@@ -187,9 +186,7 @@ class AliApi(DnsBase):
             )
             return result.body.record_id == record_id
         except Exception as error:
-            print(error.message)
-            print(error.data.get("Recommend"))
-            UtilClient.assert_as_string(error.message)
+            raise api_error(error) from error
 
     def del_record_by_domain(self, domain: str, sub_domain: str) -> bool:
         """根据域名删除解析记录"""
@@ -205,6 +202,74 @@ class AliApi(DnsBase):
             )
             return result.body.rr == sub_domain
         except Exception as error:
-            print(error.message)
-            print(error.data.get("Recommend"))
-            UtilClient.assert_as_string(error.message)
+            raise api_error(error) from error
+
+    def _wait_batch_task(self, task_id: str, batch_type: str) -> List:
+        """轮询批量任务直到完成或超时, 返回任务中所有记录的执行结果"""
+        runtime = util_models.RuntimeOptions()
+        deadline = time.monotonic() + self.batch_timeout
+        while True:
+            count_request = alidns_20150109_models.DescribeBatchResultCountRequest(task_id=task_id, batch_type=batch_type)
+            result = self._client.describe_batch_result_count_with_options(count_request, runtime)
+            if result.body.status in (1, 2) or time.monotonic() > deadline:
+                break
+            time.sleep(1)
+        details = []
+        page_number = 1
+        while True:
+            detail_request = alidns_20150109_models.DescribeBatchResultDetailRequest(
+                task_id=task_id, batch_type=batch_type, page_number=page_number, page_size=100
+            )
+            result = self._client.describe_batch_result_detail_with_options(detail_request, runtime)
+            details.extend(result.body.batch_result_details.batch_result_detail)
+            if page_number * 100 >= (result.body.total_count or 0):
+                return details
+            page_number += 1
+
+    def _create_record_batch(self, changes: List) -> List:
+        """批量添加记录 # https://help.aliyun.com/zh/dns/api-alidns-2015-01-09-operatebatchdomain"""
+        operate_batch_domain_request = alidns_20150109_models.OperateBatchDomainRequest(
+            type="RR_ADD",
+            domain_record_info=[
+                alidns_20150109_models.OperateBatchDomainRequestDomainRecordInfo(
+                    domain=change.domain,
+                    rr=change.sub_domain,
+                    type=change.record_type,
+                    value=change.value,
+                    ttl=change.ttl or 600,
+                    line=parse_line(change.line),
+                )
+                for change in changes
+            ],
+        )
+        runtime = util_models.RuntimeOptions()
+        result = self._client.operate_batch_domain_with_options(operate_batch_domain_request, runtime)
+        outcomes = defaultdict(list)
+        for detail in self._wait_batch_task(result.body.task_id, "RR_ADD"):
+            outcomes[(detail.domain, detail.rr, detail.type, detail.value)].append(detail)
+        results = []
+        for change in changes:
+            matched = outcomes[(change.domain, change.sub_domain, change.record_type, change.value)]
+            detail = matched.pop(0) if matched else None
+            if detail is None or not detail.status:
+                results.append(RuntimeError(detail.reason if detail else "批量任务未返回执行结果"))
+            else:
+                results.append(detail.record_id or True)
+        return results
+
+    def apply_batch(self, changes: List) -> List:
+        """创建记录使用 OperateBatchDomain(RR_ADD), 阿里云没有按记录 ID 批量修改的接口, 其余变更逐条执行"""
+        results = [None] * len(changes)
+        creates = [index for index, change in enumerate(changes) if change.action == CREATE]
+        singles = [index for index, change in enumerate(changes) if change.action != CREATE]
+        for chunk in chunks(creates, self.batch_size):
+            batch = [changes[index] for index in chunk]
+            try:
+                outcomes = self._create_record_batch(batch)
+            except Exception as error:
+                outcomes = [error] * len(batch)
+            for index, outcome in zip(chunk, outcomes):
+                results[index] = outcome
+        for index, outcome in zip(singles, super().apply_batch([changes[index] for index in singles])):
+            results[index] = outcome
+        return results
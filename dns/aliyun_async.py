@@ -0,0 +1,151 @@
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+
+from typing import List, Tuple
+from urllib.parse import quote, urlencode
+
+from .aio import AsyncDnsBase
+from .lines import parse_line
+from .pagination import paginate_async
+from .retry import DnsApiError, classify_code, is_idempotent
+from .utils import Domain, Record, date_to_timestamp
+
+# 请参考 https://api.aliyun.com/product/Alidns
+aliyun_endpoint = "alidns.cn-shenzhen.aliyuncs.com"
+API_VERSION = "2015-01-09"
+
+
+def _percent(value) -> str:
+    return quote(str(value), safe="-_.~")
+
+
+def sign(params: dict, secret: str, method: str = "POST") -> str:
+    """RPC 风格接口签名 # https://help.aliyun.com/zh/sdk/product-overview/rpc-mechanism"""
+    query = "&".join(f"{_percent(key)}={_percent(value)}" for key, value in sorted(params.items()))
+    string_to_sign = f"{method}&{_percent('/')}&{_percent(query)}"
+    digest = hmac.new(f"{secret}&".encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+class AsyncAliApi(AsyncDnsBase):
+    """阿里云解析的异步接口, 自行签名, 通过共享的 AsyncHttpClient 发送请求, 不依赖阿里云 SDK
+
+    >>> cloud = AsyncAliApi(access_key_id, access_key_secret, http=AsyncHttpClient())
+    >>> await cloud.get_record("example.com", sub_domain="www", record_type="A", line="电信")
+    """
+
+    endpoint = aliyun_endpoint
+    page_size = 200
+
+    def normalize_line(self, line: str) -> str:
+        return parse_line(line)
+
+    async def _request(self, action: str, **params) -> dict:
+        params = {key: value for key, value in params.items() if value is not None}
+        idempotent = is_idempotent(action)
+
+        async def send():
+            signed = {
+                **params,
+                "Action": action,
+                "Format": "JSON",
+                "Version": API_VERSION,
+                "AccessKeyId": self._secret_id,
+                "SignatureMethod": "HMAC-SHA1",
+                "SignatureVersion": "1.0",
+                "SignatureNonce": uuid.uuid4().hex,
+                "Timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            signed["Signature"] = sign(signed, self._secret_key)
+            response = await self._http.request(
+                "POST", self.url, {"Content-Type": "application/x-www-form-urlencoded"}, urlencode(signed).encode("utf-8"), idempotent
+            )
+            try:
+                data = json.loads(response.body or b"{}")
+            except ValueError:
+                data = {"Message": response.body[:200].decode("utf-8", "replace")}
+            if response.status >= 400 or data.get("Code"):
+                message = data.get("Message") or f"HTTP {response.status}"
+                if data.get("Recommend"):
+                    message = f"{message} 诊断地址: {data.get('Recommend')}"
+                raise DnsApiError(message, data.get("Code"), classify_code(data.get("Code"), response.status))
+            return data
+
+        return await self._call(send, idempotent)
+
+    async def _describe_domains(self, page_number: int = 1, page_size: int = 100) -> Tuple[int, List[dict]]:
+        """读取一页主域名, 返回 (主域名总数, 当前页主域名)"""
+        data = await self._request("DescribeDomains", PageNumber=page_number, PageSize=page_size)
+        return data.get("TotalCount", 0), data.get("Domains", {}).get("Domain", [])
+
+    async def _domain_list(self) -> List[dict]:
+        return await paginate_async(lambda index: self._describe_domains(index + 1), 100)
+
+    async def get_domain(self) -> List[Domain]:
+        return [
+            Domain(
+                domain_name=domain["DomainName"],
+                create_time=date_to_timestamp(domain["CreateTime"]),
+                record_count=domain.get("RecordCount"),
+            )
+            for domain in await self._domain_list()
+        ]
+
+    async def _get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, page_number: int = 1) -> Tuple[int, List[Record]]:
+        """读取一页解析记录, 返回 (记录总数, 当前页记录)"""
+        data = await self._request(
+            "DescribeDomainRecords",
+            DomainName=domain,
+            RRKeyWord=sub_domain,
+            Type=record_type,
+            Line=line,
+            PageNumber=page_number,
+            PageSize=self.page_size,
+        )
+        records = [
+            Record(
+                sub_domain=record["RR"],
+                type=record["Type"],
+                value=record["Value"],
+                line=record["Line"],
+                ttl=record.get("TTL"),
+                record_id=record["RecordId"],
+                create_timestamp=record.get("CreateTimestamp", 0) / 1000,
+                update_timestamp=(record.get("UpdateTimestamp") or record.get("CreateTimestamp", 0)) / 1000,
+            )
+            for record in data.get("DomainRecords", {}).get("Record", [])
+        ]
+        return data.get("TotalCount", len(records)), records
+
+    async def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, **kwargs) -> List[Record]:
+        """读取第一页得到总数后, 并发读取剩余分页"""
+        if line is not None:
+            line = parse_line(line)
+        return await paginate_async(lambda index: self._get_record(domain, sub_domain, record_type, line, index + 1), self.page_size)
+
+    async def create_record(self, domain: str, sub_domain: str, record_type: str, value: str, line: str = "default", ttl: int = 600, **kwargs) -> str:
+        data = await self._request("AddDomainRecord", DomainName=domain, RR=sub_domain, Type=record_type, Value=value, TTL=ttl, Line=parse_line(line))
+        return data["RecordId"]
+
+    async def change_record(self, domain: str, sub_domain: str, record_id: str, record_type: str, value: str, line: str = "default", ttl: int = 600, **kwargs) -> bool:
+        data = await self._request("UpdateDomainRecord", RecordId=record_id, RR=sub_domain, Type=record_type, Value=value, TTL=ttl, Line=parse_line(line))
+        return data.get("RecordId") == record_id
+
+    async def del_record(self, record_id: str, **kwargs) -> bool:
+        data = await self._request("DeleteDomainRecord", RecordId=record_id)
+        return data.get("RecordId") == record_id
+
+    async def _load_domain_metadata(self) -> dict:
+        return {
+            domain["DomainName"]: {
+                "create_time": date_to_timestamp(domain["CreateTime"]),
+                "record_count": domain.get("RecordCount"),
+                "domain_id": domain.get("DomainId"),
+                "grade": domain.get("VersionCode"),
+            }
+            for domain in await self._domain_list()
+        }
@@ -1,7 +1,17 @@
-from typing import List
+from typing import Dict, Iterable, Iterator, List
 from abc import ABCMeta, abstractmethod
 
+from .metadata import DOMAINS, MetadataCache
+from .plan import apply_change
+from .ratelimit import TokenBucket, RateLimitedClient
+from .retry import RetryPolicy, RetryingClient
+
 class DnsBase(metaclass=ABCMeta):
+    # 分页读取解析记录时的最大并发请求数
+    page_workers = 4
+    # 服务商元数据缓存, 未设置时使用只保存在内存中的缓存
+    metadata = None
+
     @abstractmethod
     def get_domain(self) -> List:
         pass
@@ -10,6 +20,10 @@ class DnsBase(metaclass=ABCMeta):
     def get_record(self, domain: str, sub_domain: str, record_type: str, line: str, **kwargs) -> List:
         pass
 
+    def iter_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, **kwargs) -> Iterator:
+        """逐条返回解析记录, 默认调用 get_record, 支持分页的服务商由子类覆盖"""
+        yield from self.get_record(domain=domain, sub_domain=sub_domain, record_type=record_type, line=line, **kwargs)
+
     @abstractmethod
     def create_record(self, domain: str, sub_domain: str, record_type: str, value: str, line: str, ttl: int, **kwargs) -> str:
         pass
@@ -25,3 +39,65 @@ class DnsBase(metaclass=ABCMeta):
     @abstractmethod
     def del_record_by_domain(self, domain: str, sub_domain: str) -> bool:
         pass
+
+    def apply_batch(self, changes: List) -> List:
+        """批量执行变更(dns.plan.Change), 返回与 changes 一一对应的结果, 成功为接口返回值, 失败为异常对象
+
+        默认逐条调用单条记录接口, 服务商支持批量接口时由子类覆盖。
+        """
+        results = []
+        for change in changes:
+            try:
+                results.append(apply_change(self, change))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def normalize_line(self, line: str) -> str:
+        """将线路名转换为服务商返回的解析记录中使用的线路标识"""
+        return line
+
+    def set_metadata_cache(self, cache: MetadataCache) -> MetadataCache:
+        self.metadata = cache
+        return cache
+
+    def _metadata(self) -> MetadataCache:
+        if self.metadata is None:
+            self.metadata = MetadataCache()
+        return self.metadata
+
+    def domain_metadata(self) -> Dict[str, dict]:
+        """返回 {主域名: 元数据}, 元数据至少包含 record_count, 使用元数据缓存"""
+        return self._metadata().get_or_load(DOMAINS, "", self._load_domain_metadata)
+
+    def _load_domain_metadata(self) -> Dict[str, dict]:
+        return {domain.domain_name: {"create_time": domain.create_time, "record_count": domain.record_count} for domain in self.get_domain()}
+
+    def preload_metadata(self, domains: Iterable[str]) -> None:
+        """启动时批量读取 domains 用到的元数据, 之后同步过程中的元数据查询不再请求服务商"""
+        self.domain_metadata()
+
+    def _wrap_client(self) -> None:
+        """按 重试 -> 限流 -> SDK client 的顺序包装 self._client, 每次重试都会重新获取令牌"""
+        client = self._client
+        while isinstance(client, (RateLimitedClient, RetryingClient)):
+            client = client._client
+        bucket = getattr(self, "_bucket", None)
+        policy = getattr(self, "_retry_policy", None)
+        if bucket is not None:
+            client = RateLimitedClient(client, bucket)
+        if policy is not None:
+            client = RetryingClient(client, policy, on_throttle=bucket.slow_down if bucket is not None else None)
+        self._client = client
+
+    def set_rate_limit(self, qps: float, burst: float = None) -> TokenBucket:
+        """为当前实例的所有 SDK 调用设置令牌桶限流, 多线程共用同一个实例时共享同一个令牌桶"""
+        self._bucket = TokenBucket(qps, burst)
+        self._wrap_client()
+        return self._bucket
+
+    def set_retry(self, policy: RetryPolicy) -> RetryPolicy:
+        """为当前实例的所有 SDK 调用设置重试策略, 限流及临时性错误按指数退避重试"""
+        self._retry_policy = policy
+        self._wrap_client()
+        return policy
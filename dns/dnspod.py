@@ -1,8 +1,11 @@
 #!/bin/env python3
 
 import json
+import time
 
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from tencentcloud.common import credential
 from tencentcloud.common.profile.client_profile import ClientProfile
@@ -13,11 +16,23 @@ from tencentcloud.common.exception.tencent_cloud_sdk_exception import (
 from tencentcloud.dnspod.v20210323 import dnspod_client, models
 
 from .base import DnsBase
-from .utils import Domain, Record, date_to_timestamp
+from .metadata import DOMAINS, LINES
+from .pagination import paginate
+from .plan import CREATE, UPDATE
+from .retry import DnsApiError, classify
+from .utils import Domain, Record, date_to_timestamp, chunks
 
 
 dnspod_endpoint = "dnspod.tencentcloudapi.com"
 
+# 批量任务中尚未执行完成的记录状态
+BATCH_PENDING = ("wait", "running")
+
+
+def api_error(err: TencentCloudSDKException) -> DnsApiError:
+    """将腾讯云 SDK 异常转换为 DnsApiError, 保留错误码及错误分类"""
+    return DnsApiError(err.message, err.code, classify(err))
+
 
 class DnsPodApi(DnsBase):
     def __init__(self, secret_id, secret_key, endpoint=None):
@@ -27,60 +42,117 @@ class DnsPodApi(DnsBase):
         client_profile = ClientProfile()
         client_profile.httpProfile = http_profile
         self._client = dnspod_client.DnspodClient(cred, "", client_profile)
-        self._lines = {}
+        self._domain_ids = {}
+        self.batch_size = 100
+        self.batch_timeout = 60
 
-    def get_domain(self) -> List[Domain]:
-        data = []
+    def _describe_domains(self, offset: int = 0, limit: int = 3000) -> Tuple[int, List]:
+        """读取一页主域名, 返回 (主域名总数, 当前页主域名)"""
         req = models.DescribeDomainListRequest()
         try:
+            req.from_json_string(json.dumps({"Offset": offset, "Limit": limit}))
             result = self._client.DescribeDomainList(req)
-            for domain in result.DomainList:
-                data.append(
-                    Domain(
-                        domain_name=domain.Name,
-                        create_time=date_to_timestamp(domain.CreatedOn),
-                        record_count=domain.RecordCount,
-                    )
-                )
-            return data
+            return result.DomainCountInfo.DomainTotal, result.DomainList
         except TencentCloudSDKException as err:
-            raise SystemExit(err.message)
+            raise api_error(err) from err
+
+    def _domain_list(self) -> List:
+        # 默认每页只返回 20 个主域名, 按最大的 3000 个一页分页读取全部主域名
+        return list(paginate(lambda index: self._describe_domains(offset=index * 3000), 3000, self.page_workers))
+
+    def get_domain(self) -> List[Domain]:
+        data = []
+        for domain in self._domain_list():
+            data.append(
+                Domain(
+                    domain_name=domain.Name,
+                    create_time=date_to_timestamp(domain.CreatedOn),
+                    record_count=domain.RecordCount,
+                )
+            )
+        return data
+
+    def _load_domain_metadata(self) -> Dict[str, dict]:
+        return {
+            domain.Name: {
+                "create_time": date_to_timestamp(domain.CreatedOn),
+                "record_count": domain.RecordCount,
+                "domain_id": domain.DomainId,
+                "grade": domain.Grade,
+            }
+            for domain in self._domain_list()
+        }
+
+    def _domain_grade(self, domain: str) -> str:
+        return (self._metadata().get(DOMAINS) or {}).get(domain, {}).get("grade") or "D_FREE"
 
-    def get_lines(self, domain: str, domain_grade: str = "D_FREE") -> List:
+    def get_lines(self, domain: str, domain_grade: str = None) -> List:
         """DomainGrade: 
             旧套餐: D_FREE、D_PLUS、D_EXTRA、D_EXPERT、D_ULTRA 分别对应免费套餐、个人豪华、企业1、企业2、企业3。
             新套餐: DP_FREE、DP_PLUS、DP_EXTRA、DP_EXPERT、DP_ULTRA 分别对应新免费、个人专业版、企业创业版、企业标准版、企业旗舰版。
+        未指定时使用元数据缓存中该主域名的套餐, 没有缓存时为 D_FREE。线路列表保存在元数据缓存中。
         """
-        if self._lines.get(domain):
-            return self._lines.get(domain)
+        domain_grade = domain_grade or self._domain_grade(domain)
+        return self._metadata().get_or_load(LINES, f"{domain}|{domain_grade}", lambda: self._load_lines(domain, domain_grade))
+
+    def _load_lines(self, domain: str, domain_grade: str) -> List[str]:
         req = models.DescribeRecordLineListRequest()
         try:
             params = {"Domain": domain, "DomainGrade": domain_grade}
             req.from_json_string(json.dumps(params))
             result = self._client.DescribeRecordLineList(req)
-            self._lines[domain] = [line.Name for line in result.LineList]
-            return self._lines.get(domain)
+            return [line.Name for line in result.LineList]
         except TencentCloudSDKException as err:
-            raise SystemExit(err.message)
+            raise api_error(err) from err
 
     def verify_line(self, domain: str, line: str) -> None:
-        lines = self.get_lines(domain)
+        if line in self.get_lines(domain):
+            return
+        # 缓存的线路列表可能已过时(例如套餐升级), 重新读取一次后再判断
+        self._metadata().invalidate(LINES, f"{domain}|{self._domain_grade(domain)}")
+        self._metadata().invalidate(DOMAINS)
+        self.domain_metadata()
         assert (
-            line in lines
+            line in self.get_lines(domain)
         ), f"{line} 不是有效的线路名, 请通过 get_lines 方法获取所有线路名"
 
-    def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, keyword: str = None, limit: int = 200, offset: int = 0, **kwargs) -> List[Record]:
-        """获取域名解析记录 # https://cloud.tencent.com/document/api/1427/56166
-        >>> cloud = DnsPod(secret_id, secret_key)
-        # 获取域名所有解析记录
-        >>> cloud.get_record("test.com")
-        # 获取子域名所有解析记录
-        >>> cloud.get_record("test.com", sub_domain="www")
-        # 通过记录值，获取解析记录
-        >>> cloud.get_record("test.com", keyword="1.2.2.1")
-        """
+    def preload_metadata(self, domains: Iterable[str]) -> None:
+        """读取主域名列表及所有主域名的线路列表, 已缓存的不再请求"""
+        self.domain_metadata()
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            list(executor.map(self.get_lines, domains))
+
+    def _get_record(self, params: dict) -> Tuple[int, List[Record]]:
+        """读取一页解析记录, 返回 (记录总数, 当前页记录)"""
         data = []
-        params = {"Domain": domain, "Limit": limit, "Offset": offset}
+        try:
+            req = models.DescribeRecordListRequest()
+            req.from_json_string(json.dumps(params))
+            result = self._client.DescribeRecordList(req)
+        except TencentCloudSDKException as err:
+            # 没有符合条件的解析记录时接口返回 ResourceNotFound.NoDataOfRecord 错误
+            if err.code == "ResourceNotFound.NoDataOfRecord":
+                return 0, data
+            raise api_error(err) from err
+        for record in result.RecordList:
+            # 接口没有返回创建时间, 创建时间和更新时间都使用 UpdatedOn
+            updated_on = date_to_timestamp(record.UpdatedOn)
+            data.append(
+                Record(
+                    sub_domain=record.Name,
+                    type=record.Type,
+                    record_id=record.RecordId,
+                    value=record.Value,
+                    line=record.Line,
+                    ttl=record.TTL,
+                    create_timestamp=updated_on,
+                    update_timestamp=updated_on,
+                )
+            )
+        return result.RecordCountInfo.TotalCount, data
+
+    def _paginate(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, keyword: str = None, limit: int = 200, offset: int = 0, **kwargs) -> Iterator[Record]:
+        params = {"Domain": domain, "Limit": limit}
         if sub_domain is not None:
             params["Subdomain"] = sub_domain
         if record_type is not None:
@@ -91,32 +163,29 @@ class DnsPodApi(DnsBase):
         if keyword is not None:
             params["Keyword"] = keyword
         params.update(kwargs)
-        has_next_page = True
-        try:
-            while has_next_page:
-                req = models.DescribeRecordListRequest()
-                req.from_json_string(json.dumps(params))
-                result = self._client.DescribeRecordList(req)
-                list_count = result.RecordCountInfo.ListCount + params["Offset"]
-                if list_count == result.RecordCountInfo.TotalCount:
-                    has_next_page = False
-                params["Offset"] += limit
-                for record in result.RecordList:
-                    data.append(
-                        Record(
-                            sub_domain=record.Name,
-                            type=record.Type,
-                            record_id=record.RecordId,
-                            value=record.Value,
-                            line=record.Line,
-                            ttl=record.TTL,
-                            create_timestamp=date_to_timestamp(record.UpdatedOn),
-                            update_timestamp=date_to_timestamp(record.UpdatedOn),
-                        )
-                    )
-            return data
-        except TencentCloudSDKException as err:
-            return []
+
+        def fetch_page(index):
+            total, data = self._get_record({**params, "Offset": offset + index * limit})
+            return total - offset, data
+
+        return paginate(fetch_page, limit, self.page_workers)
+
+    def iter_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, keyword: str = None, limit: int = 200, offset: int = 0, **kwargs) -> Iterator[Record]:
+        """逐条返回解析记录, 第一页之后的分页并发读取, 参数同 get_record"""
+        return self._paginate(domain, sub_domain, record_type, line, keyword, limit, offset, **kwargs)
+
+    def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, keyword: str = None, limit: int = 200, offset: int = 0, **kwargs) -> List[Record]:
+        """获取域名解析记录 # https://cloud.tencent.com/document/api/1427/56166
+        >>> cloud = DnsPod(secret_id, secret_key)
+        # 获取域名所有解析记录
+        >>> cloud.get_record("test.com")
+        # 获取子域名所有解析记录
+        >>> cloud.get_record("test.com", sub_domain="www")
+        # 通过记录值，获取解析记录
+        >>> cloud.get_record("test.com", keyword="1.2.2.1")
+        """
+        return list(self._paginate(domain, sub_domain, record_type, line, keyword, limit, offset, **kwargs))
+
     def create_record(self, domain: str, sub_domain: str, record_type: str, value: str, line: str = "默认", ttl: int = 600, **kwargs) -> str:
         """添加域名解析记录"""
         try:
@@ -135,7 +204,7 @@ class DnsPodApi(DnsBase):
             result = self._client.CreateRecord(req)
             return result.RecordId
         except TencentCloudSDKException as err:
-            raise SystemExit(sub_domain, err.message)
+            raise api_error(err) from err
 
     def change_record( self, domain: str, sub_domain: str, record_id: int, record_type: str, value: str, line: str = "默认", ttl=600, **kwargs) -> bool:
         self.verify_line(domain, line)
@@ -146,6 +215,7 @@ class DnsPodApi(DnsBase):
             "RecordType": record_type,
             "RecordLine": line,
             "RecordId": record_id,
+            "TTL": ttl,
         }
         try:
             req = models.ModifyRecordRequest()
@@ -153,7 +223,7 @@ class DnsPodApi(DnsBase):
             result = self._client.ModifyRecord(req)
             return result.RecordId == record_id
         except TencentCloudSDKException as err:
-            raise SystemExit(err)
+            raise api_error(err) from err
 
     def del_record(self, domain: str, record_id: int) -> bool:
         try:
@@ -163,10 +233,112 @@ class DnsPodApi(DnsBase):
             self._client.DeleteRecord(req)
             return True
         except TencentCloudSDKException as err:
-            raise SystemExit(err)
+            raise api_error(err) from err
 
     def del_record_by_domain(self, domain: str, sub_domain: str = None) -> bool:
         record_list = self.get_record(domain=domain, sub_domain=sub_domain)
         for record in record_list:
             self.del_record(domain=domain, record_id=record.record_id)
         return True
+
+    def get_domain_id(self, domain: str) -> int:
+        if domain not in self._domain_ids:
+            domain_id = (self._metadata().get(DOMAINS) or {}).get(domain, {}).get("domain_id")
+            if domain_id is not None:
+                self._domain_ids[domain] = domain_id
+                return domain_id
+            req = models.DescribeDomainRequest()
+            try:
+                req.from_json_string(json.dumps({"Domain": domain}))
+                result = self._client.DescribeDomain(req)
+                self._domain_ids[domain] = result.DomainInfo.DomainId
+            except TencentCloudSDKException as err:
+                raise api_error(err) from err
+        return self._domain_ids[domain]
+
+    def _wait_batch_task(self, job_id: int) -> List:
+        """轮询批量任务直到所有记录执行完成或超时, 返回任务中所有记录的执行结果"""
+        deadline = time.monotonic() + self.batch_timeout
+        while True:
+            req = models.DescribeBatchTaskRequest()
+            req.from_json_string(json.dumps({"JobId": job_id}))
+            result = self._client.DescribeBatchTask(req)
+            records = [record for detail in result.DetailList or [] for record in detail.RecordList or []]
+            pending = [record for record in records if record.Status in BATCH_PENDING]
+            if (records and not pending) or time.monotonic() > deadline:
+                return records
+            time.sleep(1)
+
+    def _create_record_batch(self, domain: str, changes: List) -> List:
+        """批量添加记录 # https://cloud.tencent.com/document/api/1427/56195"""
+        for change in changes:
+            self.verify_line(domain, change.line)
+        params = {
+            "DomainIdList": [str(self.get_domain_id(domain))],
+            "RecordList": [
+                {"SubDomain": change.sub_domain, "RecordType": change.record_type, "RecordLine": change.line, "Value": change.value, "TTL": change.ttl or 600}
+                for change in changes
+            ],
+        }
+        req = models.CreateRecordBatchRequest()
+        req.from_json_string(json.dumps(params))
+        result = self._client.CreateRecordBatch(req)
+        outcomes = defaultdict(list)
+        for record in self._wait_batch_task(result.JobId):
+            outcomes[(record.SubDomain, record.RecordType, record.RecordLine, record.Value)].append(record)
+        results = []
+        for change in changes:
+            matched = outcomes[(change.sub_domain, change.record_type, change.line, change.value)]
+            record = matched.pop(0) if matched else None
+            if record is None or record.Status != "success":
+                results.append(RuntimeError(record.ErrMsg if record else "批量任务未返回执行结果"))
+            else:
+                results.append(record.RecordId or True)
+        return results
+
+    def _modify_record_batch(self, value: str, changes: List) -> List:
+        """批量修改记录值 # https://cloud.tencent.com/document/api/1427/56194"""
+        params = {"RecordIdList": [change.record_id for change in changes], "Change": "value", "ChangeTo": value}
+        req = models.ModifyRecordBatchRequest()
+        req.from_json_string(json.dumps(params))
+        result = self._client.ModifyRecordBatch(req)
+        outcomes = {record.RecordId: record for record in self._wait_batch_task(result.JobId)}
+        results = []
+        for change in changes:
+            record = outcomes.get(change.record_id)
+            if record is None or record.Status != "success":
+                results.append(RuntimeError(record.ErrMsg if record else "批量任务未返回执行结果"))
+            else:
+                results.append(True)
+        return results
+
+    def apply_batch(self, changes: List) -> List:
+        """创建记录使用 CreateRecordBatch, 修改记录值使用 ModifyRecordBatch (按主域名及目标值分组), 其余变更逐条执行
+
+        ModifyRecordBatch 一次只能修改一个字段, 同时需要修改 TTL 的记录逐条调用 ModifyRecord。
+        """
+        results = [None] * len(changes)
+        groups = defaultdict(list)
+        singles = []
+        for index, change in enumerate(changes):
+            if change.action == CREATE:
+                groups[(CREATE, change.domain, None)].append(index)
+            elif change.action == UPDATE and change.value != change.old_value and change.ttl in (None, change.old_ttl):
+                groups[(UPDATE, change.domain, change.value)].append(index)
+            else:
+                singles.append(index)
+        for (action, domain, value), indexes in groups.items():
+            for chunk in chunks(indexes, self.batch_size):
+                batch = [changes[index] for index in chunk]
+                try:
+                    if action == CREATE:
+                        outcomes = self._create_record_batch(domain, batch)
+                    else:
+                        outcomes = self._modify_record_batch(value, batch)
+                except (TencentCloudSDKException, DnsApiError) as err:
+                    outcomes = [err] * len(batch)
+                for index, outcome in zip(chunk, outcomes):
+                    results[index] = outcome
+        for index, outcome in zip(singles, super().apply_batch([changes[index] for index in singles])):
+            results[index] = outcome
+        return results
@@ -0,0 +1,185 @@
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlsplit
+
+from .aio import AsyncDnsBase
+from .metadata import DOMAINS, LINES
+from .pagination import paginate_async
+from .retry import DnsApiError, classify_code, is_idempotent
+from .utils import Domain, Record, date_to_timestamp
+
+dnspod_endpoint = "dnspod.tencentcloudapi.com"
+API_VERSION = "2021-03-23"
+SERVICE = "dnspod"
+CONTENT_TYPE = "application/json; charset=utf-8"
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sign(secret_id: str, secret_key: str, host: str, action: str, payload: bytes, timestamp: int) -> str:
+    """TC3-HMAC-SHA256 签名, 返回 Authorization 头 # https://cloud.tencent.com/document/api/1427/56189"""
+    date = time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+    canonical_request = "\n".join(
+        [
+            "POST",
+            "/",
+            "",
+            f"content-type:{CONTENT_TYPE}\nhost:{host}\nx-tc-action:{action.lower()}\n",
+            "content-type;host;x-tc-action",
+            hashlib.sha256(payload).hexdigest(),
+        ]
+    )
+    scope = f"{date}/{SERVICE}/tc3_request"
+    string_to_sign = f"TC3-HMAC-SHA256\n{timestamp}\n{scope}\n{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+    key = _hmac(_hmac(_hmac(f"TC3{secret_key}".encode("utf-8"), date), SERVICE), "tc3_request")
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"TC3-HMAC-SHA256 Credential={secret_id}/{scope}, SignedHeaders=content-type;host;x-tc-action, Signature={signature}"
+
+
+class AsyncDnsPodApi(AsyncDnsBase):
+    """DNSPod 的异步接口, 自行签名, 通过共享的 AsyncHttpClient 发送请求, 不依赖腾讯云 SDK
+
+    线路列表使用元数据缓存, 与 DnsPodApi 相同。
+    >>> cloud = AsyncDnsPodApi(secret_id, secret_key, http=AsyncHttpClient())
+    >>> await cloud.get_record("example.com", sub_domain="www", record_type="A", line="电信")
+    """
+
+    endpoint = dnspod_endpoint
+    page_size = 200
+
+    def __init__(self, secret_id: str, secret_key: str, endpoint: str = None, http=None):
+        super().__init__(secret_id, secret_key, endpoint, http)
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def _request(self, action: str, **params) -> dict:
+        payload = json.dumps({key: value for key, value in params.items() if value is not None}).encode("utf-8")
+        host = urlsplit(self.url).netloc
+        idempotent = is_idempotent(action)
+
+        async def send():
+            timestamp = int(time.time())
+            headers = {
+                "Authorization": sign(self._secret_id, self._secret_key, host, action, payload, timestamp),
+                "Content-Type": CONTENT_TYPE,
+                "X-TC-Action": action,
+                "X-TC-Timestamp": str(timestamp),
+                "X-TC-Version": API_VERSION,
+            }
+            response = await self._http.request("POST", self.url, headers, payload, idempotent)
+            try:
+                data = json.loads(response.body or b"{}").get("Response", {})
+            except ValueError:
+                data = {"Error": {"Message": response.body[:200].decode("utf-8", "replace")}}
+            error = data.get("Error")
+            if error or response.status >= 400:
+                error = error or {}
+                raise DnsApiError(error.get("Message") or f"HTTP {response.status}", error.get("Code"), classify_code(error.get("Code"), response.status))
+            return data
+
+        return await self._call(send, idempotent)
+
+    async def _describe_domains(self, offset: int = 0, limit: int = 3000) -> Tuple[int, List[dict]]:
+        """读取一页主域名, 返回 (主域名总数, 当前页主域名)"""
+        data = await self._request("DescribeDomainList", Offset=offset, Limit=limit)
+        return data.get("DomainCountInfo", {}).get("DomainTotal", 0), data.get("DomainList", [])
+
+    async def _domain_list(self) -> List[dict]:
+        return await paginate_async(lambda index: self._describe_domains(index * 3000), 3000)
+
+    async def get_domain(self) -> List[Domain]:
+        return [
+            Domain(domain_name=domain["Name"], create_time=date_to_timestamp(domain["CreatedOn"]), record_count=domain.get("RecordCount"))
+            for domain in await self._domain_list()
+        ]
+
+    async def _load_domain_metadata(self) -> Dict[str, dict]:
+        return {
+            domain["Name"]: {
+                "create_time": date_to_timestamp(domain["CreatedOn"]),
+                "record_count": domain.get("RecordCount"),
+                "domain_id": domain.get("DomainId"),
+                "grade": domain.get("Grade"),
+            }
+            for domain in await self._domain_list()
+        }
+
+    def _domain_grade(self, domain: str) -> str:
+        return (self._metadata().get(DOMAINS) or {}).get(domain, {}).get("grade") or "D_FREE"
+
+    async def get_lines(self, domain: str, domain_grade: str = None) -> List[str]:
+        domain_grade = domain_grade or self._domain_grade(domain)
+        key = f"{domain}|{domain_grade}"
+        lines = self._metadata().get(LINES, key)
+        if lines is not None:
+            return lines
+        # 并发的任务共用同一个请求
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self._load_lines(domain, domain_grade))
+            loading.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(loading)
+
+    async def _load_lines(self, domain: str, domain_grade: str) -> List[str]:
+        data = await self._request("DescribeRecordLineList", Domain=domain, DomainGrade=domain_grade)
+        lines = [line["Name"] for line in data.get("LineList", [])]
+        self._metadata().put(LINES, f"{domain}|{domain_grade}", lines)
+        return lines
+
+    async def verify_line(self, domain: str, line: str) -> None:
+        if line in await self.get_lines(domain):
+            return
+        # 缓存的线路列表可能已过时(例如套餐升级), 重新读取一次后再判断
+        self._metadata().invalidate(LINES, f"{domain}|{self._domain_grade(domain)}")
+        self._metadata().invalidate(DOMAINS)
+        await self.domain_metadata()
+        assert line in await self.get_lines(domain), f"{line} 不是有效的线路名, 请通过 get_lines 方法获取所有线路名"
+
+    async def preload_metadata(self, domains: Iterable[str]) -> None:
+        await self.domain_metadata()
+        await asyncio.gather(*(self.get_lines(domain) for domain in domains))
+
+    async def _get_record(self, params: dict, offset: int) -> Tuple[int, List[Record]]:
+        """读取一页解析记录, 返回 (记录总数, 当前页记录)"""
+        try:
+            data = await self._request("DescribeRecordList", **params, Limit=self.page_size, Offset=offset)
+        except DnsApiError as error:
+            # 没有符合条件的解析记录时接口返回 ResourceNotFound.NoDataOfRecord 错误
+            if error.code == "ResourceNotFound.NoDataOfRecord":
+                return 0, []
+            raise
+        records = []
+        for record in data.get("RecordList", []):
+            # 接口没有返回创建时间, 创建时间和更新时间都使用 UpdatedOn
+            updated_on = date_to_timestamp(record["UpdatedOn"])
+            records.append(Record(record["Name"], record["Type"], record["Value"], record["Line"], record.get("TTL"), record["RecordId"], updated_on, updated_on))
+        return data.get("RecordCountInfo", {}).get("TotalCount", len(records)), records
+
+    async def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, **kwargs) -> List[Record]:
+        """读取第一页得到总数后, 并发读取剩余分页"""
+        if line is not None:
+            await self.verify_line(domain, line)
+        params = {"Domain": domain, "Subdomain": sub_domain, "RecordType": record_type, "RecordLine": line, **kwargs}
+        return await paginate_async(lambda index: self._get_record(params, index * self.page_size), self.page_size)
+
+    async def create_record(self, domain: str, sub_domain: str, record_type: str, value: str, line: str = "默认", ttl: int = 600, **kwargs) -> int:
+        await self.verify_line(domain, line)
+        data = await self._request("CreateRecord", Domain=domain, SubDomain=sub_domain, RecordType=record_type, RecordLine=line, Value=value, TTL=ttl, **kwargs)
+        return data["RecordId"]
+
+    async def change_record(self, domain: str, sub_domain: str, record_id: int, record_type: str, value: str, line: str = "默认", ttl: int = 600, **kwargs) -> bool:
+        await self.verify_line(domain, line)
+        data = await self._request(
+            "ModifyRecord", Domain=domain, SubDomain=sub_domain, RecordId=record_id, RecordType=record_type, RecordLine=line, Value=value, TTL=ttl, **kwargs
+        )
+        return data.get("RecordId") == record_id
+
+    async def del_record(self, record_id: int, domain: str = None, **kwargs) -> bool:
+        await self._request("DeleteRecord", Domain=domain, RecordId=record_id)
+        return True
@@ -0,0 +1,299 @@
+import json
+import time
+import random
+import itertools
+from threading import Lock, Thread
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+from urllib.parse import parse_qsl
+
+from .base import DnsBase
+from .pagination import paginate
+from .retry import DnsApiError, THROTTLED, TRANSIENT
+from .utils import Domain, Record
+
+
+class FakeClient:
+    """内存中的 DNS 服务商接口, 用于测试及性能基准
+
+    latency: 每次接口调用的延迟秒数; error_rate: 随机返回临时性错误(InternalError)的概率;
+    qps: 服务端每秒请求数限制, 超过时返回限流错误(Throttling), 为 None 时不限制。
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, qps: float = None, seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.qps = qps
+        self.calls = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._zones = defaultdict(dict)
+        self._ids = itertools.count(1)
+        self._window = []
+        self._lock = Lock()
+
+    def _call(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+            now = time.monotonic()
+            if self.qps:
+                self._window = [t for t in self._window if now - t < 1]
+                if len(self._window) >= self.qps:
+                    self.errors[THROTTLED] += 1
+                    raise DnsApiError("Request was denied due to request throttling.", "Throttling", THROTTLED)
+                self._window.append(now)
+            failed = self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            with self._lock:
+                self.errors[TRANSIENT] += 1
+            raise DnsApiError("The request processing has failed due to some unknown error.", "InternalError", TRANSIENT)
+
+    def list_domains(self) -> List[str]:
+        self._call("list_domains")
+        return list(self._zones)
+
+    def list_records(self, domain: str, offset: int, limit: int, sub_domain: str = None, record_type: str = None, line: str = None, exact: bool = False):
+        """返回 (总数, 当前页记录)
+
+        与阿里云 RRKeyWord 相同, 子域名默认按关键字模糊匹配(查询 shop 会返回 shop2、myshop), exact 为 True 时精确匹配(DNSPod)。
+        """
+        self._call("list_records")
+        with self._lock:
+            records = [
+                record
+                for record in self._zones[domain].values()
+                if (sub_domain is None or (record.sub_domain == sub_domain if exact else sub_domain in record.sub_domain))
+                and (record_type is None or record.type == record_type)
+                and (line is None or record.line == line)
+            ]
+        return len(records), records[offset:offset + limit]
+
+    def add_record(self, domain: str, record: Record) -> int:
+        self._call("add_record")
+        with self._lock:
+            record_id = next(self._ids)
+            self._zones[domain][record_id] = record._replace(record_id=record_id)
+        return record_id
+
+    def update_record(self, domain: str, record_id: int, **fields) -> bool:
+        self._call("update_record")
+        with self._lock:
+            record = self._zones[domain].get(record_id)
+            if record is None:
+                raise DnsApiError(f"记录不存在: {record_id}", "InvalidParameter.RecordIdInvalid")
+            self._zones[domain][record_id] = record._replace(update_timestamp=time.time(), **fields)
+        return True
+
+    def find_domain(self, record_id: int) -> str:
+        """返回记录所在的主域名, 阿里云接口修改及删除记录时不传主域名"""
+        with self._lock:
+            return next((domain for domain, records in self._zones.items() if record_id in records), None)
+
+    def delete_record(self, domain: str, record_id: int) -> bool:
+        self._call("delete_record")
+        with self._lock:
+            if self._zones[domain].pop(record_id, None) is None:
+                raise DnsApiError(f"记录不存在: {record_id}", "InvalidParameter.RecordIdInvalid")
+        return True
+
+
+class FakeDnsApi(DnsBase):
+    """基于 FakeClient 的 DnsBase 实现, 线路名与 DNSPod 相同, 直接使用中文线路名, 子域名与阿里云相同按关键字模糊匹配
+
+    >>> cloud = FakeDnsApi(latency=0.02, error_rate=0.01, page_size=100)
+    >>> cloud.create_record("example.com", "www", "A", "1.1.1.1", line="电信")
+    """
+
+    def __init__(self, secret_id=None, secret_key=None, latency: float = 0.0, error_rate: float = 0.0, page_size: int = 200, qps: float = None, seed: int = None):
+        self._client = FakeClient(latency=latency, error_rate=error_rate, qps=qps, seed=seed)
+        self.page_size = page_size
+
+    @property
+    def calls(self) -> Counter:
+        return self._client.calls
+
+    @property
+    def errors(self) -> Counter:
+        return self._client.errors
+
+    def get_domain(self) -> List[Domain]:
+        return [Domain(domain_name=domain, create_time=0, record_count=None) for domain in self._client.list_domains()]
+
+    def iter_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, **kwargs) -> Iterator[Record]:
+        return self._paginate(domain, sub_domain, record_type, line)
+
+    def _paginate(self, domain: str, sub_domain: str, record_type: str, line: str) -> Iterator[Record]:
+        return paginate(
+            lambda index: self._client.list_records(domain, index * self.page_size, self.page_size, sub_domain, record_type, line),
+            self.page_size,
+            self.page_workers,
+        )
+
+    def get_record(self, domain: str, sub_domain: str = None, record_type: str = None, line: str = None, **kwargs) -> List[Record]:
+        return list(self._paginate(domain, sub_domain, record_type, line))
+
+    def create_record(self, domain: str, sub_domain: str, record_type: str, value: str, line: str = "默认", ttl: int = 600, **kwargs) -> int:
+        now = time.time()
+        return self._client.add_record(domain, Record(sub_domain, record_type, value, line, ttl, None, now, now))
+
+    def change_record(self, domain: str, sub_domain: str, record_id: int, record_type: str, value: str, line: str = "默认", ttl: int = 600, **kwargs) -> bool:
+        return self._client.update_record(domain, record_id, sub_domain=sub_domain, type=record_type, value=value, line=line, ttl=ttl)
+
+    def del_record(self, record_id: int, domain: str = None, **kwargs) -> bool:
+        return self._client.delete_record(domain, record_id)
+
+    def del_record_by_domain(self, domain: str, sub_domain: str) -> bool:
+        for record in self.get_record(domain, sub_domain=sub_domain):
+            if record.sub_domain != sub_domain:
+                continue
+            self.del_record(record.record_id, domain=domain)
+        return True
+
+
+# 模拟的 DNSPod 线路列表
+FAKE_DNSPOD_LINES = ["默认", "电信", "联通", "移动", "境外"]
+
+
+class FakeHttpHandler(BaseHTTPRequestHandler):
+    """模拟阿里云解析及 DNSPod 的 HTTP 接口, 数据保存在 server.client(FakeClient) 中, 用于测试异步接口
+
+    带 X-TC-Action 头的请求按 DNSPod 接口处理, 其余按阿里云 RPC 接口处理, 两种请求都会校验签名。
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("X-TC-Action"):
+            status, data = self._dnspod(self.headers["X-TC-Action"], body)
+        else:
+            status, data = self._aliyun(dict(parse_qsl(body.decode("utf-8"))))
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+    def _dnspod(self, action: str, body: bytes) -> tuple:
+        from .dnspod_async import sign
+
+        authorization = sign(self.server.secret_id, self.server.secret_key, self.headers["Host"], action, body, int(self.headers.get("X-TC-Timestamp") or 0))
+        if self.headers.get("Authorization") != authorization:
+            return 200, {"Response": {"Error": {"Code": "AuthFailure.SignatureFailure", "Message": "签名不正确"}}}
+        params = json.loads(body or b"{}")
+        client = self.server.client
+        try:
+            if action == "DescribeDomainList":
+                domains = client.list_domains()
+                offset, limit = params.get("Offset", 0), params.get("Limit", 20)
+                result = {
+                    "DomainCountInfo": {"DomainTotal": len(domains)},
+                    "DomainList": [
+                        {"Name": name, "CreatedOn": "2024-01-01 00:00:00", "RecordCount": 0, "DomainId": index + 1, "Grade": "DP_FREE"}
+                        for index, name in enumerate(domains)
+                    ][offset:offset + limit],
+                }
+            elif action == "DescribeRecordLineList":
+                result = {"LineList": [{"Name": name} for name in FAKE_DNSPOD_LINES]}
+            elif action == "DescribeRecordList":
+                total, records = client.list_records(params["Domain"], params.get("Offset", 0), params.get("Limit", 100), params.get("Subdomain"), params.get("RecordType"), params.get("RecordLine"), exact=True)
+                if not total:
+                    raise DnsApiError("记录列表为空。", "ResourceNotFound.NoDataOfRecord")
+                result = {
+                    "RecordCountInfo": {"TotalCount": total},
+                    "RecordList": [
+                        {"Name": r.sub_domain, "Type": r.type, "Value": r.value, "Line": r.line, "TTL": r.ttl, "RecordId": r.record_id, "UpdatedOn": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r.update_timestamp))}
+                        for r in records
+                    ],
+                }
+            elif action == "CreateRecord":
+                now = time.time()
+                record = Record(params["SubDomain"], params["RecordType"], params["Value"], params["RecordLine"], params.get("TTL"), None, now, now)
+                result = {"RecordId": client.add_record(params["Domain"], record)}
+            elif action == "ModifyRecord":
+                client.update_record(params["Domain"], params["RecordId"], sub_domain=params["SubDomain"], type=params["RecordType"], value=params["Value"], line=params["RecordLine"], ttl=params.get("TTL"))
+                result = {"RecordId": params["RecordId"]}
+            elif action == "DeleteRecord":
+                client.delete_record(params["Domain"], params["RecordId"])
+                result = {}
+            else:
+                raise DnsApiError(f"不支持的接口: {action}", "InvalidAction")
+        except DnsApiError as error:
+            return 200, {"Response": {"Error": {"Code": error.code, "Message": error.message}}}
+        return 200, {"Response": {**result, "RequestId": "fake"}}
+
+    def _aliyun(self, params: dict) -> tuple:
+        from .aliyun_async import sign
+
+        signature = params.pop("Signature", None)
+        if params.get("AccessKeyId") != self.server.secret_id or signature != sign(params, self.server.secret_key):
+            return 400, {"Code": "SignatureDoesNotMatch", "Message": "签名不正确"}
+        action = params["Action"]
+        client = self.server.client
+        try:
+            if action == "DescribeDomains":
+                domains = client.list_domains()
+                page_size = int(params.get("PageSize", 20))
+                offset = (int(params.get("PageNumber", 1)) - 1) * page_size
+                result = {
+                    "TotalCount": len(domains),
+                    "Domains": {
+                        "Domain": [
+                            {"DomainName": name, "CreateTime": "2024-01-01T00:00Z", "RecordCount": 0, "DomainId": str(index + 1), "VersionCode": "mianfei"}
+                            for index, name in enumerate(domains)
+                        ][offset:offset + page_size]
+                    },
+                }
+            elif action == "DescribeDomainRecords":
+                page_size = int(params.get("PageSize", 20))
+                offset = (int(params.get("PageNumber", 1)) - 1) * page_size
+                total, records = client.list_records(params["DomainName"], offset, page_size, params.get("RRKeyWord"), params.get("Type"), params.get("Line"))
+                result = {
+                    "TotalCount": total,
+                    "DomainRecords": {
+                        "Record": [
+                            {"RR": r.sub_domain, "Type": r.type, "Value": r.value, "Line": r.line, "TTL": r.ttl, "RecordId": str(r.record_id), "CreateTimestamp": int(r.create_timestamp * 1000), "UpdateTimestamp": int(r.update_timestamp * 1000)}
+                            for r in records
+                        ]
+                    },
+                }
+            elif action == "AddDomainRecord":
+                now = time.time()
+                record = Record(params["RR"], params["Type"], params["Value"], params["Line"], int(params.get("TTL", 600)), None, now, now)
+                result = {"RecordId": str(client.add_record(params["DomainName"], record))}
+            elif action == "UpdateDomainRecord":
+                domain = client.find_domain(int(params["RecordId"]))
+                client.update_record(domain, int(params["RecordId"]), sub_domain=params["RR"], type=params["Type"], value=params["Value"], line=params["Line"], ttl=int(params.get("TTL", 600)))
+                result = {"RecordId": params["RecordId"]}
+            elif action == "DeleteDomainRecord":
+                domain = client.find_domain(int(params["RecordId"]))
+                client.delete_record(domain, int(params["RecordId"]))
+                result = {"RecordId": params["RecordId"]}
+            else:
+                raise DnsApiError(f"不支持的接口: {action}", "InvalidAction")
+        except DnsApiError as error:
+            return 503 if error.kind == TRANSIENT else 400, {"Code": error.code, "Message": error.message}
+        return 200, {**result, "RequestId": "fake"}
+
+
+class _FakeHttpServer(ThreadingHTTPServer):
+    # 异步客户端会同时建立大量连接, 默认的 backlog(5) 会导致连接被丢弃后等待重传
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def serve_fake_api(client: FakeClient, secret_id: str = "fake-id", secret_key: str = "fake-key") -> ThreadingHTTPServer:
+    """在本地随机端口启动模拟的服务商 HTTP 接口, 返回的 server.server_port 为端口号, 用完调用 server.shutdown()"""
+    server = _FakeHttpServer(("127.0.0.1", 0), FakeHttpHandler)
+    server.client = client
+    server.secret_id = secret_id
+    server.secret_key = secret_key
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
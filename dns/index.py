@@ -0,0 +1,73 @@
+import sys
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .utils import Record
+
+
+class RecordIndex:
+    """按列存储的解析记录索引, 用于记录数较多的主域名
+
+    每个字段一列, 不为每条记录保留 Record 对象; 子域名、记录类型、线路使用 sys.intern 去重。
+    按 (子域名, 记录类型, 线路) 及记录值建立索引, 查询时才构造 Record。
+    >>> index = RecordIndex(cloud.iter_record("example.com"))
+    >>> index.get("www", "A", "电信")
+    >>> index.find_value("1.1.1.1")
+    """
+
+    __slots__ = ("_sub_domain", "_type", "_value", "_line", "_ttl", "_record_id", "_create", "_update", "_keys", "_values")
+
+    def __init__(self, records: Iterable[Record] = ()):
+        self._sub_domain: List[str] = []
+        self._type: List[str] = []
+        self._value: List[str] = []
+        self._line: List[str] = []
+        self._ttl: List[int] = []
+        self._record_id: list = []
+        self._create: List[float] = []
+        self._update: List[float] = []
+        self._keys: Dict[Tuple[str, str, str], List[int]] = {}
+        self._values: Dict[str, List[int]] = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record: Record) -> None:
+        row = len(self._value)
+        sub_domain, record_type, line = sys.intern(record.sub_domain), sys.intern(record.type), sys.intern(record.line)
+        self._sub_domain.append(sub_domain)
+        self._type.append(record_type)
+        self._value.append(record.value)
+        self._line.append(line)
+        self._ttl.append(record.ttl)
+        self._record_id.append(record.record_id)
+        self._create.append(record.create_timestamp)
+        self._update.append(record.update_timestamp)
+        self._keys.setdefault((sub_domain, record_type, line), []).append(row)
+        self._values.setdefault(record.value, []).append(row)
+
+    def _record(self, row: int) -> Record:
+        return Record(
+            self._sub_domain[row],
+            self._type[row],
+            self._value[row],
+            self._line[row],
+            self._ttl[row],
+            self._record_id[row],
+            self._create[row],
+            self._update[row],
+        )
+
+    def get(self, sub_domain: str, record_type: str, line: str) -> List[Record]:
+        return [self._record(row) for row in self._keys.get((sub_domain, record_type, line), ())]
+
+    def find_value(self, value: str) -> List[Record]:
+        """按记录值反查解析记录"""
+        return [self._record(row) for row in self._values.get(value, ())]
+
+    def keys(self) -> Iterable[Tuple[str, str, str]]:
+        return self._keys.keys()
+
+    def __len__(self) -> int:
+        return len(self._value)
+
+    def __iter__(self) -> Iterator[Record]:
+        return (self._record(row) for row in range(len(self._value)))
@@ -0,0 +1,35 @@
+"""阿里云解析线路, 同步及异步接口共用, 不依赖阿里云 SDK"""
+
+# 解析线路
+# https://help.aliyun.com/zh/dns/resolve-line-enumeration
+aliyun_lines = {
+    "default": "默认",
+    "telecom": "中国电信",
+    "unicom": "中国联通",
+    "mobile": "中国移动",
+    "oversea": "境外",
+    "edu": "中国教育网",
+    "drpeng": "中国鹏博士",
+    "btvn": "中国广电网",
+    "aliyun": "阿里云",
+    "search": "搜索引擎",
+    "internal": "中国地区",
+}
+
+# 线路名及别名到线路标识的查找表, 线路标识本身也可直接使用
+_line_codes = {
+    **{code: code for code in aliyun_lines},
+    "电信": "telecom",
+    "中国电信": "telecom",
+    "联通": "unicom",
+    "中国联通": "unicom",
+    "移动": "mobile",
+    "中国移动": "mobile",
+    "境外": "oversea",
+    "默认": "default",
+}
+
+def parse_line(line: str) -> str:
+    code = _line_codes.get(line)
+    assert code is not None, f"{line} 不是有效的线路名, 请参考: https://help.aliyun.com/zh/dns/resolve-line-enumeration"
+    return code
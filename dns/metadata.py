@@ -0,0 +1,91 @@
+import json
+import time
+import sqlite3
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    namespace TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, kind, key)
+);
+"""
+
+# 主域名列表(key 为空字符串)及每个主域名的线路列表
+DOMAINS = "domains"
+LINES = "lines"
+
+
+class MetadataCache:
+    """服务商元数据缓存(SQLite), 保存主域名列表、记录数、套餐及线路列表等很少变化的数据
+
+    创建时一次性读取 namespace 下所有未过期的数据, 之后的查询只访问内存, 不会产生网络或磁盘请求。
+    filename 为 None 时只缓存在内存中。超过 ttl 秒的数据视为过期, 由 get_or_load 重新读取。
+    namespace 用于区分不同服务商及账号。
+    >>> cache = MetadataCache("~/.cache/cf2dns/metadata.db", namespace="dnspod:xxxx")
+    >>> cache.get_or_load("lines", "example.com", load_lines)
+    """
+
+    def __init__(self, filename: Optional[str] = None, namespace: str = "default", ttl: float = 86400):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = Lock()
+        self._entries: Dict[tuple, tuple] = {}
+        self._conn = None
+        if filename:
+            self._conn = sqlite3.connect(filename, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            rows = self._conn.execute(
+                "SELECT kind, key, value, updated_at FROM metadata WHERE namespace=? AND updated_at>=?", (namespace, time.time() - ttl)
+            )
+            self._entries = {(kind, key): (json.loads(value), updated_at) for kind, key, value, updated_at in rows}
+
+    def get(self, kind: str, key: str = ""):
+        """返回未过期的缓存数据, 没有缓存时返回 None"""
+        entry = self._entries.get((kind, key))
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, kind: str, key: str, value) -> None:
+        now = time.time()
+        with self._lock:
+            self._entries[(kind, key)] = (value, now)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)",
+                        (self.namespace, kind, key, json.dumps(value, ensure_ascii=False), now),
+                    )
+
+    def get_or_load(self, kind: str, key: str, load: Callable[[], object]):
+        value = self.get(kind, key)
+        if value is None:
+            value = load()
+            self.put(kind, key, value)
+        return value
+
+    def invalidate(self, kind: str = None, key: str = None) -> None:
+        """删除缓存, 不指定 kind 时删除 namespace 下的所有数据, 不指定 key 时删除该类型的所有数据"""
+        with self._lock:
+            self._entries = {
+                (k, name): entry
+                for (k, name), entry in self._entries.items()
+                if not ((kind is None or k == kind) and (key is None or name == key))
+            }
+            if self._conn is not None:
+                sql, params = "DELETE FROM metadata WHERE namespace=?", [self.namespace]
+                if kind is not None:
+                    sql, params = sql + " AND kind=?", params + [kind]
+                if key is not None:
+                    sql, params = sql + " AND key=?", params + [key]
+                with self._conn:
+                    self._conn.execute(sql, params)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
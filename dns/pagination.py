@@ -0,0 +1,50 @@
+import asyncio
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from typing import Awaitable, Callable, Iterator, List, Tuple
+
+from .utils import Record
+
+
+def paginate(fetch_page: Callable[[int], Tuple[int, List[Record]]], page_size: int, workers: int = 4) -> Iterator[Record]:
+    """分页读取解析记录
+
+    fetch_page(page_index) 返回 (记录总数, 当前页记录), page_index 从 0 开始。
+    先读取第一页得到记录总数, 剩余分页最多 workers 个并发读取, 按页码顺序逐条返回,
+    调用方可以在最后一页返回之前开始处理, 也不会在最后一页之后多请求一次。
+    """
+    total, records = fetch_page(0)
+    yield from records
+    pages = ceil((total or 0) / page_size)
+    if pages <= 1:
+        return
+    if workers <= 1:
+        for index in range(1, pages):
+            yield from fetch_page(index)[1]
+        return
+    executor = ThreadPoolExecutor(max_workers=min(workers, pages - 1))
+    try:
+        pending = deque()
+        next_index = 1
+        while next_index < pages or pending:
+            # 最多保留 2 * workers 个未消费的分页, 避免调用方处理较慢时缓存过多数据
+            while next_index < pages and len(pending) < workers * 2:
+                pending.append(executor.submit(fetch_page, next_index))
+                next_index += 1
+            yield from pending.popleft().result()[1]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def paginate_async(fetch_page: Callable[[int], Awaitable[Tuple[int, List]]], page_size: int) -> List:
+    """paginate 的协程版本, 读取第一页得到总数后并发读取剩余分页, 按页码顺序返回全部结果
+
+    并发请求数由调用方的限流及连接池限制。
+    """
+    total, items = await fetch_page(0)
+    items = list(items)
+    for _, page in await asyncio.gather(*(fetch_page(index) for index in range(1, ceil((total or 0) / page_size)))):
+        items.extend(page)
+    return items
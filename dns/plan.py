@@ -0,0 +1,121 @@
+import random
+from collections import namedtuple, defaultdict
+from typing import Dict, List
+
+from .utils import Record
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+Change = namedtuple(
+    "Change",
+    ["action", "domain", "sub_domain", "record_type", "line", "value", "record_id", "old_value", "ttl", "old_ttl"],
+    defaults=(None,),
+)
+
+ACTION_NAMES = {CREATE: "创建记录", UPDATE: "更新记录", DELETE: "删除记录"}
+
+
+def select_values(candidates: List[str], current: List[str], record_num: int, ranked: bool = False) -> List[str]:
+    """挑选目标记录值
+
+    ranked 为 False 时优先保留已经在候选列表中的现有记录值, 不足的部分从剩余候选中随机补足;
+    ranked 为 True 时 candidates 已按优劣排序, 直接取前 record_num 个。
+    """
+    candidates = list(dict.fromkeys(candidates))
+    if ranked:
+        return candidates[:record_num]
+    kept = [value for value in dict.fromkeys(current) if value in candidates][:record_num]
+    rest = [value for value in candidates if value not in kept]
+    return kept + random.sample(rest, min(record_num - len(kept), len(rest)))
+
+
+def assign_values(slots: Dict[tuple, float], candidates: Dict[tuple, List[str]], record_num: int, previous: Dict[tuple, List[str]] = None, tolerance: float = 0.25) -> Dict[tuple, List[str]]:
+    """为所有 (主域名, 子域名, 记录类型, 线路) 统一分配记录值, 使各候选 IP 承担的权重尽量均衡
+
+    slots 为 {(主域名, 子域名, 记录类型, 线路): 权重}, 每个 slot 的权重平均分摊到它的 record_num 个记录值上;
+    candidates 为 {(记录类型, 线路): 按优劣排序的候选 IP}。
+    上次分配的记录值(previous)只要仍是候选 IP 且负载不超过均值的 1 + tolerance 倍就保持不变,
+    其余从当前负载最低的候选 IP 中补足, 负载相同时排序靠前的优先。结果是确定的, 不包含随机因素。
+    """
+    previous = previous or {}
+    load = defaultdict(float)
+    totals = defaultdict(float)
+    for slot, weight in slots.items():
+        totals[slot[2:]] += weight
+    order = sorted((slot for slot in slots if candidates.get(slot[2:])), key=lambda slot: -slots[slot])
+    assigned = {}
+
+    # 第一轮先保留上次的分配, 避免被其他 slot 先占满负载
+    for slot in order:
+        ips = list(dict.fromkeys(candidates[slot[2:]]))
+        count = min(record_num, len(ips))
+        share = slots[slot] / count
+        limit = max(totals[slot[2:]] / len(ips) * (1 + tolerance), share)
+        kept = []
+        for ip in dict.fromkeys(previous.get(slot, [])):
+            if ip in ips and len(kept) < count and load[ip] + share <= limit:
+                kept.append(ip)
+                load[ip] += share
+        assigned[slot] = kept
+
+    for slot in order:
+        ips = list(dict.fromkeys(candidates[slot[2:]]))
+        count = min(record_num, len(ips))
+        share = slots[slot] / count
+        rank = {ip: i for i, ip in enumerate(ips)}
+        rest = sorted((ip for ip in ips if ip not in assigned[slot]), key=lambda ip: (load[ip], rank[ip]))
+        for ip in rest[:count - len(assigned[slot])]:
+            assigned[slot].append(ip)
+            load[ip] += share
+    return assigned
+
+
+def plan_changes(records: List[Record], values: List[str], domain: str, sub_domain: str, record_type: str, line: str, ttl: int = None) -> List[Change]:
+    """对比现有解析记录和目标记录值, 计算最少的 创建/更新/删除 操作
+
+    已存在的记录值保持不动, 多余的记录优先改写为缺少的记录值, 仍有剩余则删除, 仍有缺少则创建。
+    ttl 为 None 时不比较 TTL。
+    """
+    changes = []
+    wanted = list(dict.fromkeys(values))
+    extras = []
+    for record in records:
+        if record.value in wanted:
+            wanted.remove(record.value)
+            if ttl is not None and record.ttl != ttl:
+                changes.append(Change(UPDATE, domain, sub_domain, record_type, line, record.value, record.record_id, record.value, ttl, record.ttl))
+        else:
+            extras.append(record)
+    for record, value in zip(extras, wanted):
+        changes.append(Change(UPDATE, domain, sub_domain, record_type, line, value, record.record_id, record.value, ttl, record.ttl))
+    for record in extras[len(wanted):]:
+        changes.append(Change(DELETE, domain, sub_domain, record_type, line, None, record.record_id, record.value, ttl, record.ttl))
+    for value in wanted[len(extras):]:
+        changes.append(Change(CREATE, domain, sub_domain, record_type, line, value, None, None, ttl))
+    return changes
+
+
+def apply_change(cloud, change: Change):
+    kwargs = {} if change.ttl is None else {"ttl": change.ttl}
+    if change.action == CREATE:
+        return cloud.create_record(
+            domain=change.domain, sub_domain=change.sub_domain, record_type=change.record_type, value=change.value, line=change.line, **kwargs
+        )
+    if change.action == UPDATE:
+        return cloud.change_record(
+            domain=change.domain, sub_domain=change.sub_domain, record_id=change.record_id, record_type=change.record_type, value=change.value, line=change.line, **kwargs
+        )
+    if change.action == DELETE:
+        return cloud.del_record(domain=change.domain, record_id=change.record_id)
+    raise ValueError(f"未知的操作类型: {change.action}")
+
+
+def describe(change: Change) -> str:
+    text = f"{ACTION_NAMES.get(change.action)}: {change.sub_domain}.{change.domain} 记录: {change.record_type} 线路: {change.line}"
+    if change.action == CREATE:
+        return f"{text} 值: {change.value}"
+    if change.action == UPDATE:
+        return f"{text} 值: {change.old_value} -> {change.value} 记录ID: {change.record_id}"
+    return f"{text} 值: {change.old_value} 记录ID: {change.record_id}"
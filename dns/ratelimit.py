@@ -0,0 +1,76 @@
+import time
+import asyncio
+from functools import wraps
+from threading import Lock
+
+
+class TokenBucket:
+    """令牌桶限流器, rate 为每秒补充的令牌数, capacity 为桶容量(允许的突发请求数)
+
+    服务商返回限流错误时调用 slow_down 降低速率, 之后每次成功获取令牌逐步恢复到初始速率。
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        assert rate > 0, "rate 必须大于 0"
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def _take(self, tokens: float) -> float:
+        """尝试取出令牌, 成功返回 0, 令牌不足时返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                self.rate = min(self.base_rate, self.rate + self.base_rate * 0.02)
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """获取令牌, 令牌不足时阻塞等待, 返回等待的秒数"""
+        waited = 0.0
+        while True:
+            delay = self._take(tokens)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """acquire 的协程版本, 等待时不阻塞事件循环"""
+        waited = 0.0
+        while True:
+            delay = self._take(tokens)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def slow_down(self, factor: float = 0.5) -> None:
+        with self._lock:
+            self.rate = max(self.base_rate * 0.05, self.rate * factor)
+
+
+class RateLimitedClient:
+    """SDK client 代理, 每次调用接口前先从令牌桶中获取令牌"""
+
+    def __init__(self, client, bucket: TokenBucket):
+        self._client = client
+        self._bucket = bucket
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        @wraps(attr)
+        def wrapper(*args, **kwargs):
+            self._bucket.acquire()
+            return attr(*args, **kwargs)
+
+        return wrapper
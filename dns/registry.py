@@ -0,0 +1,82 @@
+import sys
+import time
+from importlib import import_module
+from typing import Dict, List, Union
+
+from .base import DnsBase
+
+# 内置服务商, 值为 "模块:类名", 选中时才导入对应的 SDK
+BACKENDS = {
+    "aliyun": "dns.aliyun:AliApi",
+    "dnspod": "dns.dnspod:DnsPodApi",
+}
+
+# 异步接口(dns.aio.AsyncDnsBase 子类), 只依赖标准库
+ASYNC_BACKENDS = {
+    "aliyun": "dns.aliyun_async:AsyncAliApi",
+    "dnspod": "dns.dnspod_async:AsyncDnsPodApi",
+}
+
+# 第三方服务商通过该 entry point 分组注册, 例如 setup.cfg 中:
+# [options.entry_points]
+# cf2dns.backends =
+#     huawei = cf2dns_huawei:HuaWeiApi
+ENTRY_POINT_GROUP = "cf2dns.backends"
+
+# 已加载服务商的导入耗时(秒)及导入的模块数量
+LOAD_STATS: Dict[str, tuple] = {}
+
+_loaded: Dict[str, type] = {}
+
+
+def _entry_points() -> dict:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return {}
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return {ep.name: ep.value for ep in eps}
+
+
+def register(name: str, target: Union[str, type]) -> None:
+    """注册服务商, target 为 DnsBase 子类或 "模块:类名" 字符串"""
+    if isinstance(target, str):
+        BACKENDS[name] = target
+        _loaded.pop(name, None)
+    else:
+        _loaded[name] = target
+
+
+def available() -> List[str]:
+    """返回所有可用的服务商名称, 不会导入任何 SDK"""
+    return list(dict.fromkeys([*BACKENDS, *_entry_points(), *_loaded]))
+
+
+def get_backend(name: str) -> type:
+    """按名称加载服务商类, 只导入该服务商的 SDK"""
+    if name in _loaded:
+        return _loaded[name]
+    target = BACKENDS.get(name) or _entry_points().get(name)
+    if target is None:
+        raise KeyError(f"不支持的服务商: {name}, 仅支持: {' | '.join(available())}")
+    module_name, _, attr = target.partition(":")
+    modules = len(sys.modules)
+    start = time.perf_counter()
+    backend = getattr(import_module(module_name), attr)
+    LOAD_STATS[name] = (time.perf_counter() - start, len(sys.modules) - modules)
+    assert issubclass(backend, DnsBase), f"{target} 不是 DnsBase 的子类"
+    _loaded[name] = backend
+    return backend
+
+
+def get_async_backend(name: str) -> type:
+    """按名称加载异步服务商类"""
+    target = ASYNC_BACKENDS.get(name)
+    if target is None:
+        raise KeyError(f"服务商 {name} 没有异步接口, 仅支持: {' | '.join(ASYNC_BACKENDS)}")
+    module_name, _, attr = target.partition(":")
+    return getattr(import_module(module_name), attr)
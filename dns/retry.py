@@ -0,0 +1,192 @@
+import time
+import random
+import asyncio
+from functools import wraps
+from threading import Lock
+
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# 阿里云: https://api.aliyun.com/document/Alidns/2015-01-09/errorCode
+# 腾讯云: https://cloud.tencent.com/document/api/1427/56192
+THROTTLED_CODES = ("Throttling", "RequestLimitExceeded", "ServiceUnavailable.Throttling")
+TRANSIENT_CODES = (
+    "InternalError",
+    "InternalFailure",
+    "ServiceUnavailable",
+    "ServiceBusy",
+    "RequestTimeout",
+    "ClientNetworkError",
+    "ServerNetworkError",
+    "UnknownError",
+)
+
+
+# 非幂等的接口(SDK 方法名或接口名前缀): 请求发出后超时或服务端出错时可能已经生效, 重试会创建重复的解析记录
+NON_IDEMPOTENT = ("add_domain_record", "operate_batch_domain", "AddDomainRecord", "CreateRecord", "add_record")
+
+
+class DnsApiError(Exception):
+    """服务商接口调用失败, kind 为错误分类: throttled / transient / permanent"""
+
+    def __init__(self, message: str, code: str = None, kind: str = PERMANENT):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.kind = kind
+
+
+class RetryBudgetExceeded(DnsApiError):
+    pass
+
+
+def classify(error: BaseException) -> str:
+    """根据异常类型及服务商错误码对错误分类"""
+    inner = getattr(error, "inner_exception", None)
+    if inner is not None and inner is not error:
+        return classify(inner)
+    if isinstance(error, DnsApiError):
+        return error.kind
+    # Python 3.11 之前 asyncio.TimeoutError 不是 TimeoutError 的子类
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError, OSError)):
+        return TRANSIENT
+    return classify_code(getattr(error, "code", None), getattr(error, "statusCode", None))
+
+
+def classify_code(code: str = None, status: int = None) -> str:
+    """根据服务商错误码及 HTTP 状态码对错误分类"""
+    code = str(code or "")
+    if code.startswith(THROTTLED_CODES) or status == 429:
+        return THROTTLED
+    if code.startswith(TRANSIENT_CODES) or (isinstance(status, int) and status >= 500):
+        return TRANSIENT
+    return PERMANENT
+
+
+def is_idempotent(name: str) -> bool:
+    return not name.startswith(NON_IDEMPOTENT)
+
+
+def retryable(error: BaseException, kind: str, idempotent: bool = True) -> bool:
+    """判断错误能否重试, 非幂等请求只在确定没有被服务端处理时(限流拒绝或连接未建立)重试"""
+    if kind == PERMANENT:
+        return False
+    return idempotent or kind == THROTTLED or isinstance(error, ConnectionRefusedError)
+
+
+class RetryPolicy:
+    """指数退避重试策略
+
+    只重试限流及临时性错误(非幂等请求见 retryable), 每次重试等待 [0, min(cap, base * 2 ** attempt)] 之间的随机时间(full jitter),
+    限流错误的退避基数乘以 throttle_factor。budget 为一次同步中所有调用共享的重试次数上限, 通过 reset 重置。
+    """
+
+    def __init__(self, retries: int = 3, base: float = 0.5, cap: float = 10.0, throttle_factor: float = 4.0, budget: int = 100):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.throttle_factor = throttle_factor
+        self.budget = budget
+        self._remaining = budget
+        self._lock = Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._remaining = self.budget
+
+    def _take(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    def delay(self, attempt: int, kind: str) -> float:
+        base = self.base * (self.throttle_factor if kind == THROTTLED else 1)
+        return random.uniform(0, min(self.cap, base * 2 ** attempt))
+
+    def _retry_delay(self, error: Exception, attempt: int, idempotent: bool = True, on_throttle=None):
+        """第 attempt 次调用失败后的处理, 返回重试前的等待秒数, 不能重试时返回 None, 重试次数预算用完时抛出 RetryBudgetExceeded"""
+        kind = classify(error)
+        if not retryable(error, kind, idempotent) or attempt >= self.retries:
+            return None
+        if not self._take():
+            raise RetryBudgetExceeded(f"重试次数已用完: {error}", getattr(error, "code", None), kind) from error
+        if kind == THROTTLED and on_throttle is not None:
+            on_throttle()
+        return self.delay(attempt, kind)
+
+    def call(self, func, *args, on_throttle=None, idempotent=True, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as error:
+                delay = self._retry_delay(error, attempt, idempotent, on_throttle)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def call_async(self, func, *args, on_throttle=None, idempotent=True, **kwargs):
+        """call 的协程版本, func 为协程函数, 等待期间不阻塞事件循环"""
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as error:
+                delay = self._retry_delay(error, attempt, idempotent, on_throttle)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+class RetryingClient:
+    """SDK client 代理, 对每次接口调用按 RetryPolicy 重试, NON_IDEMPOTENT 中的方法只重试限流及连接失败"""
+
+    def __init__(self, client, policy: RetryPolicy, on_throttle=None):
+        self._client = client
+        self._policy = policy
+        self._on_throttle = on_throttle
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        @wraps(attr)
+        def wrapper(*args, **kwargs):
+            return self._policy.call(attr, *args, on_throttle=self._on_throttle, idempotent=is_idempotent(name), **kwargs)
+
+        return wrapper
+
+
+class CircuitBreaker:
+    """熔断器: 连续失败 failure_threshold 次后熔断, reset_timeout 秒后放行一次试探请求, 成功则恢复"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        return not self.is_open
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
@@ -0,0 +1,83 @@
+import asyncio
+
+from threading import Lock
+from collections import defaultdict
+from typing import Dict, List
+
+from .base import DnsBase
+from .index import RecordIndex
+from .utils import Record
+
+
+class ZoneSnapshot:
+    """域名解析记录快照
+
+    每个主域名只调用一次 iter_record 拉取全部解析记录, 按 (子域名, 记录类型, 线路) 建立内存索引,
+    之后的查询都在索引上完成, 读接口调用次数从 O(子域名 × 线路) 降为 O(主域名)。
+    >>> snapshot = ZoneSnapshot(cloud)
+    >>> snapshot.get_record("example.com", sub_domain="www", record_type="A", line="电信")
+    """
+
+    def __init__(self, cloud: DnsBase):
+        self._cloud = cloud
+        self._zones: Dict[object, RecordIndex] = {}
+        self._locks = defaultdict(Lock)
+        self._lock = Lock()
+
+    def _load(self, key, fetch) -> RecordIndex:
+        with self._lock:
+            lock = self._locks[key]
+        with lock:
+            if key not in self._zones:
+                self._zones[key] = RecordIndex(fetch())
+            return self._zones[key]
+
+    def load(self, domain: str) -> RecordIndex:
+        return self._load(domain, lambda: self._cloud.iter_record(domain=domain))
+
+    def get_record(self, domain: str, sub_domain: str, record_type: str, line: str, **kwargs) -> List[Record]:
+        return self.load(domain).get(sub_domain, record_type, self._cloud.normalize_line(line))
+
+
+class SubDomainSnapshot(ZoneSnapshot):
+    """子域名解析记录快照
+
+    每个子域名只调用一次 iter_record 拉取该子域名所有类型、所有线路的解析记录,
+    同一子域名的 A / AAAA 记录及各条线路共用一次读取, 适合主域名下记录很多但只同步少数子域名的情况。
+    >>> snapshot = SubDomainSnapshot(cloud)
+    >>> snapshot.get_record("example.com", sub_domain="www", record_type="AAAA", line="电信")
+    """
+
+    def load(self, domain: str, sub_domain: str) -> RecordIndex:
+        return self._load((domain, sub_domain), lambda: self._cloud.iter_record(domain=domain, sub_domain=sub_domain))
+
+    def get_record(self, domain: str, sub_domain: str, record_type: str, line: str, **kwargs) -> List[Record]:
+        # 阿里云按关键字模糊匹配子域名, 索引按子域名精确查询
+        return self.load(domain, sub_domain).get(sub_domain, record_type, self._cloud.normalize_line(line))
+
+
+class AsyncSubDomainSnapshot:
+    """SubDomainSnapshot 的协程版本, cloud 为 AsyncDnsBase
+
+    同一子域名并发的查询共用一次 get_record 请求, 读取失败时不缓存, 下次查询重新读取。
+    >>> snapshot = AsyncSubDomainSnapshot(cloud)
+    >>> await snapshot.get_record("example.com", sub_domain="www", record_type="AAAA", line="电信")
+    """
+
+    def __init__(self, cloud):
+        self._cloud = cloud
+        self._zones: Dict[tuple, asyncio.Future] = {}
+
+    async def _fetch(self, domain: str, sub_domain: str) -> RecordIndex:
+        return RecordIndex(await self._cloud.get_record(domain=domain, sub_domain=sub_domain))
+
+    async def load(self, domain: str, sub_domain: str) -> RecordIndex:
+        key = (domain, sub_domain)
+        loading = self._zones.get(key)
+        if loading is None:
+            loading = self._zones[key] = asyncio.ensure_future(self._fetch(domain, sub_domain))
+            loading.add_done_callback(lambda future: (future.cancelled() or future.exception()) and self._zones.pop(key, None))
+        return await asyncio.shield(loading)
+
+    async def get_record(self, domain: str, sub_domain: str, record_type: str, line: str, **kwargs) -> List[Record]:
+        return (await self.load(domain, sub_domain)).get(sub_domain, record_type, self._cloud.normalize_line(line))
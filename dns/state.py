@@ -0,0 +1,125 @@
+import time
+import sqlite3
+from threading import Lock
+from typing import Iterable, List, Optional, Tuple
+
+from .base import DnsBase
+from .plan import CREATE, UPDATE, DELETE, Change
+from .utils import Record
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    namespace TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    sub_domain TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    line TEXT NOT NULL,
+    record_id NOT NULL,
+    value TEXT NOT NULL,
+    ttl INTEGER,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, domain, record_id)
+);
+CREATE INDEX IF NOT EXISTS records_key ON records (namespace, domain, sub_domain, record_type, line);
+CREATE TABLE IF NOT EXISTS verified (
+    namespace TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    sub_domain TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    line TEXT NOT NULL,
+    verified_at REAL NOT NULL,
+    PRIMARY KEY (namespace, domain, sub_domain, record_type, line)
+);
+"""
+
+
+class RecordStore:
+    """本地解析记录状态库(SQLite)
+
+    保存 cf2dns 读取或写入过的解析记录, 按 (主域名, 子域名, 记录类型, 线路) 查询。
+    某个 key 最近一次从服务商读取校验的时间超过 verify_interval 秒, 或写入失败被标记失效后,
+    get_record 返回 None, 调用方需要重新从服务商读取。
+    namespace 用于区分不同服务商及账号。
+    使用 WAL 日志及 synchronous=NORMAL, 一组写入(apply_many)只提交一次事务, 避免每条记录都同步落盘。
+    """
+
+    def __init__(self, filename: str, cloud: DnsBase, namespace: str = "default", verify_interval: int = 86400):
+        self._cloud = cloud
+        self.namespace = namespace
+        self.verify_interval = verify_interval
+        self._lock = Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _key(self, domain: str, sub_domain: str, record_type: str, line: str) -> tuple:
+        return (self.namespace, domain, sub_domain, record_type, self._cloud.normalize_line(line))
+
+    def get_record(self, domain: str, sub_domain: str, record_type: str, line: str, **kwargs) -> Optional[List[Record]]:
+        key = self._key(domain, sub_domain, record_type, line)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT verified_at FROM verified WHERE namespace=? AND domain=? AND sub_domain=? AND record_type=? AND line=?", key
+            ).fetchone()
+            if row is None or time.time() - row[0] > self.verify_interval:
+                return None
+            rows = self._conn.execute(
+                "SELECT sub_domain, record_type, value, line, ttl, record_id, updated_at FROM records "
+                "WHERE namespace=? AND domain=? AND sub_domain=? AND record_type=? AND line=? ORDER BY rowid",
+                key,
+            ).fetchall()
+        return [Record(sub_domain, type_, value, line_, ttl, record_id, updated_at, updated_at) for sub_domain, type_, value, line_, ttl, record_id, updated_at in rows]
+
+    def replace(self, domain: str, sub_domain: str, record_type: str, line: str, records: List[Record]) -> None:
+        """用从服务商读取的解析记录覆盖本地状态, 并记录校验时间"""
+        key = self._key(domain, sub_domain, record_type, line)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM records WHERE namespace=? AND domain=? AND sub_domain=? AND record_type=? AND line=?", key)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*key, record.record_id, record.value, record.ttl, now) for record in records],
+            )
+            self._conn.execute("INSERT OR REPLACE INTO verified VALUES (?, ?, ?, ?, ?, ?)", (*key, now))
+
+    def apply(self, change: Change, result=None) -> None:
+        """写入成功后更新本地状态, 创建记录时 result 为新记录 ID"""
+        self.apply_many([(change, result)])
+
+    def apply_many(self, applied: Iterable[Tuple[Change, object]]) -> None:
+        """在一个事务中更新多条写入成功的变更, applied 为 [(变更, 接口返回值)]"""
+        now = time.time()
+        with self._lock, self._conn:
+            for change, result in applied:
+                self._apply(change, result, now)
+
+    def _apply(self, change: Change, result, now: float) -> None:
+        key = self._key(change.domain, change.sub_domain, change.record_type, change.line)
+        if change.action == CREATE:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (*key, result, change.value, change.ttl, now)
+            )
+        elif change.action == UPDATE:
+            self._conn.execute(
+                "UPDATE records SET value=?, ttl=COALESCE(?, ttl), updated_at=? WHERE namespace=? AND domain=? AND record_id=?",
+                (change.value, change.ttl, now, self.namespace, change.domain, change.record_id),
+            )
+        elif change.action == DELETE:
+            self._conn.execute(
+                "DELETE FROM records WHERE namespace=? AND domain=? AND record_id=?", (self.namespace, change.domain, change.record_id)
+            )
+
+    def invalidate(self, domain: str, sub_domain: str, record_type: str, line: str) -> None:
+        """标记本地状态失效, 下次需要从服务商重新读取"""
+        self.invalidate_many([(domain, sub_domain, record_type, line)])
+
+    def invalidate_many(self, keys: Iterable[tuple]) -> None:
+        """在一个事务中标记多个 (主域名, 子域名, 记录类型, 线路) 失效"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM verified WHERE namespace=? AND domain=? AND sub_domain=? AND record_type=? AND line=?", [self._key(*key) for key in keys]
+            )
+
+    def close(self) -> None:
+        self._conn.close()
@@ -1,7 +1,7 @@
+from datetime import datetime
+from functools import lru_cache
 from collections import namedtuple
 
-from dateutil import parser
-
 
 Domain = namedtuple("Domain", ["domain_name", "create_time", "record_count"])
 Record = namedtuple(
@@ -19,9 +19,25 @@ Record = namedtuple(
 )
 
 
+@lru_cache(maxsize=4096)
 def date_to_timestamp(date_time_str: str) -> float:
-    date_time = parser.parse(date_time_str)
-    return date_time.timestamp()
-
-
-
+    """将服务商返回的时间字符串转换为时间戳
+
+    "2021-03-28 11:27:09" 这样的固定格式直接按位置解析, 其他格式才使用 dateutil;
+    同一批创建的记录时间相同, 结果按字符串缓存。
+    """
+    s = date_time_str
+    if len(s) == 19 and s[4] == "-" and s[7] == "-" and s[10] in " T" and s[13] == ":" and s[16] == ":":
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19])).timestamp()
+        except ValueError:
+            pass
+    from dateutil import parser
+
+    return parser.parse(s).timestamp()
+
+
+def chunks(items: list, size: int):
+    """按 size 个一组切分列表"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,159 @@
+import time
+import sqlite3
+
+from threading import Lock
+from typing import Dict, Iterable, List
+
+from probe import Probe
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    ip TEXT NOT NULL,
+    line TEXT NOT NULL,
+    observed_at REAL NOT NULL,
+    source TEXT NOT NULL,
+    latency REAL,
+    loss REAL,
+    throughput REAL
+);
+CREATE INDEX IF NOT EXISTS observations_time ON observations (observed_at);
+CREATE TABLE IF NOT EXISTS scores (
+    ip TEXT NOT NULL,
+    line TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    probed_at REAL,
+    weight REAL NOT NULL DEFAULT 0,
+    latency_sum REAL NOT NULL DEFAULT 0,
+    latency_weight REAL NOT NULL DEFAULT 0,
+    loss_sum REAL NOT NULL DEFAULT 0,
+    throughput_sum REAL NOT NULL DEFAULT 0,
+    throughput_weight REAL NOT NULL DEFAULT 0,
+    seen REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (ip, line)
+);
+"""
+
+# 探测记录及出现在优选 IP 接口返回结果中的记录
+PROBE = "probe"
+HOSTMONIT = "hostmonit"
+
+
+class IpHistory:
+    """候选 IP 历史表现库(SQLite)
+
+    按 (IP, 线路) 保存每次探测结果及在优选 IP 接口中出现的次数, 同时维护按 half_life 秒半衰的加权汇总,
+    得分越新的观测权重越大。weight 为衰减后的探测次数, 可作为得分的置信度。
+    超过 retention 秒的观测记录及汇总由 compact 清理。
+    >>> history = IpHistory("history.db")
+    >>> history.record_probes("CT", probes)
+    >>> history.scores("CT", ["1.1.1.1", "1.0.0.1"])
+    """
+
+    def __init__(self, filename: str, half_life: float = 86400, retention: float = 30 * 86400):
+        self.half_life = half_life
+        self.retention = retention
+        self._lock = Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def _decay(self, age: float) -> float:
+        return 0.5 ** (max(age, 0) / self.half_life)
+
+    def _update(self, ip: str, line: str, now: float, probe: Probe = None) -> None:
+        row = self._conn.execute(
+            "SELECT updated_at, probed_at, weight, latency_sum, latency_weight, loss_sum, throughput_sum, throughput_weight, seen FROM scores WHERE ip=? AND line=?",
+            (ip, line),
+        ).fetchone()
+        if row is None:
+            probed_at, values = None, [0.0] * 7
+        else:
+            factor = self._decay(now - row[0])
+            probed_at, values = row[1], [value * factor for value in row[2:]]
+        weight, latency_sum, latency_weight, loss_sum, throughput_sum, throughput_weight, seen = values
+        if probe is None:
+            seen += 1
+        else:
+            probed_at = now
+            weight += 1
+            loss_sum += probe.loss
+            if probe.latency is not None:
+                latency_sum += probe.latency
+                latency_weight += 1
+            if probe.throughput is not None:
+                throughput_sum += probe.throughput
+                throughput_weight += 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (ip, line, now, probed_at, weight, latency_sum, latency_weight, loss_sum, throughput_sum, throughput_weight, seen),
+        )
+
+    def record_seen(self, line: str, ips: Iterable[str], now: float = None) -> None:
+        """记录本次优选 IP 接口返回的该线路候选 IP"""
+        now = now or time.time()
+        ips = list(dict.fromkeys(ips))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO observations (ip, line, observed_at, source) VALUES (?, ?, ?, ?)", [(ip, line, now, HOSTMONIT) for ip in ips]
+            )
+            for ip in ips:
+                self._update(ip, line, now)
+
+    def record_probes(self, line: str, probes: Iterable[Probe], now: float = None) -> None:
+        now = now or time.time()
+        probes = list(probes)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(probe.ip, line, now, PROBE, probe.latency, probe.loss, probe.throughput) for probe in probes],
+            )
+            for probe in probes:
+                self._update(probe.ip, line, now, probe)
+
+    def scores(self, line: str, ips: Iterable[str], now: float = None) -> Dict[str, Probe]:
+        """返回有探测记录的 IP 的衰减加权得分, 格式与 probe.Probe 相同, 可直接用于 probe.rank_ips"""
+        return {ip: score for ip, (score, _, _) in self._rows(line, ips, now).items()}
+
+    def confident(self, line: str, ips: Iterable[str], max_age: float, min_weight: float, now: float = None) -> List[str]:
+        """返回 max_age 秒内探测过且衰减后探测次数不少于 min_weight 的 IP, 这些 IP 不需要重新探测"""
+        now = now or time.time()
+        return [
+            ip
+            for ip, (_, weight, probed_at) in self._rows(line, ips, now).items()
+            if now - probed_at <= max_age and weight >= min_weight
+        ]
+
+    def _rows(self, line: str, ips: Iterable[str], now: float = None) -> Dict[str, tuple]:
+        now = now or time.time()
+        ips = list(dict.fromkeys(ips))
+        rows = {}
+        with self._lock:
+            for start in range(0, len(ips), 500):
+                chunk = ips[start:start + 500]
+                rows.update(
+                    (row[0], row[1:])
+                    for row in self._conn.execute(
+                        "SELECT ip, updated_at, probed_at, weight, latency_sum, latency_weight, loss_sum, throughput_sum, throughput_weight FROM scores "
+                        f"WHERE line=? AND probed_at IS NOT NULL AND ip IN ({','.join('?' * len(chunk))})",
+                        (line, *chunk),
+                    )
+                )
+        result = {}
+        for ip, (updated_at, probed_at, weight, latency_sum, latency_weight, loss_sum, throughput_sum, throughput_weight) in rows.items():
+            if not weight:
+                continue
+            latency = latency_sum / latency_weight if latency_weight else None
+            throughput = throughput_sum / throughput_weight if throughput_weight else None
+            score = Probe(ip, latency, loss_sum / weight, throughput)
+            result[ip] = (score, weight * self._decay(now - updated_at), probed_at)
+        return result
+
+    def compact(self, now: float = None) -> int:
+        """删除超过保留时间的观测记录及汇总, 返回删除的观测记录数"""
+        cutoff = (now or time.time()) - self.retention
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM observations WHERE observed_at < ?", (cutoff,)).rowcount
+            self._conn.execute("DELETE FROM scores WHERE updated_at < ?", (cutoff,))
+        return deleted
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from typing import Awaitable, Callable, Optional
+
+from log import get_logger
+
+logger = get_logger("cf2dns.log", level="debug")
+
+
+def fingerprint(*parts) -> str:
+    """计算内容指纹, parts 需可被 json 序列化, 字典按 key 排序后参与计算"""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def candidate_fingerprint(info: dict) -> str:
+    """候选 IP 集合的指纹, 只与每条线路的 IP 集合有关, 与顺序及延迟等附加字段无关"""
+    return fingerprint({line: sorted(ip.get("ip") for ip in ip_list) for line, ip_list in (info or {}).items()})
+
+
+def atomic_write(filename: str, data: dict) -> None:
+    """先写临时文件再重命名, 避免并发读取到写了一半的文件"""
+    dirname = os.path.dirname(filename) or "."
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_json(filename: str) -> Optional[dict]:
+    try:
+        with open(filename, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class IpCache:
+    """优选 IP 接口返回值的磁盘缓存
+
+    缓存以 (key, ip_version) 区分, 未过期直接返回缓存; 过期后重新请求, 请求失败时在 max_stale 秒内继续使用旧缓存。
+    """
+
+    def __init__(self, cache_dir: str, ttl: int = 300, max_stale: int = 86400):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_stale = max_stale
+
+    def _filename(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _entry_name(self, key: str, ip_version: str) -> str:
+        return f"optimization_ip-{hashlib.sha1(key.encode()).hexdigest()[:12]}-{ip_version}.json"
+
+    def _lookup(self, key: str, ip_version: str) -> tuple:
+        """返回 (缓存文件名, 缓存内容, 缓存时间), 没有缓存时后两项为 None"""
+        filename = self._filename(self._entry_name(key, ip_version))
+        entry = read_json(filename)
+        age = time.time() - entry["time"] if entry else None
+        if entry and age < self.ttl:
+            logger.info(f"使用缓存的优选 IP, 类型: {ip_version} 缓存时间: {age:.0f}s")
+        return filename, entry, age
+
+    def get(self, key: str, ip_version: str, fetch: Callable[[], Optional[dict]]) -> Optional[dict]:
+        filename, entry, age = self._lookup(key, ip_version)
+        if entry and age < self.ttl:
+            return entry["data"]
+        return self._store(filename, entry, age, ip_version, fetch())
+
+    async def aget(self, key: str, ip_version: str, fetch: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """get 的协程版本, fetch 返回协程"""
+        filename, entry, age = self._lookup(key, ip_version)
+        if entry and age < self.ttl:
+            return entry["data"]
+        return self._store(filename, entry, age, ip_version, await fetch())
+
+    def _store(self, filename: str, entry: Optional[dict], age: Optional[float], ip_version: str, data: Optional[dict]) -> Optional[dict]:
+        if data and data.get("info"):
+            atomic_write(filename, {"time": time.time(), "fingerprint": candidate_fingerprint(data["info"]), "data": data})
+            return data
+        if entry and age < self.max_stale:
+            logger.warning(f"获取优选 IP 失败, 使用过期缓存, 类型: {ip_version} 缓存时间: {age:.0f}s")
+            return entry["data"]
+        return data
+
+    def last_applied(self, name: str) -> Optional[str]:
+        entry = read_json(self._filename(f"applied-{name}.json"))
+        return entry and entry.get("fingerprint")
+
+    def mark_applied(self, name: str, value: str) -> None:
+        atomic_write(self._filename(f"applied-{name}.json"), {"time": time.time(), "fingerprint": value})
+
+    def load_assignments(self, name: str) -> dict:
+        """读取上次保存的记录值分配, key 为 (主域名, 子域名, 记录类型, 线路)"""
+        entry = read_json(self._filename(f"assignments-{name}.json")) or {}
+        return {tuple(key.split("|")): values for key, values in entry.get("slots", {}).items()}
+
+    def save_assignments(self, name: str, assigned: dict) -> None:
+        slots = {"|".join(slot): values for slot, values in assigned.items()}
+        atomic_write(self._filename(f"assignments-{name}.json"), {"time": time.time(), "slots": slots})
@@ -1,4 +1,7 @@
+import json
+import atexit
 import logging
+from queue import Queue
 from logging import handlers
 
 # 设置日志格式
@@ -13,8 +16,80 @@ log_level = {
     "crit": logging.CRITICAL,
 }
 
+# JSON 行格式中输出的结构化字段, 通过 logger.info(..., extra={"domain": ...}) 传入
+FIELDS = ("domain", "sub_domain", "record_type", "line", "action", "value", "latency", "error")
+
+_listeners = {}
+
+
+class Lazy:
+    """延迟构造日志内容, 只有日志实际输出时才调用 func(*args)
+
+    >>> logger.debug("%s", Lazy(describe, change))
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON, 包含 FIELDS 中的结构化字段"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "file": record.pathname,
+            "lineno": record.lineno,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(handlers.QueueHandler):
+    # 不在调用线程中格式化, 格式化由后台线程中的处理器完成
+    def prepare(self, record):
+        return record
+
+
+def configure(logger, level=None, json_lines=False, queue=False):
+    """调整 get_logger 返回的日志器
+
+    level: 日志级别; json_lines: 输出 JSON 行格式;
+    queue: 日志先放入队列, 由后台线程格式化并写入屏幕及文件, 调用线程不再等待 I/O, 进程退出时写完队列中的日志。
+    """
+    if level:
+        logger.setLevel(log_level.get(level))
+    listener = _listeners.get(logger.name)
+    targets = listener.handlers if listener else logger.handlers
+    format_str = JsonFormatter() if json_lines else logging.Formatter(formatter)
+    for handler in targets:
+        handler.setFormatter(format_str)
+    if queue and listener is None:
+        records = Queue(-1)
+        listener = handlers.QueueListener(records, *targets, respect_handler_level=True)
+        logger.handlers = [_QueueHandler(records)]
+        listener.start()
+        atexit.register(listener.stop)
+        _listeners[logger.name] = listener
+    return logger
+
+
 def get_logger(filename, level="info", when="D", backCount=3):
     logger = logging.getLogger(filename)
+    if logger.handlers:  # 同一个日志文件只添加一次处理器, 避免多个模块获取时重复输出
+        return logger
     format_str = logging.Formatter(formatter)
     logger.setLevel(log_level.get(level))  # 设置日志级别
 
@@ -0,0 +1,195 @@
+import os
+import time
+import inspect
+import tempfile
+import threading
+
+from functools import wraps
+from contextlib import contextmanager
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dns.retry import classify
+
+# 延迟直方图的桶(秒)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    "cf2dns_api_request_seconds": ("histogram", "服务商接口调用耗时"),
+    "cf2dns_api_errors_total": ("counter", "服务商接口调用失败次数, 按错误分类"),
+    "cf2dns_hostmonit_request_seconds": ("histogram", "优选 IP 接口请求耗时"),
+    "cf2dns_hostmonit_errors_total": ("counter", "优选 IP 接口请求失败次数"),
+    "cf2dns_phase_seconds": ("histogram", "同步各阶段耗时, 并发执行时为各线程耗时之和"),
+    "cf2dns_records_total": ("counter", "解析记录 创建/更新/删除/跳过 数量"),
+    "cf2dns_units_total": ("counter", "按 (主域名, 子域名, 线路) 拆分的任务数量"),
+    "cf2dns_last_sync_timestamp_seconds": ("gauge", "最近一次同步完成的时间戳"),
+}
+
+# 需要统计的 DnsBase 方法
+API_METHODS = ("get_domain", "get_record", "iter_record", "create_record", "change_record", "del_record", "del_record_by_domain", "apply_batch")
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+
+class Metrics:
+    """线程安全的指标注册表, 输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[(name, _labels(labels))] += value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def sums(self, name: str, label: str) -> dict:
+        """返回直方图各 label 值对应的累计耗时"""
+        with self._lock:
+            return {
+                dict(labels).get(label): histogram[1]
+                for (metric, labels), histogram in self._histograms.items()
+                if metric == name
+            }
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            series = defaultdict(list)
+            for (name, labels), value in self._counters.items():
+                series[name].append((labels, [f"{name}{_format_labels(labels)} {value:g}"]))
+            for (name, labels), value in self._gauges.items():
+                series[name].append((labels, [f"{name}{_format_labels(labels)} {value:g}"]))
+            for (name, labels), (buckets, total, count) in self._histograms.items():
+                samples = [f"{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {bucket}" for bound, bucket in zip(BUCKETS, buckets)]
+                samples.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+                samples.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+                samples.append(f"{name}_count{_format_labels(labels)} {count}")
+                series[name].append((labels, samples))
+        for name in sorted(series):
+            kind, text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for _, samples in sorted(series[name], key=lambda item: item[0]):
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, filename: str) -> None:
+        """原子写入 node_exporter textfile collector 使用的 .prom 文件"""
+        dirname = os.path.dirname(filename) or "."
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, filename)
+
+
+METRICS = Metrics()
+
+
+def instrument(cloud, provider: str, metrics: Metrics = METRICS):
+    """统计 DnsBase / AsyncDnsBase 实例各方法的调用耗时及失败次数"""
+    for method in API_METHODS:
+        func = getattr(cloud, method, None)
+        if func is None:
+            continue
+
+        def wrap(func, method):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception as error:
+                    metrics.inc("cf2dns_api_errors_total", provider=provider, method=method, kind=classify(error))
+                    raise
+                finally:
+                    metrics.observe("cf2dns_api_request_seconds", time.perf_counter() - start, provider=provider, method=method)
+
+            @wraps(func)
+            def iter_wrapper(*args, **kwargs):
+                # 生成器在迭代结束时才算调用完成
+                start = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                except Exception as error:
+                    metrics.inc("cf2dns_api_errors_total", provider=provider, method=method, kind=classify(error))
+                    raise
+                finally:
+                    metrics.observe("cf2dns_api_request_seconds", time.perf_counter() - start, provider=provider, method=method)
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as error:
+                    metrics.inc("cf2dns_api_errors_total", provider=provider, method=method, kind=classify(error))
+                    raise
+                finally:
+                    metrics.observe("cf2dns_api_request_seconds", time.perf_counter() - start, provider=provider, method=method)
+
+            if inspect.iscoroutinefunction(func):
+                return async_wrapper
+            return iter_wrapper if method.startswith("iter_") else wrapper
+
+        setattr(cloud, method, wrap(func, method))
+    return cloud
+
+
+def serve(port: int, host: str = "0.0.0.0", metrics: Metrics = METRICS) -> ThreadingHTTPServer:
+    """在后台线程中启动 HTTP 服务, 通过 /metrics 输出指标"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,140 @@
+import ssl
+import time
+import socket
+import threading
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+
+# latency: TCP 握手平均耗时(毫秒), loss: 握手失败比例, throughput: HTTPS 下载速度(字节/秒), 未测试时为 None
+Probe = namedtuple("Probe", ["ip", "latency", "loss", "throughput"])
+
+
+def tcp_ping(ip: str, port: int = 443, timeout: float = 1.0) -> Optional[float]:
+    """测试一次 TCP 握手耗时, 单位毫秒, 连接失败返回 None"""
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return (time.perf_counter() - start) * 1000
+    except OSError:
+        return None
+
+
+def https_download(ip: str, host: str, path: str = "/", port: int = 443, max_bytes: int = 1024 * 1024, timeout: float = 5.0, verify: bool = True) -> Optional[float]:
+    """通过指定 IP 以 host 作为 SNI 和 Host 头发起 HTTPS 请求, 最多读取 max_bytes 字节, 返回下载速度(字节/秒), 失败返回 None"""
+    context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: cf2dns\r\nConnection: close\r\n\r\n".encode()
+    received = 0
+    try:
+        with socket.create_connection((ip, port), timeout=timeout) as sock:
+            with context.wrap_socket(sock, server_hostname=host) as tls:
+                start = time.perf_counter()
+                tls.sendall(request)
+                while received < max_bytes:
+                    chunk = tls.recv(65536)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                elapsed = time.perf_counter() - start
+    except (OSError, ssl.SSLError):
+        return None
+    if not received:
+        return None
+    return received / max(elapsed, 1e-6)
+
+
+def probe_ip(ip: str, port: int = 443, count: int = 3, timeout: float = 1.0, host: str = None, path: str = "/", max_bytes: int = 1024 * 1024, verify: bool = True) -> Probe:
+    latencies = [tcp_ping(ip, port, timeout) for _ in range(count)]
+    success = [latency for latency in latencies if latency is not None]
+    latency = sum(success) / len(success) if success else None
+    loss = 1 - len(success) / count
+    throughput = None
+    if host and success:
+        throughput = https_download(ip, host, path, port, max_bytes, timeout * 5, verify)
+    return Probe(ip, latency, loss, throughput)
+
+
+def probe_ips(ips: Iterable[str], concurrency: int = 64, deadline: float = 15.0, **kwargs) -> Dict[str, Probe]:
+    """并发测试所有 IP, 超过 deadline 秒仍未完成的 IP 视为失败, kwargs 传递给 probe_ip"""
+    ips = list(dict.fromkeys(ips))
+    results = {}
+    if not ips:
+        return results
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(ips)))
+    futures = {executor.submit(probe_ip, ip, **kwargs): ip for ip in ips}
+    done, _ = wait(futures, timeout=deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
+    for future in done:
+        if future.exception() is None:
+            results[futures[future]] = future.result()
+    for ip in ips:
+        results.setdefault(ip, Probe(ip, None, 1.0, None))
+    return results
+
+
+def sort_key(probe: Probe) -> tuple:
+    """排序规则: 连接成功优先, 其次下载速度快优先(若有测试), 最后按丢包加权后的延迟"""
+    if probe.latency is None:
+        return (1, 0, float("inf"))
+    return (0, -(probe.throughput or 0), probe.latency * (1 + probe.loss))
+
+
+def rank_ips(ips: List[str], probes: Dict[str, Probe]) -> List[str]:
+    """按测试结果从优到劣排序, 丢弃连接失败的 IP"""
+    ranked = sorted((probes[ip] for ip in dict.fromkeys(ips) if ip in probes), key=sort_key)
+    return [probe.ip for probe in ranked if probe.latency is not None]
+
+
+class HealthTracker:
+    """按 IP 记录连续探测结果, 带滞后地判断 IP 是否健康, 避免探测结果抖动导致解析记录反复更换
+
+    连接失败、丢包率不低于 max_loss 或延迟超过 max_latency(毫秒) 视为一次异常;
+    健康 IP 连续 fail_threshold 次异常才判为不健康, 不健康 IP 连续 recover_threshold 次正常才恢复,
+    且恢复时延迟需低于 max_latency * recover_ratio。被替换下来的 IP 在 cooldown 秒内不会被选为替换 IP。
+    """
+
+    def __init__(self, fail_threshold: int = 3, recover_threshold: int = 3, max_latency: float = None, max_loss: float = 0.5, recover_ratio: float = 0.8, cooldown: float = 1800):
+        self.fail_threshold = fail_threshold
+        self.recover_threshold = recover_threshold
+        self.max_latency = max_latency
+        self.max_loss = max_loss
+        self.recover_ratio = recover_ratio
+        self.cooldown = cooldown
+        self._state: Dict[str, tuple] = {}
+        self._quarantine: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _bad(self, probe: Probe, unhealthy: bool) -> bool:
+        if probe.latency is None or probe.loss >= self.max_loss:
+            return True
+        if self.max_latency is None:
+            return False
+        return probe.latency > self.max_latency * (self.recover_ratio if unhealthy else 1)
+
+    def observe(self, probe: Probe) -> bool:
+        """记录一次探测结果, 返回该 IP 当前是否不健康"""
+        with self._lock:
+            unhealthy, streak = self._state.get(probe.ip, (False, 0))
+            streak = streak + 1 if self._bad(probe, unhealthy) != unhealthy else 0
+            if streak >= (self.recover_threshold if unhealthy else self.fail_threshold):
+                unhealthy, streak = not unhealthy, 0
+            self._state[probe.ip] = (unhealthy, streak)
+            return unhealthy
+
+    def acceptable(self, probe: Probe) -> bool:
+        """IP 能否作为替换 IP: 本次探测正常, 不在冷却期内, 且没有被判为不健康"""
+        with self._lock:
+            if self._quarantine.get(probe.ip, 0) > time.monotonic():
+                return False
+            if self._state.get(probe.ip, (False, 0))[0]:
+                return False
+        return not self._bad(probe, False)
+
+    def quarantine(self, ip: str) -> None:
+        with self._lock:
+            self._quarantine[ip] = time.monotonic() + self.cooldown
+            self._state.pop(ip, None)
@@ -0,0 +1,226 @@
+"""按 (主域名, 子域名) 拆分域名信息, 在多个进程或节点上分片执行
+
+使用示例:
+    # 4 个节点分别执行其中一个分片, 共享目录中的租约文件避免重叠执行的同一分片同时写入同一主域名
+    $ python cf2dns.py dnspod -4 -f domains.json --shard 0/4 --lock-dir /mnt/shared/locks --summary /mnt/shared/summary-0.json
+
+    # 合并各分片的执行结果
+    $ python shard.py /mnt/shared/summary-*.json
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import uuid
+import socket
+import hashlib
+import argparse
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from ipcache import atomic_write, read_json
+
+# 租约文件锁的最长持有时间, 超过后视为持有者已异常退出
+GUARD_STALE = 30
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """解析 "i/N", i 从 0 开始"""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"分片格式不正确: {spec}, 格式: i/N, 例如 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片编号超出范围: {spec}, i 需满足 0 <= i < N")
+    return index, count
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode("utf-8")).digest()[:8], "big")
+
+
+class ShardRing:
+    """一致性哈希环, 每个分片 replicas 个虚拟节点, 分片数量变化时只有少量 (主域名, 子域名) 改变归属"""
+
+    def __init__(self, count: int, replicas: int = 64):
+        self.count = count
+        points = sorted((_hash(f"shard-{shard}-{replica}"), shard) for shard in range(count) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def owner(self, domain: str, sub_domain: str) -> int:
+        position = bisect.bisect(self._hashes, _hash(f"{domain}/{sub_domain}")) % len(self._hashes)
+        return self._shards[position]
+
+
+def shard_domains(domains: dict, index: int, count: int) -> dict:
+    """返回属于第 index 个分片的域名信息, 格式与输入相同"""
+    ring = ShardRing(count)
+    result = {}
+    for domain, sub_domains in domains.items():
+        owned = {sub_domain: lines for sub_domain, lines in sub_domains.items() if ring.owner(domain, sub_domain) == index}
+        if owned:
+            result[domain] = owned
+    return result
+
+
+class Lease:
+    """基于共享目录中文件的租约, 持有者异常退出后租约在 ttl 秒后过期, 可被其他进程接管
+
+    不依赖 flock, 网络文件系统上也可使用: 读取及修改租约文件都在以 O_EXCL 创建的 .guard 文件保护下进行,
+    新内容先写入 O_EXCL 创建的临时文件再重命名替换。每次获取租约生成新的 token, 续期和释放只在 token 仍匹配时执行。
+    持有者需要在 ttl 内调用 keep 续期, 否则租约过期后可能被其他进程接管。
+    """
+
+    def __init__(self, lock_dir: str, name: str, ttl: float = 600, owner: str = None):
+        self.filename = os.path.join(lock_dir, f"{hashlib.sha256(name.encode('utf-8')).hexdigest()[:24]}.lease")
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.token = uuid.uuid4().hex
+        self._renewed = None
+        self._lock = threading.Lock()
+        os.makedirs(lock_dir, exist_ok=True)
+
+    @contextmanager
+    def _guard(self, timeout: float = 10):
+        """独占租约文件的读取及修改, 超过 GUARD_STALE 秒的 .guard 文件视为持有者在临界区内异常退出后遗留"""
+        guard = f"{self.filename}.guard"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                os.close(os.open(guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.stat(guard).st_mtime > GUARD_STALE:
+                    os.remove(guard)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"等待租约文件锁超时: {guard}")
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(guard)
+            except FileNotFoundError:
+                pass
+
+    def _write(self) -> None:
+        tmp = f"{self.filename}.{self.token}.tmp"
+        fd = os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"name": self.name, "owner": self.owner, "token": self.token, "expires": time.time() + self.ttl}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.filename)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._renewed = time.monotonic()
+
+    def _held(self, current: Optional[dict]) -> bool:
+        return bool(current) and current.get("token") == self.token
+
+    def acquire(self) -> bool:
+        try:
+            with self._guard():
+                current = read_json(self.filename)
+                if current and not self._held(current) and current.get("expires", 0) > time.time():
+                    return False
+                self._write()
+                return True
+        except TimeoutError:
+            return False
+
+    def renew(self) -> bool:
+        """刷新过期时间, 租约已被其他进程接管或已释放时返回 False"""
+        with self._guard():
+            if not self._held(read_json(self.filename)):
+                return False
+            self._write()
+            return True
+
+    def keep(self) -> None:
+        """写入前调用, 距上次续期超过 ttl 的三分之一时续期, 租约已被其他进程接管时抛出 RuntimeError"""
+        with self._lock:
+            if self._renewed is not None and time.monotonic() - self._renewed < self.ttl / 3:
+                return
+            if not self.renew():
+                raise RuntimeError(f"租约 {self.name} 已被 {self.holder()} 接管, 停止写入")
+
+    def holder(self) -> Optional[str]:
+        current = read_json(self.filename)
+        return current and current.get("owner")
+
+    def release(self) -> None:
+        with self._guard():
+            if self._held(read_json(self.filename)):
+                os.remove(self.filename)
+        self._renewed = None
+
+
+def build_summary(results: list, shard: str = None, skipped: List[str] = (), started: float = None) -> dict:
+    """生成可跨分片合并的执行结果, results 为 cf2dns.Result 列表"""
+    actions = Counter(change.action for result in results for change in result.changes)
+    return {
+        "shards": [shard or "0/1"],
+        "started": started or time.time(),
+        "finished": time.time(),
+        "units": len(results),
+        "ok": sum(1 for result in results if result.ok),
+        "failed": sum(1 for result in results if not result.ok),
+        "changes": dict(actions),
+        "skipped_zones": sorted(skipped),
+        "failures": [
+            {"domain": r.domain, "sub_domain": r.sub_domain, "record_type": r.record_type, "line": r.line, "error": r.error}
+            for r in results
+            if not r.ok
+        ],
+    }
+
+
+def merge_summaries(summaries: List[dict]) -> dict:
+    merged = {"shards": [], "started": None, "finished": None, "units": 0, "ok": 0, "failed": 0, "changes": Counter(), "skipped_zones": [], "failures": []}
+    for summary in summaries:
+        merged["shards"] += summary.get("shards", [])
+        merged["started"] = min(filter(None, (merged["started"], summary.get("started"))), default=None)
+        merged["finished"] = max(filter(None, (merged["finished"], summary.get("finished"))), default=None)
+        for key in ("units", "ok", "failed"):
+            merged[key] += summary.get(key, 0)
+        merged["changes"].update(summary.get("changes", {}))
+        merged["skipped_zones"] += summary.get("skipped_zones", [])
+        merged["failures"] += summary.get("failures", [])
+    merged["changes"] = dict(merged["changes"])
+    merged["skipped_zones"] = sorted(set(merged["skipped_zones"]))
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合并各分片的执行结果", formatter_class=argparse.RawTextHelpFormatter, epilog=__doc__)
+    parser.add_argument("summaries", nargs="+", help="各分片 --summary 输出的文件")
+    args = parser.parse_args(argv)
+    summaries: Dict[str, dict] = {}
+    for filename in args.summaries:
+        summary = read_json(filename)
+        if summary is None:
+            print(f"无法读取: {filename}", file=sys.stderr)
+            continue
+        summaries[filename] = summary
+    merged = merge_summaries(list(summaries.values()))
+    print(json.dumps(merged, ensure_ascii=False, indent=2))
+    return 1 if merged["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
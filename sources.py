@@ -0,0 +1,162 @@
+import io
+import csv
+
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from log import get_logger
+
+logger = get_logger("cf2dns.log", level="debug")
+
+
+def ip_version_of(ip: str) -> str:
+    return "v6" if ":" in ip else "v4"
+
+
+@contextmanager
+def open_text(location: str, timeout: float = 30):
+    """以文本流的方式打开本地文件或 http(s) 地址, 逐行读取, 不会一次性读入内存"""
+    if location.startswith(("http://", "https://")):
+        from urllib.request import urlopen
+
+        with urlopen(location, timeout=timeout) as response:
+            yield io.TextIOWrapper(response, encoding="utf-8-sig", newline="")
+    else:
+        with open(location, encoding="utf-8-sig", newline="") as f:
+            yield f
+
+
+class IpSource(metaclass=ABCMeta):
+    """候选 IP 来源, iter_ips 逐条返回 (线路, 候选 IP 信息), 候选 IP 信息格式与优选 IP 接口的 info 相同"""
+
+    name = "source"
+
+    @abstractmethod
+    def iter_ips(self, ip_version: str) -> Iterator[Tuple[str, dict]]:
+        pass
+
+
+class HostmonitSource(IpSource):
+    """优选 IP 接口, fetch(ip_version) 返回接口的完整响应, 缓存及熔断由 fetch 负责"""
+
+    name = "hostmonit"
+
+    def __init__(self, fetch: Callable[[str], Optional[dict]]):
+        self._fetch = fetch
+
+    def iter_ips(self, ip_version: str) -> Iterator[Tuple[str, dict]]:
+        data = self._fetch(ip_version)
+        if not data or not data.get("info"):
+            raise RuntimeError(f"获取优选 IP 失败, 类型: {ip_version}")
+        for line, ip_list in data["info"].items():
+            for ip in ip_list:
+                yield line, ip
+
+
+class ListSource(IpSource):
+    """IP 列表文件或 URL, 每行一个 IP, 可在 IP 后用空格或逗号指定线路(CM/CU/CT/AB/DEF), 未指定线路时用于 lines 中的所有线路
+
+    # 开头的行为注释
+    """
+
+    name = "list"
+
+    def __init__(self, location: str, lines: Iterable[str]):
+        self.location = location
+        self.lines = list(lines)
+
+    def iter_ips(self, ip_version: str) -> Iterator[Tuple[str, dict]]:
+        with open_text(self.location) as f:
+            for row in f:
+                fields = row.replace(",", " ").split()
+                if not fields or fields[0].startswith("#") or ip_version_of(fields[0]) != ip_version:
+                    continue
+                for line in fields[1:] or self.lines:
+                    yield line, {"ip": fields[0], "source": self.name}
+
+
+class CsvSource(IpSource):
+    """CloudflareSpeedTest 输出的 result.csv, 列依次为 IP 地址, 已发送, 已接收, 丢包率, 平均延迟, 下载速度 (MB/s)
+
+    文件已按测试结果从优到劣排序, 每个 IP 用于 lines 中的所有线路。
+    """
+
+    name = "csv"
+
+    def __init__(self, location: str, lines: Iterable[str]):
+        self.location = location
+        self.lines = list(lines)
+
+    def iter_ips(self, ip_version: str) -> Iterator[Tuple[str, dict]]:
+        with open_text(self.location) as f:
+            reader = csv.reader(f)
+            for row in reader:
+                if not row or ip_version_of(row[0].strip()) != ip_version:
+                    continue
+                try:
+                    ip = {
+                        "ip": row[0].strip(),
+                        "loss": float(row[3]),
+                        "latency": float(row[4]),
+                        "speed": float(row[5]) if len(row) > 5 and row[5] else None,
+                        "source": self.name,
+                    }
+                except (IndexError, ValueError):
+                    # 表头或格式不正确的行
+                    continue
+                for line in self.lines:
+                    yield line, ip
+
+
+# 通过 --ip-source 指定的来源类型, 值为 "类型:文件路径或 URL"
+SOURCES = {"list": ListSource, "csv": CsvSource}
+
+
+def parse_source(spec: str, hostmonit: Callable[[str], Optional[dict]], lines: Iterable[str]) -> IpSource:
+    if spec == HostmonitSource.name:
+        return HostmonitSource(hostmonit)
+    kind, _, location = spec.partition(":")
+    if kind not in SOURCES or not location:
+        raise ValueError(f"不支持的 IP 来源: {spec}, 格式: hostmonit | {' | '.join(f'{name}:文件路径或 URL' for name in SOURCES)}")
+    return SOURCES[kind](location, lines)
+
+
+def _collect(source: IpSource, ip_version: str, cap: int = None) -> Dict[str, Dict[str, dict]]:
+    """读取一个来源, 按线路去重, 每条线路最多保留 cap 个, 达到上限后不再保留后续 IP"""
+    collected: Dict[str, Dict[str, dict]] = {}
+    for line, ip in source.iter_ips(ip_version):
+        ips = collected.setdefault(line, {})
+        if (cap is None or len(ips) < cap) and ip.get("ip"):
+            ips.setdefault(ip["ip"], ip)
+    return collected
+
+
+def merge_sources(sources: List[IpSource], ip_version: str, cap: int = None, deadline: float = 30) -> Optional[dict]:
+    """并发读取所有来源, 按来源顺序合并去重, 每条线路最多 cap 个候选 IP
+
+    读取失败或 deadline 秒内未完成的来源会被跳过, 只要有一个来源可用就能返回结果。
+    返回值格式与优选 IP 接口相同, 所有来源都不可用时返回 None。
+    """
+    executor = ThreadPoolExecutor(max_workers=len(sources))
+    futures = [executor.submit(_collect, source, ip_version, cap) for source in sources]
+    wait(futures, timeout=deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
+    info: Dict[str, Dict[str, dict]] = {}
+    for source, future in zip(sources, futures):
+        if not future.done():
+            logger.warning(f"IP 来源 {source.name} 超过 {deadline}s 未完成, 已跳过, 类型: {ip_version}")
+            continue
+        if future.exception() is not None:
+            logger.warning(f"IP 来源 {source.name} 读取失败, 已跳过, 类型: {ip_version} 错误: {future.exception()}")
+            continue
+        for line, ips in future.result().items():
+            merged = info.setdefault(line, {})
+            for ip, data in ips.items():
+                if cap is not None and len(merged) >= cap:
+                    break
+                merged.setdefault(ip, data)
+    if not any(info.values()):
+        return None
+    return {"code": 200, "info": {line: list(ips.values()) for line, ips in info.items() if ips}}
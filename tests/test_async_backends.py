@@ -0,0 +1,337 @@
+"""异步服务商接口测试, 通过 dns.fake.serve_fake_api 启动的本地 HTTP 服务模拟阿里云解析及 DNSPod 接口(校验签名)"""
+import asyncio
+import hashlib
+import unittest
+
+from dns import AsyncSubDomainSnapshot, get_async_backend
+from dns.aio import AsyncHttpClient
+from dns.aliyun_async import sign as aliyun_sign
+from dns.dnspod_async import sign as dnspod_sign
+from dns.fake import FakeClient, serve_fake_api
+from dns.retry import PERMANENT, THROTTLED, TRANSIENT, DnsApiError, RetryBudgetExceeded, RetryPolicy, classify, classify_code
+from dns.utils import Record
+
+INTERNAL_ERROR = DnsApiError("The request processing has failed due to some unknown error.", "InternalError", TRANSIENT)
+THROTTLING = DnsApiError("Request was denied due to request throttling.", "Throttling", THROTTLED)
+
+
+def inject(client: FakeClient, name: str, errors: list) -> None:
+    """让 client 的 name 接口依次抛出 errors 中的错误, 调用次数照常计数"""
+    call = client._call
+
+    def _call(call_name):
+        call(call_name)
+        if call_name == name and errors:
+            raise errors.pop(0)
+
+    client._call = _call
+
+
+class SignTest(unittest.TestCase):
+    def test_aliyun_rpc(self):
+        # https://help.aliyun.com/zh/sdk/product-overview/rpc-mechanism 中的签名示例
+        params = {
+            "AccessKeyId": "testid",
+            "Action": "DescribeRegions",
+            "Format": "XML",
+            "SignatureMethod": "HMAC-SHA1",
+            "SignatureNonce": "3ee8c1b8-83d3-44af-a94f-4e0ad82fd6cf",
+            "SignatureVersion": "1.0",
+            "Timestamp": "2016-02-23T12:46:24Z",
+            "Version": "2014-05-26",
+        }
+        self.assertEqual(aliyun_sign(params, "testsecret", "GET"), "OLeaidS1JvxuMvnyHOwuJ+uX5qY=")
+
+    def test_aliyun_rpc_encoding(self):
+        # 空格编码为 %20, * 编码为 %2A, ~ 不编码
+        params = {"Action": "DescribeDomainRecords", "RRKeyWord": "a b*~", "Line": "电信"}
+        self.assertEqual(aliyun_sign(params, "testsecret"), "ofxfyKlLdh3zAbW5kWu//JM8UJo=")
+
+    def test_aliyun_rpc_matches_sdk(self):
+        try:
+            from alibabacloud_openapi_util.client import Client
+        except ImportError:
+            self.skipTest("未安装阿里云 SDK")
+        params = {"Action": "AddDomainRecord", "DomainName": "example.com", "RR": "@", "Value": "1.1.1.1", "Line": "unicom", "TTL": 600}
+        self.assertEqual(aliyun_sign(params, "secret"), Client.get_rpcsignature({key: str(value) for key, value in params.items()}, "POST", "secret"))
+
+    def test_tc3(self):
+        payload = b'{"Domain": "example.com"}'
+        authorization = dnspod_sign(
+            "AKIDz8krbsJ5yKBZQpn74WFkmLPx3EXAMPLE", "Gu5t9xGARNpq86cd98joQYCN3EXAMPLE", "dnspod.tencentcloudapi.com", "DescribeRecordList", payload, 1551113065
+        )
+        self.assertEqual(
+            authorization,
+            "TC3-HMAC-SHA256 Credential=AKIDz8krbsJ5yKBZQpn74WFkmLPx3EXAMPLE/2019-02-25/dnspod/tc3_request, "
+            "SignedHeaders=content-type;host;x-tc-action, Signature=b9d6b4f09d6e6f64f40bdd5d0de41b68c34e0811e9aa665318cab662f2b683ff",
+        )
+
+    def test_tc3_matches_sdk(self):
+        try:
+            from tencentcloud.common.sign import Sign
+        except ImportError:
+            self.skipTest("未安装 tencentcloud-sdk-python")
+        payload = b'{"Domain": "example.com", "Subdomain": "www"}'
+        canonical_request = (
+            "POST\n/\n\ncontent-type:application/json; charset=utf-8\nhost:dnspod.tencentcloudapi.com\nx-tc-action:describerecordlist\n\n"
+            f"content-type;host;x-tc-action\n{hashlib.sha256(payload).hexdigest()}"
+        )
+        string_to_sign = f"TC3-HMAC-SHA256\n1700000000\n2023-11-14/dnspod/tc3_request\n{hashlib.sha256(canonical_request.encode()).hexdigest()}"
+        expected = Sign.sign_tc3("secret", "2023-11-14", "dnspod", string_to_sign)
+        authorization = dnspod_sign("id", "secret", "dnspod.tencentcloudapi.com", "DescribeRecordList", payload, 1700000000)
+        self.assertTrue(authorization.endswith(f"Signature={expected}"))
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_classify_code(self):
+        self.assertEqual(classify_code("Throttling.User"), THROTTLED)
+        self.assertEqual(classify_code("RequestLimitExceeded"), THROTTLED)
+        self.assertEqual(classify_code(None, 429), THROTTLED)
+        self.assertEqual(classify_code("InternalError"), TRANSIENT)
+        self.assertEqual(classify_code(None, 503), TRANSIENT)
+        self.assertEqual(classify_code("SignatureDoesNotMatch", 400), PERMANENT)
+        self.assertEqual(classify_code("InvalidParameter"), PERMANENT)
+
+    def test_asyncio_timeout_is_retried(self):
+        errors = [asyncio.TimeoutError(), asyncio.TimeoutError()]
+
+        async def send():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        self.assertEqual(classify(asyncio.TimeoutError()), TRANSIENT)
+        self.assertEqual(asyncio.run(RetryPolicy(retries=3, base=0.001).call_async(send)), "ok")
+        self.assertEqual(errors, [])
+
+
+class AsyncBackendTest:
+    """两个服务商共用的测试, 子类设置 provider"""
+
+    provider = None
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.server = serve_fake_api(self.client)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_with(self, test, secret_key="fake-key", retry=None):
+        async def run():
+            http = AsyncHttpClient(max_connections=10)
+            cloud = get_async_backend(self.provider)("fake-id", secret_key, endpoint=f"http://127.0.0.1:{self.server.server_port}/", http=http)
+            if retry is not None:
+                cloud.set_retry(retry)
+            try:
+                return await test(cloud)
+            finally:
+                await http.close()
+
+        return asyncio.run(run())
+
+    def add(self, domain, sub_domain, value, line="电信", count=1):
+        for index in range(count):
+            self.client.add_record(domain, Record(sub_domain, "A", value.format(index), self.client_line(line), 600, None, 0, 0))
+        self.client.calls.clear()
+
+    def client_line(self, line):
+        return line
+
+    def test_crud(self):
+        async def test(cloud):
+            first = await cloud.create_record("example.com", "www", "A", "1.1.1.1", line="电信", ttl=600)
+            await cloud.create_record("example.com", "www", "A", "2.2.2.2", line="联通", ttl=600)
+            await cloud.create_record("example.com", "www2", "A", "3.3.3.3", line="电信", ttl=600)
+            records = await cloud.get_record("example.com", sub_domain="www", record_type="A", line="电信")
+            self.assertIn("1.1.1.1", [record.value for record in records])
+            self.assertTrue(await cloud.change_record("example.com", "www", first, "A", "4.4.4.4", line="电信", ttl=600))
+            records = [record for record in await cloud.get_record("example.com", sub_domain="www", record_type="A", line="电信") if record.sub_domain == "www"]
+            self.assertEqual([(record.value, record.record_id) for record in records], [("4.4.4.4", first)])
+            self.assertTrue(await cloud.del_record(record_id=first, domain="example.com"))
+            remaining = await cloud.get_record("example.com", sub_domain="www", record_type="A")
+            self.assertEqual(sorted(record.value for record in remaining if record.sub_domain == "www"), ["2.2.2.2"])
+
+        self.run_with(test)
+        self.assertEqual(self.client.calls["add_record"], 3)
+        self.assertEqual(self.client.calls["update_record"], 1)
+        self.assertEqual(self.client.calls["delete_record"], 1)
+
+    def test_record_pagination(self):
+        self.add("example.com", "www", "10.0.0.{}", count=23)
+
+        async def test(cloud):
+            cloud.page_size = 5
+            return await cloud.get_record("example.com", sub_domain="www", record_type="A", line="电信")
+
+        records = self.run_with(test)
+        self.assertEqual(sorted(record.value for record in records), sorted(f"10.0.0.{index}" for index in range(23)))
+        self.assertEqual(self.client.calls["list_records"], 5)
+
+    def test_domain_pagination(self):
+        for index in range(250):
+            self.client._zones[f"zone{index}.example"]
+
+        async def test(cloud):
+            return await cloud.get_domain(), await cloud.domain_metadata()
+
+        domains, metadata = self.run_with(test)
+        self.assertEqual(len(domains), 250)
+        self.assertEqual(len(metadata), 250)
+        # get_domain 及 domain_metadata 各读取一次全部分页
+        self.assertEqual(self.client.calls["list_domains"], 2 * self.domain_pages)
+
+    def test_wrong_key(self):
+        async def test(cloud):
+            await cloud.get_domain()
+
+        with self.assertRaises(DnsApiError) as context:
+            self.run_with(test, secret_key="wrong-key")
+        self.assertEqual(context.exception.kind, PERMANENT)
+        self.assertEqual(self.client.calls["list_domains"], 0)
+
+    def test_retry_read(self):
+        self.add("example.com", "www", "10.0.0.{}", count=2)
+        inject(self.client, "list_records", [INTERNAL_ERROR, THROTTLING])
+
+        async def test(cloud):
+            return await cloud.get_record("example.com", sub_domain="www", record_type="A", line="电信")
+
+        records = self.run_with(test, retry=RetryPolicy(retries=3, base=0.001))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(self.client.calls["list_records"], 3)
+
+    def test_create_not_retried_after_transient_error(self):
+        inject(self.client, "add_record", [INTERNAL_ERROR])
+
+        async def test(cloud):
+            await cloud.create_record("example.com", "www", "A", "1.1.1.1", line="电信")
+
+        with self.assertRaises(DnsApiError) as context:
+            self.run_with(test, retry=RetryPolicy(retries=3, base=0.001))
+        self.assertEqual(context.exception.kind, TRANSIENT)
+        self.assertEqual(self.client.calls["add_record"], 1)
+
+    def test_create_retried_after_throttling(self):
+        inject(self.client, "add_record", [THROTTLING])
+
+        async def test(cloud):
+            return await cloud.create_record("example.com", "www", "A", "1.1.1.1", line="电信")
+
+        self.assertTrue(self.run_with(test, retry=RetryPolicy(retries=3, base=0.001)))
+        self.assertEqual(self.client.calls["add_record"], 2)
+
+    def test_retry_budget(self):
+        inject(self.client, "list_records", [INTERNAL_ERROR, INTERNAL_ERROR, INTERNAL_ERROR])
+
+        async def test(cloud):
+            await cloud.get_record("example.com", sub_domain="www")
+
+        with self.assertRaises(RetryBudgetExceeded):
+            self.run_with(test, retry=RetryPolicy(retries=5, base=0.001, budget=1))
+        self.assertEqual(self.client.calls["list_records"], 2)
+
+    def test_sub_domain_snapshot(self):
+        self.add("example.com", "www", "10.0.0.{}", count=2)
+        self.add("example.com", "www", "10.0.1.{}", line="联通", count=1)
+        self.add("example.com", "www2", "10.0.2.{}", count=1)
+
+        async def test(cloud):
+            snapshot = AsyncSubDomainSnapshot(cloud)
+            return await asyncio.gather(
+                snapshot.get_record("example.com", "www", "A", "电信"),
+                snapshot.get_record("example.com", "www", "A", "联通"),
+                snapshot.get_record("example.com", "www", "AAAA", "电信"),
+            )
+
+        telecom, unicom, v6 = self.run_with(test)
+        self.assertEqual(sorted(record.value for record in telecom), ["10.0.0.0", "10.0.0.1"])
+        self.assertEqual([record.value for record in unicom], ["10.0.1.0"])
+        self.assertEqual(v6, [])
+        self.assertEqual(self.client.calls["list_records"], 1)
+
+
+class AliyunTest(AsyncBackendTest, unittest.TestCase):
+    provider = "aliyun"
+    # 每页 100 个主域名
+    domain_pages = 3
+
+    def client_line(self, line):
+        from dns.lines import parse_line
+
+        return parse_line(line)
+
+
+class DnsPodTest(AsyncBackendTest, unittest.TestCase):
+    provider = "dnspod"
+    # 每页 3000 个主域名
+    domain_pages = 1
+
+
+class HttpClientTest(unittest.TestCase):
+    def test_keep_alive(self):
+        server = serve_fake_api(FakeClient())
+
+        async def run():
+            http = AsyncHttpClient(max_connections=4)
+            cloud = get_async_backend("dnspod")("fake-id", "fake-key", endpoint=f"http://127.0.0.1:{server.server_port}/", http=http)
+            try:
+                for _ in range(5):
+                    await cloud.get_domain()
+                return sum(len(connections) for connections in http._idle.values())
+            finally:
+                await http.close()
+
+        try:
+            # 顺序执行的请求复用同一个连接
+            self.assertEqual(asyncio.run(run()), 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+    def drop_second_request(self, idempotent: bool) -> tuple:
+        """每个连接上的第一个请求正常返回, 读取完第二个请求后不返回响应直接断开, 返回 (第二次请求的结果, 服务端收到的请求)"""
+        received = []
+
+        async def handle(reader, writer):
+            for index in range(2):
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(next(line for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")).split(b":")[1])
+                received.append(head.split(b" ")[1] + b" " + await reader.readexactly(length))
+                if index == 0:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                    await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+            http = AsyncHttpClient(max_connections=1)
+            try:
+                await http.request("POST", f"{url}/DescribeDomainList", body=b"{}")
+                try:
+                    return (await http.request("POST", f"{url}/CreateRecord", body=b"{}", idempotent=idempotent)).body, received
+                except ConnectionError as e:
+                    return e, received
+            finally:
+                await http.close()
+                server.close()
+                await server.wait_closed()
+
+        return asyncio.run(run())
+
+    def test_resend_on_stale_connection(self):
+        result, received = self.drop_second_request(idempotent=True)
+        self.assertEqual(result, b"ok")
+        self.assertEqual(received, [b"/DescribeDomainList {}", b"/CreateRecord {}", b"/CreateRecord {}"])
+
+    def test_no_resend_after_create_was_read(self):
+        # 服务端已经读取了创建请求, 换新连接重发可能重复创建记录
+        result, received = self.drop_second_request(idempotent=False)
+        self.assertIsInstance(result, ConnectionError)
+        self.assertEqual(received, [b"/DescribeDomainList {}", b"/CreateRecord {}"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""DnsPodApi.apply_batch 测试, 用记录请求参数的替身代替腾讯云 SDK 客户端"""
+import os
+import json
+import sqlite3
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from dns.dnspod import DnsPodApi
+from dns.plan import CREATE, UPDATE, Change
+from dns.state import RecordStore
+
+
+class StubClient:
+    """按 RecordId 保存记录, ModifyRecordBatch 同步完成并在 DescribeBatchTask 中返回结果"""
+
+    def __init__(self, records):
+        self.records = records
+        self.calls = []
+        self._jobs = {}
+
+    def _params(self, name, req):
+        params = json.loads(req.to_json_string())
+        self.calls.append((name, params))
+        return params
+
+    def ModifyRecord(self, req):
+        params = self._params("ModifyRecord", req)
+        self.records[params["RecordId"]].update(value=params["Value"], ttl=params["TTL"])
+        return SimpleNamespace(RecordId=params["RecordId"])
+
+    def ModifyRecordBatch(self, req):
+        params = self._params("ModifyRecordBatch", req)
+        for record_id in params["RecordIdList"]:
+            self.records[record_id][params["Change"]] = params["ChangeTo"]
+        job_id = len(self._jobs) + 1
+        self._jobs[job_id] = [SimpleNamespace(RecordId=record_id, Status="success", ErrMsg="") for record_id in params["RecordIdList"]]
+        return SimpleNamespace(JobId=job_id)
+
+    def DescribeBatchTask(self, req):
+        params = self._params("DescribeBatchTask", req)
+        return SimpleNamespace(DetailList=[SimpleNamespace(RecordList=self._jobs[params["JobId"]])])
+
+
+class ApplyBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.cloud = DnsPodApi("id", "key")
+        self.cloud.verify_line = lambda domain, line: None
+        self.client = self.cloud._client = StubClient({1: {"value": "1.1.1.1", "ttl": 600}, 2: {"value": "1.1.1.2", "ttl": 600}})
+
+    def update(self, record_id, value, ttl, old_ttl=600):
+        return Change(UPDATE, "example.com", "www", "A", "默认", value, record_id, self.client.records[record_id]["value"], ttl, old_ttl)
+
+    def test_value_only_changes_are_batched(self):
+        changes = [self.update(1, "2.2.2.2", 600), self.update(2, "2.2.2.2", None)]
+        self.assertEqual(self.cloud.apply_batch(changes), [True, True])
+        self.assertEqual([name for name, _ in self.client.calls if name.startswith("Modify")], ["ModifyRecordBatch"])
+        self.assertEqual(self.client.records[1], {"value": "2.2.2.2", "ttl": 600})
+
+    def test_ttl_change_reaches_backend(self):
+        changes = [self.update(1, "2.2.2.2", 120), self.update(2, "2.2.2.2", 600)]
+        self.assertEqual(self.cloud.apply_batch(changes), [1, True])
+        self.assertEqual(self.client.records, {1: {"value": "2.2.2.2", "ttl": 120}, 2: {"value": "2.2.2.2", "ttl": 600}})
+        modify = [(name, params.get("TTL")) for name, params in self.client.calls if name.startswith("Modify")]
+        self.assertEqual(sorted(modify), [("ModifyRecord", 120), ("ModifyRecordBatch", None)])
+
+
+class RecordStoreTest(unittest.TestCase):
+    def test_update_without_ttl_keeps_stored_ttl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state.db")
+            store = RecordStore(path, DnsPodApi("id", "key"))
+            try:
+                store.apply(Change(CREATE, "example.com", "www", "A", "默认", "1.1.1.1", None, None, 600), 1)
+                store.apply(Change(UPDATE, "example.com", "www", "A", "默认", "2.2.2.2", 1, "1.1.1.1", None, 600), True)
+            finally:
+                store.close()
+            with sqlite3.connect(path) as conn:
+                self.assertEqual(conn.execute("SELECT value, ttl FROM records").fetchall(), [("2.2.2.2", 600)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+"""probe 模块测试, 在 127.0.0.x 上启动本地 TCP / TLS 服务代替 Cloudflare 节点
+
+同一端口绑定在不同的回环地址上, 每个地址模拟一个候选 IP; 没有监听的地址模拟连接失败的 IP。
+"""
+import os
+import ssl
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import unittest
+
+from probe import Probe, https_download, probe_ips, rank_ips, tcp_ping
+
+FAST, SLOW, HANG, DOWN = "127.0.0.1", "127.0.0.2", "127.0.0.3", "127.0.0.4"
+
+
+def listen(ips):
+    """在 ips 的同一个随机端口上监听, 返回 (端口, {ip: socket})"""
+    for _ in range(20):
+        first = socket.create_server((ips[0], 0))
+        port = first.getsockname()[1]
+        sockets = {ips[0]: first}
+        try:
+            for ip in ips[1:]:
+                sockets[ip] = socket.create_server((ip, port))
+            return port, sockets
+        except OSError:
+            for sock in sockets.values():
+                sock.close()
+    raise OSError("没有可用的端口")
+
+
+def self_signed_context(directory: str) -> ssl.SSLContext:
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True,
+        capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+class LocalServers:
+    """FAST: 立即返回 256KB; SLOW: 分 8 次返回 32KB, 每次间隔 50ms; HANG: 接受连接后不做任何响应; DOWN: 不监听"""
+
+    body = 256 * 1024
+
+    def __init__(self, context: ssl.SSLContext):
+        self.port, self._sockets = listen([FAST, SLOW, HANG])
+        self._context = context
+        self._held = []
+        self._closed = threading.Event()
+        for ip, sock in self._sockets.items():
+            threading.Thread(target=self._accept, args=(ip, sock), daemon=True).start()
+
+    def _accept(self, ip, sock):
+        while not self._closed.is_set():
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            if ip == HANG:
+                self._held.append(conn)
+                continue
+            threading.Thread(target=self._serve, args=(ip, conn), daemon=True).start()
+
+    def _serve(self, ip, conn):
+        try:
+            with self._context.wrap_socket(conn, server_side=True) as tls:
+                request = b""
+                while b"\r\n\r\n" not in request:
+                    chunk = tls.recv(4096)
+                    if not chunk:
+                        return
+                    request += chunk
+                if ip == FAST:
+                    tls.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % self.body + b"x" * self.body)
+                    return
+                tls.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % (32 * 1024))
+                for _ in range(8):
+                    time.sleep(0.05)
+                    tls.sendall(b"x" * 4096)
+        except (OSError, ssl.SSLError):
+            # 客户端读够 max_bytes 或探测超时后会直接断开连接
+            pass
+
+    def close(self):
+        self._closed.set()
+        for sock in [*self._sockets.values(), *self._held]:
+            sock.close()
+
+
+@unittest.skipUnless(shutil.which("openssl"), "需要 openssl 命令生成自签名证书")
+class ProbeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.servers = LocalServers(self_signed_context(cls._tmp.name))
+        cls.port = cls.servers.port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servers.close()
+        cls._tmp.cleanup()
+
+    def options(self, **kwargs):
+        return {"port": self.port, "count": 2, "timeout": 1.0, "host": "localhost", "max_bytes": 64 * 1024, "verify": False, **kwargs}
+
+    def test_tcp_ping(self):
+        self.assertIsNotNone(tcp_ping(FAST, self.port))
+        self.assertIsNone(tcp_ping(DOWN, self.port, timeout=0.5))
+
+    def test_https_download(self):
+        fast = https_download(FAST, "localhost", port=self.port, max_bytes=64 * 1024, verify=False)
+        slow = https_download(SLOW, "localhost", port=self.port, max_bytes=64 * 1024, verify=False)
+        self.assertGreater(fast, slow)
+        # 自签名证书校验失败
+        self.assertIsNone(https_download(FAST, "localhost", port=self.port, timeout=1.0))
+
+    def test_https_download_timeout(self):
+        start = time.monotonic()
+        self.assertIsNone(https_download(HANG, "localhost", port=self.port, timeout=0.3, verify=False))
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_rank_by_throughput(self):
+        probes = probe_ips([DOWN, SLOW, FAST], concurrency=4, deadline=10, **self.options())
+        self.assertEqual(set(probes), {FAST, SLOW, DOWN})
+        self.assertEqual(probes[DOWN], Probe(DOWN, None, 1.0, None))
+        self.assertEqual(probes[FAST].loss, 0)
+        self.assertEqual(rank_ips([DOWN, SLOW, FAST], probes), [FAST, SLOW])
+
+    def test_deadline(self):
+        start = time.monotonic()
+        probes = probe_ips([HANG, FAST], concurrency=2, deadline=1.0, **self.options())
+        self.assertLess(time.monotonic() - start, 3)
+        # TCP 握手成功但 HTTPS 请求没有响应, 超过 deadline 后视为失败
+        self.assertEqual(probes[HANG], Probe(HANG, None, 1.0, None))
+        self.assertIsNotNone(probes[FAST].throughput)
+        self.assertEqual(rank_ips([HANG, FAST], probes), [FAST])
+
+    def test_tcp_only(self):
+        probes = probe_ips([FAST, DOWN], **self.options(host=None))
+        self.assertIsNone(probes[FAST].throughput)
+        self.assertIsNotNone(probes[FAST].latency)
+        self.assertEqual(rank_ips([DOWN, FAST], probes), [FAST])
+
+
+class RankTest(unittest.TestCase):
+    def test_order(self):
+        probes = {
+            "a": Probe("a", 50.0, 0.0, None),
+            "b": Probe("b", 20.0, 0.0, None),
+            "c": Probe("c", 15.0, 0.5, None),
+            "d": Probe("d", 80.0, 0.0, 1000.0),
+            "e": Probe("e", None, 1.0, None),
+        }
+        # 下载速度优先, 其次按丢包加权后的延迟: c = 15 * 1.5 > b = 20
+        self.assertEqual(rank_ips(["a", "b", "c", "d", "e", "missing"], probes), ["d", "b", "c", "a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""shard.Lease 测试, 两个 Lease 对象模拟两个进程争用同一个租约文件"""
+import os
+import time
+import tempfile
+import unittest
+
+import shard
+from shard import Lease
+
+
+class LeaseTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+
+    def lease(self, owner, ttl=60):
+        return Lease(self._tmp.name, "example.com|0/1", ttl=ttl, owner=owner)
+
+    def test_exclusive(self):
+        first, second = self.lease("a"), self.lease("b")
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertEqual(second.holder(), "a")
+        first.release()
+        self.assertTrue(second.acquire())
+
+    def test_takeover_after_expiry(self):
+        first, second = self.lease("a", ttl=0.1), self.lease("b")
+        self.assertTrue(first.acquire())
+        time.sleep(0.2)
+        self.assertTrue(second.acquire())
+        # 原持有者不能续期, 也不能删除已被接管的租约
+        self.assertFalse(first.renew())
+        with self.assertRaises(RuntimeError):
+            first.keep()
+        first.release()
+        self.assertEqual(second.holder(), "b")
+        self.assertTrue(second.renew())
+
+    def test_keep_renews(self):
+        first, second = self.lease("a", ttl=0.3), self.lease("b")
+        self.assertTrue(first.acquire())
+        for _ in range(4):
+            time.sleep(0.15)
+            first.keep()
+        self.assertFalse(second.acquire())
+
+    def test_stale_guard(self):
+        first = self.lease("a")
+        guard = f"{first.filename}.guard"
+        open(guard, "w").close()
+        past = time.time() - shard.GUARD_STALE - 1
+        os.utime(guard, (past, past))
+        self.assertTrue(first.acquire())
+        self.assertFalse(os.path.exists(guard))
+
+
+if __name__ == "__main__":
+    unittest.main()